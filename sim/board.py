@@ -0,0 +1,103 @@
+"""!
+@file board.py
+
+@brief The simulated Nucleo board and what is wired to it.
+
+@details
+One Board holds the virtual clock and the hardware models, and the stand-in
+@c pyb, @c machine and @c utime modules all work on it. The wiring matches
+the turret:
+
+- timer 5 channels 1 and 2 drive the pan motor forwards and backwards, and
+  set the duty cycle of the DC motor model;
+- timer 8 counts the pan encoder, whose counter follows the motor model;
+- timer 4 channel 1 drives the trigger servo; each push past the firing
+  angle is logged as a shot;
+- I2C bus 1 has the MLX90640 at address 0x33.
+
+@author Conor Schott, Fermin Moreno, Berent Baysal
+"""
+
+from clock import VirtualClock
+from plant import DCMotor
+from camera import VirtualMLX90640, Scene, ADDRESS
+
+## Timer driving the pan motor
+MOTOR_TIMER = 5
+## Timer counting the pan encoder
+ENCODER_TIMER = 8
+## Timer driving the trigger servo
+SERVO_TIMER = 4
+## Servo pulse width in microseconds above which the trigger counts as pulled
+FIRE_PULSE = 1500
+
+
+class Board:
+    """!
+    Virtual time, the hardware models, and the peripherals set up so far.
+    """
+
+    def __init__(self, scene=None, seed=405, motor=None):
+        """!
+        @param scene: Scene the camera looks at; a default Scene if None.
+        @param seed: Seed for the camera's calibration data and noise.
+        @param motor: DCMotor model of the pan axis; a default one if None.
+        """
+        self.clock = VirtualClock()
+        self.motor = DCMotor() if motor is None else motor
+        self.clock.add_model(self.motor)
+        self.camera = VirtualMLX90640(self.clock, Scene() if scene is None else scene, seed)
+        ## Devices on each I2C bus, by address
+        self.i2c_devices = {1: {ADDRESS: self.camera}}
+        ## Timers set up so far, by number
+        self.timers = {}
+        ## Pin levels, by pin name
+        self.pins = {}
+        ## Time in microseconds and pan position in counts of each shot
+        self.shots = []
+        self._trigger = False
+
+    def channel_changed(self, timer_id, channel):
+        """!
+        Pass a new PWM setting on to whatever the channel drives.
+        """
+        if timer_id == MOTOR_TIMER:
+            timer = self.timers[timer_id]
+            self.motor.duty = timer.percent(1) - timer.percent(2)
+        elif timer_id == SERVO_TIMER and channel.channel_id == 1:
+            pulled = channel.width > FIRE_PULSE
+            if pulled and not self._trigger:
+                self.shots.append((self.clock.now_us, self.motor.position))
+            self._trigger = pulled
+
+    def counter(self, timer_id):
+        """!
+        Counter of a timer which is wired to an encoder, or None.
+        """
+        if timer_id == ENCODER_TIMER:
+            self.motor.update(self.clock.now_us)
+            return self.motor.counter()
+        return None
+
+
+_board = None
+
+
+def get_board():
+    """!
+    The board the stand-in modules use, made the first time it is needed.
+    """
+    global _board
+    if _board is None:
+        _board = Board()
+    return _board
+
+
+def set_board(board):
+    """!
+    Use a particular board, e.g. with a different scene. Must be called
+    before the program sets up any peripherals.
+    """
+    global _board
+    _board = board
+    return board
@@ -0,0 +1,396 @@
+"""!
+@file camera.py
+
+@brief Virtual MLX90640 thermal camera on the simulated I2C bus.
+
+@details
+The device holds the camera's three memory areas as 16 bit words:
+
+- an EEPROM image at 0x2400, filled with plausible calibration parameters
+  (taken from the worked example in the datasheet) and small per-pixel
+  variations, including one pixel flagged as an outlier. Words which hold
+  two byte-wide parameters are laid out as the datasheet gives them, first
+  parameter in the high byte, and their two bytes differ, so a driver
+  which reads them the wrong way round gets the wrong calibration;
+- the RAM at 0x0400, with the 768 pixels and the auxiliary words (ambient
+  temperature, gain, supply voltage) at 0x0700;
+- the status and control registers at 0x8000.
+
+A new subpage is measured every refresh period set in the control register.
+Its pixels are worked out from a Scene by inverting the datasheet's object
+temperature calculation, so a calibrated image reads back close to the
+scene's temperatures, and raw images have the right offsets and gains. The
+status register's data available flag and last subpage number are updated
+as the real camera does; clearing the flag is up to the driver.
+
+@author Conor Schott, Fermin Moreno, Berent Baysal
+"""
+
+import random
+
+## I2C address of the camera
+ADDRESS = 0x33
+
+EEPROM_ADDRESS = 0x2400
+EEPROM_WORDS = 0x340
+RAM_ADDRESS = 0x0400
+RAM_WORDS = 0x340
+STATUS_REG = 0x8000
+CONTROL_REG = 0x800D
+I2C_CONFIG_REG = 0x800F
+I2C_ADDRESS_REG = 0x8010
+
+NUM_ROWS = 24
+NUM_COLS = 32
+TEMP_K = 273.15
+
+## Subpage rates selected by the control register's refresh rate field, Hz
+REFRESH_HZ = (0.5, 1, 2, 4, 8, 16, 32, 64)
+
+# Calibration parameters written to the EEPROM
+K_PTAT = 4              # alpha_ptat = 9
+PTAT_25 = 12273
+KV_KT_PTAT = 0x5952     # kv_ptat 22, kt_ptat 338
+VDD_WORD = 0x9D68       # k_vdd -99 in the high byte, vdd_25 104 in the low byte
+GAIN = 6383
+PIX_OS_AVERAGE = -66
+OCC_SCALES = (2, 1, 0)  # row, column, remainder shifts
+ALPHA_SCALE = 7         # alpha = word / 2**(ALPHA_SCALE + 30)
+ACC_SCALES = (4, 4, 3)
+PIX_SENSITIVITY_AVERAGE = 11805
+RES_CTRL_CAL = 2
+KSTA = -16              # / 8192, in the high byte of its word
+TGC = 0                 # / 32, in the low byte
+KSTO_SCALE = 9          # ksto = byte / 2**(KSTO_SCALE + 8)
+KSTO2 = -105
+KSTO = (-108, KSTO2, -102, -114)   # ksto 1 to 4, only ksto 2 is modelled
+
+# Auxiliary RAM words giving Ta = 25 C and Vdd = 3.3 V
+TA_PTAT = 1500
+TA_VBE = 18539
+VDD_PIX = -13056
+CP_SP = (-60, -58)
+
+## Reading of a pixel flagged as an outlier, which is stuck hot
+STUCK_VALUE = 1000
+
+## Default control register: chess pattern, 18 bit ADC, 2 Hz, subpages on
+CONTROL_DEFAULT = 0x1901
+
+
+def _signed(value, bits):
+    """!
+    Encode a signed value in a field of a given width.
+    """
+    return value & ((1 << bits) - 1)
+
+
+def _nibble_words(values):
+    """!
+    Pack 4 bit signed values into words, four to a word, lowest first.
+    """
+    words = []
+    for start in range(0, len(values), 4):
+        word = 0
+        for shift, value in enumerate(values[start:start + 4]):
+            word |= _signed(value, 4) << (4 * shift)
+        words.append(word)
+    return words
+
+
+class Target:
+    """!
+    A warm object in the scene, seen as a soft-edged rectangle.
+    """
+
+    def __init__(self, col=20.0, row=11.0, temp=34.0, width=3.0, height=8.0, speed=0.0):
+        """!
+        @param col: Column of the centre of the target.
+        @param row: Row of the centre of the target.
+        @param temp: Surface temperature in degrees C.
+        @param width: Width in pixels.
+        @param height: Height in pixels.
+        @param speed: Sideways speed in columns per second.
+        """
+        self.col = col
+        self.row = row
+        self.temp = temp
+        self.width = width
+        self.height = height
+        self.speed = speed
+
+    def col_at(self, t_s):
+        """!
+        Column of the centre of the target at a time.
+        """
+        return self.col + self.speed * t_s
+
+    def coverage(self, row, col, t_s):
+        """!
+        Fraction of a pixel covered by the target, from 0 to 1.
+        """
+        d_col = abs(col - self.col_at(t_s)) - self.width / 2
+        d_row = abs(row - self.row) - self.height / 2
+        return min(1.0, max(0.0, 0.5 - d_col)) * min(1.0, max(0.0, 0.5 - d_row))
+
+
+class Scene:
+    """!
+    What the camera sees: a uniform background and some targets.
+    """
+
+    def __init__(self, ambient=22.0, targets=None):
+        """!
+        @param ambient: Background temperature in degrees C.
+        @param targets: List of Target objects; by default one person
+               standing still right of centre.
+        """
+        self.ambient = ambient
+        self.targets = [Target()] if targets is None else targets
+
+    def temperature(self, row, col, t_s):
+        """!
+        Temperature seen by a pixel at a time, in degrees C.
+        """
+        temp = self.ambient
+        for target in self.targets:
+            cover = target.coverage(row, col, t_s)
+            if cover:
+                temp += (target.temp - temp) * cover
+        return temp
+
+
+class VirtualMLX90640:
+    """!
+    Register level model of an MLX90640.
+    """
+
+    def __init__(self, clock, scene=None, seed=405, noise=1.5, outliers=(100,)):
+        """!
+        @param clock: The simulation's VirtualClock.
+        @param scene: Scene to look at; a default Scene if None.
+        @param seed: Seed for the per-pixel variations and noise.
+        @param noise: Standard deviation of the pixel noise in ADC counts.
+        @param outliers: Pixels flagged as outliers in the EEPROM, which read
+               a fixed bad value.
+        """
+        self.clock = clock
+        self.scene = Scene() if scene is None else scene
+        self.noise = noise
+        self.outliers = tuple(outliers)
+        self._rng = random.Random(seed)
+        self.eeprom = [0] * EEPROM_WORDS
+        self.ram = [0] * RAM_WORDS
+        self.status = 0x0000
+        self.control = CONTROL_DEFAULT
+        self.i2c_config = 0x0000
+        self.i2c_address = 0xBE00 | ADDRESS
+        ## Number of subpages measured so far
+        self.subpages = 0
+        self._start_us = clock.now_us
+        self._build_eeprom()
+        self._set_aux()
+
+    # -- EEPROM ----------------------------------------------------------
+
+    def _ee(self, address, value):
+        self.eeprom[address - EEPROM_ADDRESS] = value & 0xFFFF
+
+    def _build_eeprom(self):
+        """!
+        Fill the EEPROM image and work out each pixel's offset and
+        sensitivity from it, as the driver will.
+        """
+        rng = self._rng
+        for offset, word in enumerate((0x00AE, 0x499A, 0x0000, 0x2061, 0x0005, 0x0320,
+                                       0x03E0, 0x1710, 0xA224, 0x0185, 0x0499, 0x0000,
+                                       CONTROL_DEFAULT, 0x0000, 0x0000, 0xBE00 | ADDRESS)):
+            self._ee(0x2400 + offset, word)
+
+        occ_row, occ_col, occ_rem = OCC_SCALES
+        self._ee(0x2410, K_PTAT << 12 | occ_row << 8 | occ_col << 4 | occ_rem)
+        self._ee(0x2411, PIX_OS_AVERAGE)
+        occ_rows = [rng.randint(-3, 3) for _ in range(NUM_ROWS)]
+        occ_cols = [rng.randint(-3, 3) for _ in range(NUM_COLS)]
+        for offset, word in enumerate(_nibble_words(occ_rows) + _nibble_words(occ_cols)):
+            self._ee(0x2412 + offset, word)
+
+        acc_row, acc_col, acc_rem = ACC_SCALES
+        self._ee(0x2420, ALPHA_SCALE << 12 | acc_row << 8 | acc_col << 4 | acc_rem)
+        self._ee(0x2421, PIX_SENSITIVITY_AVERAGE)
+        acc_rows = [rng.randint(-3, 3) for _ in range(NUM_ROWS)]
+        acc_cols = [rng.randint(-3, 3) for _ in range(NUM_COLS)]
+        for offset, word in enumerate(_nibble_words(acc_rows) + _nibble_words(acc_cols)):
+            self._ee(0x2422 + offset, word)
+
+        self._ee(0x2430, GAIN)
+        self._ee(0x2431, PTAT_25)
+        self._ee(0x2432, KV_KT_PTAT)
+        self._ee(0x2433, VDD_WORD)
+        self._ee(0x2434, 0x5454)        # kv averages 5/8 and 4/8
+        self._ee(0x2435, 0x0000)        # no interleave corrections
+        self._ee(0x2436, 0x5354)        # kta averages: RoCo, ReCo
+        self._ee(0x2437, 0x5B56)        # RoCe, ReCe
+        self._ee(0x2438, RES_CTRL_CAL << 12 | 3 << 8 | 6 << 4 | 3)
+        self._ee(0x2439, _signed(1, 6) << 10 | 0x1A0)
+        self._ee(0x243A, _signed(2, 6) << 10 | _signed(CP_SP[0], 10))
+        self._ee(0x243B, 0x0AF6)        # kv_cp 10, kta_cp -10
+        self._ee(0x243C, _signed(KSTA, 8) << 8 | _signed(TGC, 8))
+        self._ee(0x243D, _signed(KSTO[1], 8) << 8 | _signed(KSTO[0], 8))
+        self._ee(0x243E, _signed(KSTO[3], 8) << 8 | _signed(KSTO[2], 8))
+        self._ee(0x243F, 2 << 12 | 8 << 8 | 8 << 4 | KSTO_SCALE)
+
+        ## Offset of each pixel at 25 C and 3.3 V, in ADC counts
+        self.os_ref = []
+        ## Sensitivity of each pixel
+        self.alpha = []
+        alpha_div = 2.0 ** (ALPHA_SCALE + 30)
+        for idx in range(NUM_ROWS * NUM_COLS):
+            row, col = divmod(idx, NUM_COLS)
+            while True:
+                offset = rng.randint(-10, 10)
+                alpha = rng.randint(-8, 8)
+                kta = rng.randint(-2, 2)
+                word = (_signed(offset, 6) << 10 | _signed(alpha, 6) << 4
+                        | _signed(kta, 3) << 1 | (idx in self.outliers))
+                if word:
+                    break
+            self._ee(0x2440 + idx, word)
+            self.os_ref.append(PIX_OS_AVERAGE + (occ_rows[row] << occ_row)
+                               + (occ_cols[col] << occ_col) + (offset << occ_rem))
+            self.alpha.append((PIX_SENSITIVITY_AVERAGE + (acc_rows[row] << acc_row)
+                               + (acc_cols[col] << acc_col) + (alpha << acc_rem)) / alpha_div)
+
+    # -- RAM -------------------------------------------------------------
+
+    def _ram(self, address, value):
+        self.ram[address - RAM_ADDRESS] = value & 0xFFFF
+
+    def _set_aux(self):
+        """!
+        Fill the auxiliary RAM words.
+        """
+        self._ram(0x0700, TA_VBE)
+        self._ram(0x0708, CP_SP[0])
+        self._ram(0x070A, GAIN)
+        self._ram(0x0720, TA_PTAT)
+        self._ram(0x0728, CP_SP[1])
+        self._ram(0x072A, VDD_PIX)
+
+    @property
+    def period_us(self):
+        """!
+        Time between subpages, from the refresh rate in the control register.
+        """
+        return int(1000000 / REFRESH_HZ[(self.control >> 7) & 0x7])
+
+    def _raw_pixel(self, idx, temp):
+        """!
+        Raw reading of a pixel looking at a temperature, inverting the
+        datasheet calculation at Ta = 25 C and Vdd = 3.3 V.
+        """
+        if idx in self.outliers:
+            return STUCK_VALUE
+        alpha = self.alpha[idx]
+        ksto2 = KSTO2 / 2.0 ** (KSTO_SCALE + 8)
+        ta_r = (25 + TEMP_K) ** 4
+        t_r = (temp + TEMP_K) ** 4 - ta_r
+        # v_ir = t_r * (alpha * (1 - ksto2 * TEMP_K) + s_x), where s_x
+        # depends on v_ir; a few rounds of substitution converge
+        v_ir = alpha * t_r
+        for _ in range(3):
+            s_x = ksto2 * (alpha ** 3 * (v_ir + alpha * ta_r)) ** 0.25
+            v_ir = t_r * (alpha * (1 - ksto2 * TEMP_K) + s_x)
+        raw = self.os_ref[idx] + v_ir + self._rng.gauss(0, self.noise)
+        return max(-32768, min(32767, int(round(raw))))
+
+    def _measure(self, sp_id, t_s):
+        """!
+        Measure one subpage into RAM and flag it in the status register.
+        """
+        chess = (self.control >> 12) & 1
+        scene = self.scene
+        for idx in range(NUM_ROWS * NUM_COLS):
+            row, col = divmod(idx, NUM_COLS)
+            sp = (row & 1) ^ (col & 1) if chess else row & 1
+            if sp == sp_id:
+                self.ram[idx] = self._raw_pixel(idx, scene.temperature(row, col, t_s)) & 0xFFFF
+        self.status = (self.status & ~0x0007) | 0x0008 | sp_id
+        self.subpages += 1
+
+    def update(self, now_us):
+        """!
+        Measure any subpages which have finished by a time.
+        """
+        period = self.period_us
+        due = (now_us - self._start_us) // period
+        if due <= self.subpages:
+            return
+        if due - self.subpages > 2:
+            # only the last two can still be seen
+            self.subpages = due - 2
+        while self.subpages < due:
+            # with subpage mode off only subpage 0 is measured
+            sp_id = self.subpages & 1 if self.control & 0x0001 else 0
+            self._measure(sp_id, (self._start_us + (self.subpages + 1) * period) / 1000000)
+
+    # -- I2C -------------------------------------------------------------
+
+    def read_word(self, address):
+        """!
+        Read one 16 bit word at a word address.
+        """
+        if EEPROM_ADDRESS <= address < EEPROM_ADDRESS + EEPROM_WORDS:
+            return self.eeprom[address - EEPROM_ADDRESS]
+        if RAM_ADDRESS <= address < RAM_ADDRESS + RAM_WORDS:
+            self.update(self.clock.now_us)
+            return self.ram[address - RAM_ADDRESS]
+        if address == STATUS_REG:
+            self.update(self.clock.now_us)
+            return self.status
+        if address == CONTROL_REG:
+            return self.control
+        if address == I2C_CONFIG_REG:
+            return self.i2c_config
+        if address == I2C_ADDRESS_REG:
+            return self.i2c_address
+        return 0
+
+    def write_word(self, address, value):
+        """!
+        Write one 16 bit word at a word address. The EEPROM and RAM are read
+        only here.
+        """
+        if address == STATUS_REG:
+            self.update(self.clock.now_us)
+            # data available and overwrite enable can be written
+            self.status = (self.status & 0x0007) | (value & 0x0018)
+        elif address == CONTROL_REG:
+            if (value ^ self.control) & 0x0380:
+                # a new refresh rate starts a new measurement
+                self.update(self.clock.now_us)
+                self._start_us = self.clock.now_us
+                self.subpages = 0
+            self.control = value & 0xFFFF
+        elif address == I2C_CONFIG_REG:
+            self.i2c_config = value & 0xFFFF
+        elif address == I2C_ADDRESS_REG:
+            self.i2c_address = value & 0xFFFF
+
+    def read(self, address, nbytes):
+        """!
+        Read big-endian words starting at a word address.
+        """
+        data = bytearray(nbytes)
+        for offset in range(0, nbytes - 1, 2):
+            word = self.read_word(address + offset // 2)
+            data[offset] = word >> 8
+            data[offset + 1] = word & 0xFF
+        return data
+
+    def write(self, address, data):
+        """!
+        Write big-endian words starting at a word address.
+        """
+        for offset in range(0, len(data) - 1, 2):
+            self.write_word(address + offset // 2, data[offset] << 8 | data[offset + 1])
@@ -0,0 +1,179 @@
+"""!
+@file clock.py
+
+@brief Virtual time for the host simulator.
+
+@details
+Nothing in the simulator waits for real time. The clock only moves forward
+when the program sleeps, talks to a peripheral, or reads the time; each read
+costs a couple of microseconds, so busy-wait loops still make progress.
+Computation takes no time unless a CPU scale is given, in which case the
+host's own run time, multiplied by the scale, is added to the clock as well;
+this makes timings roughly comparable with the board's, at the cost of
+repeatability.
+
+Timers with a callback are kept as periodic events. When the clock moves
+past one, the models of the hardware are brought up to that moment, the
+callback runs as if it were an interrupt, and any functions handed to
+@c micropython.schedule() run straight after it. Time stands still while a
+callback runs.
+
+@author Conor Schott, Fermin Moreno, Berent Baysal
+"""
+
+import heapq
+import time
+
+## Period of the MicroPython ticks counters
+TICKS_PERIOD = 1 << 30
+
+## Number of entries micropython.schedule() can queue, as on the Pyboard
+SCHEDULE_DEPTH = 8
+
+
+class SimulationTimeout(KeyboardInterrupt):
+    """!
+    Raised when the virtual time limit is reached. It is a KeyboardInterrupt
+    so that scripts which stop cleanly on Ctrl-C stop cleanly here too.
+    """
+
+
+class VirtualClock:
+    """!
+    Virtual microsecond clock with periodic timer events.
+    """
+
+    def __init__(self, read_cost_us=2, step_us=1000, cpu_scale=0):
+        """!
+        Start the clock at zero.
+        @param read_cost_us: Time each read of the clock takes.
+        @param step_us: Longest step the hardware models are advanced by at
+               once.
+        @param cpu_scale: How many times slower the board is than the host,
+               or 0 for computation to take no time.
+        """
+        ## Time since the simulation started, in microseconds
+        self.now_us = 0
+        self.read_cost_us = read_cost_us
+        self.step_us = step_us
+        ## Time at which SimulationTimeout is raised, or None
+        self.deadline_us = None
+        self._events = []
+        self._seq = 0
+        self._queue = []
+        self._busy = False
+        self._models = []
+        self.cpu_scale = cpu_scale
+        self._wall = time.perf_counter()
+
+    def add_model(self, model):
+        """!
+        Add a hardware model, whose @c update(now_us) is called as time
+        moves on.
+        """
+        self._models.append(model)
+
+    def _update_models(self, until_us):
+        """!
+        Bring the hardware models up to a time, in steps of at most
+        @c step_us.
+        """
+        now = self.now_us
+        while now < until_us:
+            now = min(now + self.step_us, until_us)
+            for model in self._models:
+                model.update(now)
+        self.now_us = until_us
+
+    def add_periodic(self, handler, period_us, start_us=None):
+        """!
+        Call a handler every period, until it is cancelled.
+        @param handler: Function called with no arguments.
+        @param period_us: Period in microseconds, at least 1.
+        @param start_us: Time of the first call, by default one period from
+               now.
+        @return: Handle for @c cancel().
+        """
+        period_us = max(1, int(period_us))
+        due = self.now_us + period_us if start_us is None else start_us
+        event = [due, period_us, handler, True]
+        self._push(event)
+        return event
+
+    def _push(self, event):
+        self._seq += 1
+        heapq.heappush(self._events, (event[0], self._seq, event))
+
+    @staticmethod
+    def cancel(event):
+        """!
+        Stop a periodic handler.
+        """
+        if event is not None:
+            event[3] = False
+
+    def schedule(self, func, arg):
+        """!
+        Queue a function to run after the current interrupt, as
+        @c micropython.schedule() does.
+        """
+        if len(self._queue) >= SCHEDULE_DEPTH:
+            raise RuntimeError('schedule queue full')
+        self._queue.append((func, arg))
+        if not self._busy:
+            self._run_queue()
+
+    def _run_queue(self):
+        busy = self._busy
+        self._busy = True
+        try:
+            while self._queue:
+                func, arg = self._queue.pop(0)
+                func(arg)
+        finally:
+            self._busy = busy
+
+    def advance(self, us):
+        """!
+        Move time forward, running every timer event which falls due.
+        @param us: Time to move forward by, in microseconds.
+        """
+        if self._busy:
+            # time stands still inside a callback
+            return
+        us = max(0, int(us))
+        if self.cpu_scale:
+            wall = time.perf_counter()
+            us += int((wall - self._wall) * 1000000 * self.cpu_scale)
+        target = self.now_us + us
+        if self.deadline_us is not None and target > self.deadline_us:
+            target = self.deadline_us
+        events = self._events
+        while events and events[0][0] <= target:
+            due, _, event = heapq.heappop(events)
+            if not event[3]:
+                continue
+            self._update_models(due)
+            self._busy = True
+            try:
+                event[2]()
+            finally:
+                self._busy = False
+            if event[3]:
+                event[0] = due + event[1]
+                self._push(event)
+            self._run_queue()
+        self._update_models(target)
+        if self.cpu_scale:
+            # the simulation's own work is not charged to the program
+            self._wall = time.perf_counter()
+        if self.deadline_us is not None and self.now_us >= self.deadline_us:
+            raise SimulationTimeout('virtual time limit reached')
+
+    def read_us(self):
+        """!
+        Read the clock, which takes @c read_cost_us.
+        @return: Time since the start in microseconds, not wrapped.
+        """
+        self.advance(self.read_cost_us)
+        return self.now_us
@@ -0,0 +1,99 @@
+"""!
+@file machine.py
+
+@brief Stand-in for the MicroPython @c machine module, on the simulated board.
+
+@details
+The I2C class talks to the devices on the simulated board's buses. Each
+transfer takes as long as it would on the wire: nine clocks per byte,
+including the address and the 16 bit memory address, plus a few for the
+start and stop conditions.
+
+@author Conor Schott, Fermin Moreno, Berent Baysal
+"""
+
+from board import get_board
+from pyb import Pin
+
+## errno for a device which does not acknowledge its address
+ENODEV = 19
+
+
+class I2C:
+    """!
+    An I2C controller on the simulated board.
+    """
+
+    def __init__(self, bus_id=1, scl=None, sda=None, freq=400000, timeout=50000):
+        """!
+        @param bus_id: Bus number.
+        @param scl: Clock pin, ignored.
+        @param sda: Data pin, ignored.
+        @param freq: Bus clock in Hz.
+        """
+        self.bus_id = bus_id
+        self.freq = freq
+
+    def init(self, scl=None, sda=None, freq=400000, timeout=50000):
+        self.freq = freq
+
+    def deinit(self):
+        pass
+
+    def _transfer(self, addr, nbytes):
+        """!
+        Spend the time a transfer takes, then find the device.
+        """
+        board = get_board()
+        board.clock.advance((nbytes + 5) * 9 * 1000000 // self.freq)
+        device = board.i2c_devices.get(self.bus_id, {}).get(addr)
+        if device is None:
+            raise OSError(ENODEV)
+        return device
+
+    def scan(self):
+        """!
+        Addresses of the devices on the bus.
+        """
+        board = get_board()
+        board.clock.advance(112 * 10 * 1000000 // self.freq)
+        return sorted(board.i2c_devices.get(self.bus_id, {}))
+
+    def readfrom_mem(self, addr, memaddr, nbytes, addrsize=8):
+        """!
+        Read bytes from a device's memory.
+        """
+        device = self._transfer(addr, nbytes)
+        return bytes(device.read(memaddr, nbytes))
+
+    def readfrom_mem_into(self, addr, memaddr, buf, addrsize=8):
+        """!
+        Read a device's memory into a buffer.
+        """
+        device = self._transfer(addr, len(buf))
+        buf[:] = device.read(memaddr, len(buf))
+
+    def writeto_mem(self, addr, memaddr, buf, addrsize=8):
+        """!
+        Write bytes to a device's memory.
+        """
+        self._transfer(addr, len(buf)).write(memaddr, bytes(buf))
+
+
+SoftI2C = I2C
+
+
+def freq():
+    return 80000000
+
+
+def idle():
+    get_board().clock.advance(1)
+
+
+def reset():
+    raise SystemExit('machine.reset()')
+
+
+def unique_id():
+    return b'\x00SIM405\x00\x00\x00\x00\x00'
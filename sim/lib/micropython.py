@@ -0,0 +1,54 @@
+"""!
+@file micropython.py
+
+@brief Stand-in for the @c micropython module.
+
+@details
+Scheduled functions are queued on the virtual clock and run after the timer
+callback which scheduled them, or straight away from the main program. The
+code emitters are plain Python here.
+
+@author Conor Schott, Fermin Moreno, Berent Baysal
+"""
+
+from board import get_board
+
+
+def const(value):
+    return value
+
+
+def schedule(func, arg):
+    get_board().clock.schedule(func, arg)
+
+
+def native(func):
+    return func
+
+
+viper = native
+asm_thumb = native
+
+
+def alloc_emergency_exception_buf(size):
+    pass
+
+
+def heap_lock():
+    return 0
+
+
+def heap_unlock():
+    return 0
+
+
+def mem_info(verbose=False):
+    print('mem: simulated, no heap limit')
+
+
+def stack_use():
+    return 0
+
+
+def opt_level(level=None):
+    return 0 if level is None else None
@@ -0,0 +1,378 @@
+"""!
+@file pyb.py
+
+@brief Stand-in for the MicroPython @c pyb module, on the simulated board.
+
+@details
+Covers the parts of @c pyb the turret code uses: pins, timers with PWM and
+encoder channels and interrupt callbacks, the LEDs and a few time functions.
+Timer callbacks run on virtual time, between statements of the main
+program, as interrupts would.
+
+@author Conor Schott, Fermin Moreno, Berent Baysal
+"""
+
+from board import get_board
+
+## Clock of the timers, as on the STM32L476 at 80 MHz
+TIMER_CLOCK = 80000000
+
+
+class _Names:
+    """!
+    Namespace of pin names, e.g. @c Pin.board.PC6, made on demand.
+    """
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return Pin(name)
+
+
+class Pin:
+    """!
+    A GPIO pin, which keeps its level on the board.
+    """
+
+    IN = 0
+    OUT_PP = 1
+    OUT_OD = 17
+    AF_PP = 2
+    AF_OD = 18
+    ANALOG = 3
+    PULL_NONE = 0
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_RISING = 0x10110000
+    IRQ_FALLING = 0x10210000
+
+    board = _Names()
+    cpu = _Names()
+
+    def __init__(self, pin, mode=IN, pull=PULL_NONE, value=None, **kwargs):
+        """!
+        @param pin: Pin name, or another Pin.
+        @param mode: Pin mode.
+        @param pull: Pull resistor setting.
+        @param value: Starting level of an output.
+        """
+        self.name = pin.name if isinstance(pin, Pin) else str(pin)
+        self.mode = mode
+        self.pull = pull
+        if value is not None:
+            self.value(value)
+
+    def init(self, mode=IN, pull=PULL_NONE, value=None, **kwargs):
+        """!
+        Change the pin's mode.
+        """
+        self.mode = mode
+        self.pull = pull
+        if value is not None:
+            self.value(value)
+
+    def value(self, level=None):
+        """!
+        Read the pin's level, or set it.
+        """
+        pins = get_board().pins
+        if level is None:
+            return pins.get(self.name, 0)
+        pins[self.name] = 1 if level else 0
+        return None
+
+    def __call__(self, level=None):
+        return self.value(level)
+
+    def high(self):
+        self.value(1)
+
+    def low(self):
+        self.value(0)
+
+    on = high
+    off = low
+
+    def __repr__(self):
+        return 'Pin(Pin.cpu.%s)' % self.name
+
+
+class TimerChannel:
+    """!
+    One channel of a timer.
+    """
+
+    def __init__(self, timer, channel_id, mode, pin=None):
+        self.timer = timer
+        self.channel_id = channel_id
+        self.mode = mode
+        self.pin = pin
+        ## Compare value, in timer ticks
+        self.width = 0
+
+    def pulse_width(self, width=None):
+        """!
+        Read or set the pulse width in timer ticks.
+        """
+        if width is None:
+            return self.width
+        self.width = int(width)
+        self.timer._changed(self)
+        return None
+
+    def pulse_width_percent(self, percent=None):
+        """!
+        Read or set the pulse width as a percentage of the period.
+        """
+        period = self.timer.period() + 1
+        if percent is None:
+            return 100 * self.width / period
+        self.width = int(period * max(0.0, min(100.0, percent)) / 100)
+        self.timer._changed(self)
+        return None
+
+    def capture(self, value=None):
+        return self.pulse_width(value)
+
+    compare = capture
+
+    def callback(self, fun):
+        pass
+
+
+class Timer:
+    """!
+    A hardware timer.
+    """
+
+    PWM = 0
+    PWM_INVERTED = 1
+    OC_TIMING = 2
+    OC_ACTIVE = 3
+    OC_INACTIVE = 4
+    OC_TOGGLE = 5
+    OC_FORCED_ACTIVE = 6
+    OC_FORCED_INACTIVE = 7
+    IC = 8
+    ENC_A = 9
+    ENC_B = 10
+    ENC_AB = 11
+    UP = 0
+    DOWN = 16
+    CENTER = 32
+    HIGH = 0
+    LOW = 2
+    RISING = 0
+    FALLING = 2
+    BOTH = 10
+
+    def __init__(self, timer_id, **kwargs):
+        """!
+        @param timer_id: Timer number.
+        Any other arguments are passed on to init().
+        """
+        self.timer_id = timer_id
+        self._prescaler = 0
+        self._period = 0xFFFF
+        self._channels = {}
+        self._callback = None
+        self._event = None
+        self._count = 0
+        get_board().timers[timer_id] = self
+        if kwargs:
+            self.init(**kwargs)
+
+    def init(self, freq=None, prescaler=None, period=None, mode=UP, div=1,
+             callback=None, deadtime=0):
+        """!
+        Set the timer's frequency, or its prescaler and period.
+        """
+        if freq is not None:
+            # the smallest prescaler which fits the period in 16 bits
+            ticks = max(1, int(round(TIMER_CLOCK / freq)))
+            self._prescaler = (ticks - 1) // 0x10000
+            self._period = ticks // (self._prescaler + 1) - 1
+        else:
+            if prescaler is not None:
+                self._prescaler = prescaler
+            if period is not None:
+                self._period = period
+        self._restart()
+        if callback is not None:
+            self.callback(callback)
+
+    def deinit(self):
+        """!
+        Stop the timer, its callback and its channels.
+        """
+        self.callback(None)
+        for channel in self._channels.values():
+            channel.width = 0
+            self._changed(channel)
+
+    def freq(self, value=None):
+        """!
+        Read or set the frequency of the timer's update event.
+        """
+        if value is None:
+            return TIMER_CLOCK / ((self._prescaler + 1) * (self._period + 1))
+        self.init(freq=value)
+        return None
+
+    def prescaler(self, value=None):
+        """!
+        Read or set the prescaler.
+        """
+        if value is None:
+            return self._prescaler
+        self._prescaler = value
+        self._restart()
+        return None
+
+    def period(self, value=None):
+        """!
+        Read or set the period, in ticks less one.
+        """
+        if value is None:
+            return self._period
+        self._period = value
+        self._restart()
+        return None
+
+    def source_freq(self):
+        return TIMER_CLOCK
+
+    def counter(self, value=None):
+        """!
+        Read or set the counter. An encoder timer counts the pan shaft.
+        """
+        if value is not None:
+            self._count = value
+            return None
+        count = get_board().counter(self.timer_id)
+        if count is not None:
+            return count
+        board = get_board()
+        tick_us = (self._prescaler + 1) * 1000000 / TIMER_CLOCK
+        return int(board.clock.now_us / tick_us) % (self._period + 1)
+
+    def channel(self, channel_id, mode=None, pin=None, pulse_width=None,
+                pulse_width_percent=None, **kwargs):
+        """!
+        Set up a channel, or get one which is already set up.
+        """
+        if mode is None:
+            return self._channels.get(channel_id)
+        channel = TimerChannel(self, channel_id, mode, pin)
+        self._channels[channel_id] = channel
+        if pulse_width is not None:
+            channel.pulse_width(pulse_width)
+        elif pulse_width_percent is not None:
+            channel.pulse_width_percent(pulse_width_percent)
+        return channel
+
+    def callback(self, fun):
+        """!
+        Call a function with the timer every update event, or stop if None.
+        """
+        self._callback = fun
+        self._restart()
+
+    def percent(self, channel_id):
+        """!
+        Duty cycle of a channel in percent, 0 if it is not set up.
+        """
+        channel = self._channels.get(channel_id)
+        if channel is None or channel.mode not in (Timer.PWM, Timer.PWM_INVERTED):
+            return 0.0
+        return 100.0 * channel.width / (self._period + 1)
+
+    def _changed(self, channel):
+        get_board().channel_changed(self.timer_id, channel)
+
+    def _restart(self):
+        clock = get_board().clock
+        clock.cancel(self._event)
+        self._event = None
+        if self._callback is not None:
+            period_us = (self._prescaler + 1) * (self._period + 1) * 1000000 / TIMER_CLOCK
+            self._event = clock.add_periodic(self._fire, round(period_us))
+
+    def _fire(self):
+        if self._callback is not None:
+            self._callback(self)
+
+    def __repr__(self):
+        return 'Timer(%d, prescaler=%d, period=%d)' % (self.timer_id, self._prescaler,
+                                                       self._period)
+
+
+class LED:
+    """!
+    One of the board's LEDs.
+    """
+
+    def __init__(self, led_id):
+        self.led_id = led_id
+        self.lit = False
+
+    def on(self):
+        self.lit = True
+
+    def off(self):
+        self.lit = False
+
+    def toggle(self):
+        self.lit = not self.lit
+
+    def intensity(self, value=None):
+        if value is None:
+            return 255 if self.lit else 0
+        self.lit = value > 0
+        return None
+
+
+def millis():
+    return get_board().clock.read_us() // 1000
+
+
+def micros():
+    return get_board().clock.read_us()
+
+
+def elapsed_millis(start):
+    return millis() - start
+
+
+def elapsed_micros(start):
+    return micros() - start
+
+
+def delay(ms):
+    get_board().clock.advance(ms * 1000)
+
+
+def udelay(us):
+    get_board().clock.advance(us)
+
+
+def info(dump_alloc_table=None):
+    """!
+    Print a short description of the board; its presence is also how
+    scripts tell a Pyboard from other ports.
+    """
+    board = get_board()
+    print('simulated STM32L476, t = %d us, timers %s' % (board.clock.now_us,
+                                                         sorted(board.timers)))
+
+
+def disable_irq():
+    return True
+
+
+def enable_irq(state=True):
+    pass
+
+
+def freq():
+    return (TIMER_CLOCK, TIMER_CLOCK, TIMER_CLOCK, TIMER_CLOCK)
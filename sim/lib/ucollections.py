@@ -0,0 +1,9 @@
+"""!
+@file ucollections.py
+
+@brief Stand-in for the MicroPython @c ucollections module.
+
+@author Conor Schott, Fermin Moreno, Berent Baysal
+"""
+
+from collections import namedtuple, deque, OrderedDict  # noqa: F401
@@ -0,0 +1,131 @@
+"""!
+@file uctypes.py
+
+@brief Stand-in for the MicroPython @c uctypes module.
+
+@details
+Only scalar and bitfield fields are supported, which is all the register
+and EEPROM layouts use. The field descriptors are encoded as MicroPython
+encodes them, so layouts built from these constants mean the same here.
+There are no raw addresses in CPython: addressof() gives an int which
+remembers its buffer, and struct() works on that buffer.
+
+@author Conor Schott, Fermin Moreno, Berent Baysal
+"""
+
+LITTLE_ENDIAN = 0
+BIG_ENDIAN = 1
+NATIVE = 2
+
+VAL_TYPE_SHIFT = 27
+BF_POS = 17
+BF_LEN = 22
+_OFFSET_MASK = (1 << BF_POS) - 1
+_BF_MASK = 0x1F
+
+UINT8 = 0 << VAL_TYPE_SHIFT
+INT8 = 1 << VAL_TYPE_SHIFT
+UINT16 = 2 << VAL_TYPE_SHIFT
+INT16 = 3 << VAL_TYPE_SHIFT
+UINT32 = 4 << VAL_TYPE_SHIFT
+INT32 = 5 << VAL_TYPE_SHIFT
+UINT64 = 6 << VAL_TYPE_SHIFT
+INT64 = 7 << VAL_TYPE_SHIFT
+BFUINT8 = 8 << VAL_TYPE_SHIFT
+BFINT8 = 9 << VAL_TYPE_SHIFT
+BFUINT16 = 10 << VAL_TYPE_SHIFT
+BFINT16 = 11 << VAL_TYPE_SHIFT
+BFUINT32 = 12 << VAL_TYPE_SHIFT
+BFINT32 = 13 << VAL_TYPE_SHIFT
+FLOAT32 = 14 << VAL_TYPE_SHIFT
+FLOAT64 = 15 << VAL_TYPE_SHIFT
+
+# size in bytes and signedness of each value type
+_TYPES = {
+    0: (1, False), 1: (1, True), 2: (2, False), 3: (2, True),
+    4: (4, False), 5: (4, True), 6: (8, False), 7: (8, True),
+    8: (1, False), 9: (1, True), 10: (2, False), 11: (2, True),
+    12: (4, False), 13: (4, True),
+}
+
+
+class _Address(int):
+    """!
+    Address of a buffer, which keeps the buffer.
+    """
+
+    def __new__(cls, buf):
+        address = super().__new__(cls, id(buf))
+        address.buf = buf
+        return address
+
+
+def addressof(obj):
+    """!
+    Address of a buffer, for struct().
+    """
+    return _Address(obj)
+
+
+def _decode(desc):
+    val_type = (desc >> VAL_TYPE_SHIFT) & 0xF
+    if val_type not in _TYPES:
+        raise TypeError('only scalar and bitfield fields are supported')
+    size, signed = _TYPES[val_type]
+    bitfield = val_type >= 8
+    pos = (desc >> BF_POS) & _BF_MASK if bitfield else 0
+    bits = (desc >> BF_LEN) & _BF_MASK if bitfield else 8 * size
+    return desc & _OFFSET_MASK, size, signed, bitfield, pos, bits
+
+
+class struct:
+    """!
+    Fields of a buffer, read and written through attributes.
+    """
+
+    def __init__(self, addr, descriptor, layout_type=NATIVE):
+        """!
+        @param addr: Address from addressof().
+        @param descriptor: Dictionary of field names to descriptors.
+        @param layout_type: LITTLE_ENDIAN, BIG_ENDIAN or NATIVE.
+        """
+        if not isinstance(addr, _Address):
+            raise ValueError('only addresses from addressof() can be used')
+        object.__setattr__(self, '_buf', addr.buf)
+        object.__setattr__(self, '_desc', descriptor)
+        object.__setattr__(self, '_order', 'big' if layout_type == BIG_ENDIAN else 'little')
+
+    def __getattr__(self, name):
+        try:
+            desc = self._desc[name]
+        except KeyError:
+            raise AttributeError(name) from None
+        offset, size, signed, bitfield, pos, bits = _decode(desc)
+        word = int.from_bytes(bytes(self._buf[offset:offset + size]), self._order)
+        value = (word >> pos) & ((1 << bits) - 1)
+        if signed and value >= 1 << (bits - 1):
+            value -= 1 << bits
+        return value
+
+    def __setattr__(self, name, value):
+        try:
+            desc = self._desc[name]
+        except KeyError:
+            raise AttributeError(name) from None
+        offset, size, signed, bitfield, pos, bits = _decode(desc)
+        mask = ((1 << bits) - 1) << pos
+        word = int.from_bytes(bytes(self._buf[offset:offset + size]), self._order)
+        word = (word & ~mask) | ((value << pos) & mask)
+        self._buf[offset:offset + size] = word.to_bytes(size, self._order)
+
+
+def sizeof(obj, layout_type=NATIVE):
+    """!
+    Size in bytes of a layout or struct.
+    """
+    descriptor = obj._desc if isinstance(obj, struct) else obj
+    end = 0
+    for desc in descriptor.values():
+        offset, size = _decode(desc)[:2]
+        end = max(end, offset + size)
+    return end
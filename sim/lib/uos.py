@@ -0,0 +1,10 @@
+"""!
+@file uos.py
+
+@brief Stand-in for the MicroPython @c uos module. Files are in the host's
+current directory, which stands for the board's flash.
+
+@author Conor Schott, Fermin Moreno, Berent Baysal
+"""
+
+from os import listdir, mkdir, remove, rename, rmdir, stat, getcwd, chdir  # noqa: F401
@@ -0,0 +1,69 @@
+"""!
+@file utime.py
+
+@brief Stand-in for the MicroPython @c utime module, on virtual time.
+
+@details
+The ticks counters wrap at 2**30 as on the board, so code which forgets
+ticks_diff() shows the same bugs here. Sleeping moves the virtual clock on,
+running any timer callbacks which fall due meanwhile.
+
+@author Conor Schott, Fermin Moreno, Berent Baysal
+"""
+
+from board import get_board
+from clock import TICKS_PERIOD
+
+## Seconds from 1970 to the board's epoch of 2000
+_EPOCH = 946684800
+
+
+def ticks_us():
+    return get_board().clock.read_us() % TICKS_PERIOD
+
+
+def ticks_ms():
+    return get_board().clock.read_us() // 1000 % TICKS_PERIOD
+
+
+def ticks_cpu():
+    return ticks_us()
+
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) % TICKS_PERIOD
+
+
+def ticks_diff(ticks1, ticks2):
+    diff = (ticks1 - ticks2) % TICKS_PERIOD
+    if diff >= TICKS_PERIOD // 2:
+        diff -= TICKS_PERIOD
+    return diff
+
+
+def sleep_us(us):
+    get_board().clock.advance(us)
+
+
+def sleep_ms(ms):
+    get_board().clock.advance(int(ms * 1000))
+
+
+def sleep(seconds):
+    get_board().clock.advance(int(seconds * 1000000))
+
+
+def time():
+    return _EPOCH + get_board().clock.now_us // 1000000
+
+
+def time_ns():
+    return (_EPOCH * 1000000 + get_board().clock.read_us()) * 1000
+
+
+def localtime(secs=None):
+    import time as _time
+    return _time.gmtime(time() if secs is None else secs)[:8]
+
+
+gmtime = localtime
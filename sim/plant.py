@@ -0,0 +1,68 @@
+"""!
+@file plant.py
+
+@brief DC motor model for the panning axis.
+
+@details
+The motor is modelled as first order: its speed moves towards a value set
+by the duty cycle with a mechanical time constant, and nothing moves until
+the duty cycle overcomes static friction. Position is kept in encoder
+counts, so the encoder counter is simply the position wrapped to 16 bits.
+
+@author Conor Schott, Fermin Moreno, Berent Baysal
+"""
+
+
+class DCMotor:
+    """!
+    First order DC motor with static friction, in encoder counts.
+    """
+
+    def __init__(self, gain=200.0, tau_s=0.1, stiction=8.0, position=0.0):
+        """!
+        @param gain: Steady speed in counts per second per percent duty cycle
+               above the static friction.
+        @param tau_s: Mechanical time constant in seconds.
+        @param stiction: Duty cycle in percent needed to start moving.
+        @param position: Starting position in counts.
+        """
+        self.gain = gain
+        self.tau_s = tau_s
+        self.stiction = stiction
+        ## Shaft position in encoder counts
+        self.position = float(position)
+        ## Shaft speed in counts per second
+        self.speed = 0.0
+        ## Applied duty cycle in percent, positive to count up
+        self.duty = 0.0
+        self._last_us = 0
+
+    def drive(self):
+        """!
+        Duty cycle left after static friction, in percent.
+        """
+        duty = max(-100.0, min(100.0, self.duty))
+        if abs(duty) <= self.stiction:
+            return 0.0
+        return duty - self.stiction if duty > 0 else duty + self.stiction
+
+    def update(self, now_us):
+        """!
+        Move the model on to a time.
+        """
+        dt = (now_us - self._last_us) / 1000000
+        self._last_us = now_us
+        if dt <= 0:
+            return
+        target = self.gain * self.drive()
+        if target == 0 and abs(self.speed) < 1.0:
+            self.speed = 0.0
+            return
+        self.speed += (target - self.speed) * min(1.0, dt / self.tau_s)
+        self.position += self.speed * dt
+
+    def counter(self):
+        """!
+        Reading of a 16 bit encoder counter on the shaft.
+        """
+        return int(self.position // 1) & 0xFFFF
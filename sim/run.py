@@ -0,0 +1,130 @@
+"""!
+@file run.py
+
+@brief Run the turret's MicroPython code on a PC against the simulated board.
+
+@details
+Usage, from the top of the repository:
+
+    python sim/run.py src/main.py --duration 20
+    python sim/run.py src/benchmark.py --cpu-scale 30
+
+The stand-in modules in sim/lib take the place of @c pyb, @c machine,
+@c utime, @c uos, @c uctypes, @c ucollections and @c micropython, the
+sources in src are importable as on the board's flash, and they are also
+installed as the @c mlx90640 package. The script then runs unmodified as @c __main__ on
+virtual time: the motor, encoder, servo and camera are simulated, and sleeps
+take no real time. When the time limit is reached a KeyboardInterrupt is
+raised in the script, as Ctrl-C would on the board, and a summary of the
+run is printed.
+
+To use the simulator from another program, e.g. a test, call install() and
+then import the modules as usual. The host tests in sim/tests do this; run
+them with @c "python -m pytest sim/tests".
+
+@author Conor Schott, Fermin Moreno, Berent Baysal
+"""
+
+import argparse
+import builtins
+import gc
+import importlib.util
+import os
+import runpy
+import sys
+import time
+
+SIM_DIR = os.path.dirname(os.path.abspath(__file__))
+LIB_DIR = os.path.join(SIM_DIR, 'lib')
+SRC_DIR = os.path.join(os.path.dirname(SIM_DIR), 'src')
+
+## Heap the scripts are told is free, as on the STM32L476
+HEAP_BYTES = 100000
+
+
+def install(board=None, src_dir=SRC_DIR):
+    """!
+    Make the board's modules importable and point them at a simulated board.
+    @param board: Board to use; a default board.Board if None.
+    @param src_dir: Directory of the turret sources.
+    @return: The board in use.
+    """
+    for path in (src_dir, LIB_DIR, SIM_DIR):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    import board as sim_board
+    import utime
+    import micropython
+    if board is not None:
+        sim_board.set_board(board)
+    board = sim_board.get_board()
+
+    # MicroPython builtins and the MicroPython parts of time and gc
+    builtins.const = micropython.const
+    for name in ('ticks_us', 'ticks_ms', 'ticks_cpu', 'ticks_add', 'ticks_diff',
+                 'sleep_ms', 'sleep_us', 'sleep'):
+        setattr(time, name, getattr(utime, name))
+    gc.mem_free = lambda: HEAP_BYTES
+    gc.mem_alloc = lambda: 0
+
+    # on the board the driver package is the sources under another name
+    if 'mlx90640' not in sys.modules:
+        spec = importlib.util.spec_from_file_location(
+            'mlx90640', os.path.join(src_dir, 'init.py'),
+            submodule_search_locations=[src_dir])
+        package = importlib.util.module_from_spec(spec)
+        sys.modules['mlx90640'] = package
+        spec.loader.exec_module(package)
+    return board
+
+
+def main(argv=None):
+    """!
+    Run a script on the simulated board and print a summary.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('@details')[0].strip('!\n '))
+    parser.add_argument('script', help='MicroPython script to run')
+    parser.add_argument('--duration', type=float, default=30.0,
+                        help='virtual seconds to run for (default 30)')
+    parser.add_argument('--target-col', type=float, default=20.0,
+                        help='starting column of the warm target (default 20)')
+    parser.add_argument('--target-speed', type=float, default=0.0,
+                        help='sideways speed of the target in columns per second')
+    parser.add_argument('--target-temp', type=float, default=34.0,
+                        help='target temperature in degrees C (default 34)')
+    parser.add_argument('--ambient', type=float, default=22.0,
+                        help='background temperature in degrees C (default 22)')
+    parser.add_argument('--seed', type=int, default=405,
+                        help='seed for the camera calibration and noise')
+    parser.add_argument('--cpu-scale', type=float, default=0.0,
+                        help='how many times slower the board is than this PC; '
+                             '0 (default) makes computation take no time')
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, SIM_DIR)
+    from board import Board
+    from camera import Scene, Target
+    scene = Scene(args.ambient, [Target(args.target_col, temp=args.target_temp,
+                                        speed=args.target_speed)])
+    board = install(Board(scene, args.seed))
+    board.clock.cpu_scale = args.cpu_scale
+    board.clock.deadline_us = int(args.duration * 1000000)
+
+    script = os.path.abspath(args.script)
+    sys.path.insert(0, os.path.dirname(script))
+    sys.argv = [script]
+    try:
+        runpy.run_path(script, run_name='__main__')
+    except KeyboardInterrupt:
+        print('-- stopped at the time limit')
+    finally:
+        clock = board.clock
+        clock.deadline_us = None
+        print(f'-- {clock.now_us / 1000000:.3f} s virtual time, '
+              f'motor at {board.motor.position:.0f} counts, '
+              f'{len(board.shots)} shot(s)'
+              + ''.join(f', {t / 1000000:.3f} s at {pos:.0f}' for t, pos in board.shots))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+"""!
+@file conftest.py
+
+@brief pytest set-up for the host tests, which run on the simulated board.
+
+@details
+The stand-in modules are installed once for the whole session. Each test
+which asks for the @c board fixture gets a fresh Board, so timers, the
+motor and the camera start again from zero.
+
+@author Conor Schott, Fermin Moreno, Berent Baysal
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import run  # noqa: E402
+
+run.install()
+
+from board import Board, set_board  # noqa: E402
+
+
+@pytest.fixture
+def board(tmp_path, monkeypatch):
+    """!
+    A fresh simulated board, with files such as the calibration cache
+    written to a temporary directory.
+    """
+    monkeypatch.chdir(tmp_path)
+    return set_board(Board())
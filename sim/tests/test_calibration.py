@@ -0,0 +1,39 @@
+"""!
+@file test_calibration.py
+
+@brief Host test of the calibrated camera state and object temperatures.
+
+@details
+The simulated camera's pixels are worked out from the scene's temperatures
+at Ta = 25 C and Vdd = 3.3 V, so a driver which decodes the EEPROM
+correctly reads those back. Its paired byte parameters differ between the
+two bytes of each word, so reading them the wrong way round shows here.
+
+@author Conor Schott, Fermin Moreno, Berent Baysal
+"""
+
+from machine import I2C
+
+from mlx90640 import MLX90640
+from mlx90640.calibration import NUM_COLS
+
+
+def test_calibrated_image_reads_the_scene(board):
+    camera = MLX90640(I2C(1), 0x33)
+    camera.setup(calib=True)
+    for _ in range(2):
+        camera.wait_data()
+        image = camera.read_image()
+
+    state = camera.read_state()
+    assert abs(state.vdd - 3.3) < 0.01
+    assert abs(state.ta) < 0.1
+    assert abs(state.gain - 1) < 0.001
+
+    # hundredths of a degree C; the target is 34 C on a 22 C background
+    target = [image.pix[row * NUM_COLS + col] for row in range(9, 14) for col in (20, 21)]
+    background = [image.pix[row * NUM_COLS + col] for row in (0, 1, 22) for col in range(8, 14)]
+    for temp in target:
+        assert abs(temp - 3400) <= 80, temp
+    for temp in background:
+        assert abs(temp - 2200) <= 80, temp
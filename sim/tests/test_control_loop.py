@@ -0,0 +1,46 @@
+"""!
+@file test_control_loop.py
+
+@brief Host tests of the timer-driven control loop on the simulated motor.
+
+@author Conor Schott, Fermin Moreno, Berent Baysal
+"""
+
+import pyb
+import pytest
+import utime
+
+import control_loop
+import encoder_reader
+import motor_control
+from PID_Closed_Loop import ClosedLoopController
+
+
+def _make_loop(setpoint):
+    enc = encoder_reader.Encoder(8, pyb.Pin.board.PC6, pyb.Pin.board.PC7)
+    moe = motor_control.MotorDriver(pyb.Pin.board.PC1, pyb.Pin.board.PA0,
+                                    pyb.Pin.board.PA1, 5)
+    controller = ClosedLoopController(0.3, 0.5, 0.004, setpoint)
+    return control_loop.ControlLoop(enc, moe, controller, freq=500)
+
+
+def test_loop_reaches_setpoint(board):
+    loop = _make_loop(4000)
+    loop.start()
+    utime.sleep_ms(3000)
+    loop.stop()
+    assert abs(loop.position - 4000) <= 5
+    assert loop.missed == 0
+
+
+def test_none_setpoint_is_rejected(board):
+    loop = _make_loop(4000)
+    loop.start()
+    with pytest.raises(ValueError):
+        loop.set_setpoint(None)
+    assert loop.target == 4000
+    loop.stop()
+    steps = loop.steps
+    utime.sleep_ms(100)
+    assert loop.steps == steps
+    assert board.motor.duty == 0
@@ -0,0 +1,83 @@
+"""!
+@file test_encoder.py
+
+@brief Host tests of the encoder reader's position and velocity.
+
+@details
+The reader is handed a fake timer whose counter follows a shaft turning at
+a set speed, and is read at a fixed interval through @c Encoder.read().
+At the top speeds the 16 bit counter moves nearly half its range between
+reads and wraps every second or third read, in both directions.
+
+@author Conor Schott, Fermin Moreno, Berent Baysal
+"""
+
+import pytest
+import utime
+
+import encoder_reader
+
+## Speeds tried, in counts per second
+SPEEDS = (-3000000, -250000, -8000, -50, 0, 50, 8000, 250000, 3000000)
+
+## Time between reads in microseconds
+PERIOD_US = 10000
+
+## Reads per speed
+READS = 200
+
+
+class _FakeEncoderTimer:
+    """!
+    Stands in for an encoder timer, counting a shaft turning at a set speed.
+    """
+
+    def __init__(self, speed=0.0, start=0):
+        ## Shaft speed in counts per second
+        self.speed = speed
+        ## Time from utime.ticks_us(), starting now as the encoder's does
+        self.now_us = utime.ticks_us()
+        self.position = float(start)
+
+    def channel(self, *args, **kwargs):
+        return None
+
+    def advance(self, us):
+        self.now_us = utime.ticks_add(self.now_us, us)
+        self.position += self.speed * us / 1000000
+
+    def counter(self):
+        return int(self.position) & 0xFFFF
+
+
+@pytest.mark.parametrize('speed', SPEEDS)
+def test_position_and_velocity(board, speed):
+    timer = _FakeEncoderTimer(speed, start=0x8000)
+    enc = encoder_reader.Encoder(timer, None, None)
+    wraps = 0
+    for _ in range(READS):
+        previous = timer.counter()
+        timer.advance(PERIOD_US)
+        if (speed > 0 and timer.counter() < previous
+                or speed < 0 and timer.counter() > previous):
+            wraps += 1
+        position = enc.read(timer.now_us)
+        assert position == int(timer.position) - 0x8000
+    # every wrap of the counter was crossed between two reads
+    assert wraps == abs(int(timer.position) // 0x10000 - 0x8000 // 0x10000)
+    if abs(speed) >= 3000000:
+        assert wraps >= READS // 3
+    assert abs(enc.velocity - speed) <= max(1.0, abs(speed) * 0.001), enc.velocity
+
+
+def test_velocity_drops_to_zero_when_stopped(board):
+    timer = _FakeEncoderTimer(8000)
+    enc = encoder_reader.Encoder(timer, None, None)
+    for _ in range(50):
+        timer.advance(PERIOD_US)
+        enc.read(timer.now_us)
+    timer.speed = 0
+    for _ in range(20):
+        timer.advance(PERIOD_US)
+        enc.read(timer.now_us)
+    assert abs(enc.velocity) < 1.0
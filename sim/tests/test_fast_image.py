@@ -0,0 +1,71 @@
+"""!
+@file test_fast_image.py
+
+@brief Host test of the latency of MLX_Cam.get_image(fast=True), replaying
+recorded frames.
+
+@details
+Subpages are recorded from the simulated camera with a FrameRecorder and
+played back with their recorded timing by a ReplayInterface, so both ways
+of getting an image see the same subpages arriving at the same rate.
+
+@author Conor Schott, Fermin Moreno, Berent Baysal
+"""
+
+import utime
+from machine import I2C
+
+from image_to_encoder import MLX_Cam
+from mlx90640 import MLX90640
+from mlx90640.recording import FrameRecorder, ReplayInterface
+
+## Subpages recorded
+SUBPAGES = 24
+
+## Images taken each way
+IMAGES = 8
+
+
+def _record(path):
+    camera = MLX90640(I2C(1), 0x33)
+    camera.setup()
+    recorder = FrameRecorder(camera, path)
+    for _ in range(SUBPAGES):
+        camera.wait_data()
+        camera.read_image()
+    recorder.close()
+    return camera.period_ms
+
+
+def _latencies(path, fast):
+    """!
+    Time each image takes, and where its hotspot is.
+    """
+    replay = ReplayInterface(path)
+    cam = MLX_Cam(replay, pattern=replay.pattern)
+    times = []
+    spots = []
+    for _ in range(IMAGES):
+        start = utime.ticks_ms()
+        image = cam.get_image(fast=fast)
+        times.append(utime.ticks_diff(utime.ticks_ms(), start))
+        spots.append(cam.find_hotSpot(image))
+    replay.close()
+    return times, spots
+
+
+def test_fast_image_latency(board):
+    period = _record('frames.bin')
+    fast, fast_spots = _latencies('frames.bin', True)
+    full, full_spots = _latencies('frames.bin', False)
+    # the replay starts with a subpage ready, so the first image is left out
+    fast_ms = sum(fast[1:]) / (IMAGES - 1)
+    full_ms = sum(full[1:]) / (IMAGES - 1)
+    print(f'refresh period {period} ms: full image {full_ms:.0f} ms, '
+          f'fast image {fast_ms:.0f} ms, {100 * (1 - fast_ms / full_ms):.0f}% less')
+    # one refresh period per image instead of two
+    assert fast_ms <= 1.1 * period
+    assert full_ms >= 1.9 * period
+    # and the hotspot found is still on the target
+    for col, row in fast_spots + full_spots:
+        assert 16 <= col <= 21 and 7 <= row <= 15, (col, row)
@@ -0,0 +1,106 @@
+"""!
+@file test_fixed_point.py
+
+@brief Host test of the fixed-point pixel compensation on recorded frames.
+
+@details
+The simulated camera always reports Ta = 25 C, Vdd = 3.3 V and the
+calibrated gain, where the fixed-point scale factors are exactly one and
+no error shows. Frames are therefore recorded from it, and the gain, Ta and
+Vdd words of each record's auxiliary block are rewritten before the
+recording is played back, so every subpage is compensated under a
+different camera state.
+
+@author Conor Schott, Fermin Moreno, Berent Baysal
+"""
+
+import random
+import struct
+
+import pytest
+from machine import I2C
+
+from mlx90640 import MLX90640
+from mlx90640.image import ChessPattern, FixedPointImage, InterleavedPattern, IMAGE_SIZE
+from mlx90640.recording import (FrameRecorder, ReplayInterface, RECORDING_HEADER,
+                                RECORD_HEADER, AUX_ADDRESS, AUX_SIZE, SUBPAGE_SIZE)
+from mlx90640.regmap import EEPROM_SIZE, REG_SIZE
+
+## Subpages recorded for each pattern
+SUBPAGES = 16
+
+# auxiliary words rewritten for each record
+_GAIN = 0x070A
+_TA_PTAT = 0x0720
+_VDD_PIX = 0x072A
+
+
+def _record(path, pattern):
+    camera = MLX90640(I2C(1), 0x33)
+    camera.set_pattern(pattern)
+    camera.setup(calib=True)
+    recorder = FrameRecorder(camera, path)
+    for _ in range(SUBPAGES):
+        camera.wait_data()
+        camera.read_image()
+    recorder.close()
+
+
+def _vary_aux(path, seed):
+    """!
+    Give each record of a recording its own gain, Ta and Vdd.
+    """
+    with open(path, 'rb') as f:
+        data = bytearray(f.read())
+    rng = random.Random(seed)
+    start = struct.calcsize(RECORDING_HEADER) + EEPROM_SIZE * REG_SIZE
+    size = struct.calcsize(RECORD_HEADER) + AUX_SIZE * REG_SIZE + SUBPAGE_SIZE * 2
+    for record in range(start, len(data), size):
+        aux = record + struct.calcsize(RECORD_HEADER)
+        for address, low, high in ((_GAIN, -900, 900), (_TA_PTAT, -200, 200),
+                                   (_VDD_PIX, -1500, 1500)):
+            pos = aux + (address - AUX_ADDRESS) * REG_SIZE
+            word, = struct.unpack_from('>h', data, pos)
+            struct.pack_into('>h', data, pos, word + rng.randint(low, high))
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+@pytest.mark.parametrize('pattern', (ChessPattern, InterleavedPattern),
+                         ids=('chess', 'interleaved'))
+def test_fixed_point_within_documented_bound(board, pattern):
+    _record('frames.bin', pattern)
+    _vary_aux('frames.bin', pattern.pattern_id)
+
+    replay = ReplayInterface('frames.bin', realtime=False)
+    camera = MLX90640(replay, 0x33)
+    camera.setup(calib=True)
+    assert camera.get_pattern() is pattern
+    calib = camera.calib
+    fixed = FixedPointImage(calib, pattern)
+    il_margin = 0.125 if pattern is InterleavedPattern else 0.0
+
+    states = []
+    worst = 0.0
+    while True:
+        camera.read_image()
+        raw = camera.raw
+        state = camera.read_state()
+        states.append(state)
+        fixed.calc(raw, state)
+        for idx in range(IMAGE_SIZE):
+            error = abs(fixed.pix[idx] - fixed.reference(raw, state, idx))
+            bound = (0.5 + (abs(raw.pix[idx]) + abs(calib.pix_os_ref[idx])) * 2**-11
+                     + il_margin)
+            assert error <= bound, (idx, error, bound, state)
+            worst = max(worst, error / bound)
+        if not camera.has_data:
+            break
+    replay.close()
+
+    # the frames covered a real spread of camera states, and the error showed
+    assert len(states) == SUBPAGES
+    assert max(s.gain for s in states) - min(s.gain for s in states) > 0.15
+    assert max(s.ta for s in states) - min(s.ta for s in states) > 10
+    assert max(s.vdd for s in states) - min(s.vdd for s in states) > 0.1
+    assert worst > 0.2
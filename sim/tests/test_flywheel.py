@@ -0,0 +1,59 @@
+"""!
+@file test_flywheel.py
+
+@brief Host tests of the flywheel spin-up and hold.
+
+@author Conor Schott, Fermin Moreno, Berent Baysal
+"""
+
+import utime
+
+import Flywheel
+
+
+def _run(wheels, ms):
+    end = utime.ticks_add(utime.ticks_ms(), ms)
+    while utime.ticks_diff(end, utime.ticks_ms()) > 0:
+        wheels.update()
+        utime.sleep_ms(10)
+
+
+def test_wheels_stay_ready_when_the_shot_is_late(board):
+    wheels = Flywheel.FlywheelController(spin_up_ms=500)
+    wheels.idle()
+    wheels.arm(utime.ticks_add(utime.ticks_ms(), 500))
+    _run(wheels, 600)
+    assert wheels.ready
+    # settling takes far longer than expected; nothing arms the wheels again
+    _run(wheels, 10000)
+    assert wheels.ready
+    wheels.stop()
+    assert not wheels.ready
+    wheels.deinit()
+
+
+def test_timed_hold_drops_to_idle(board):
+    wheels = Flywheel.FlywheelController(spin_up_ms=500, hold_ms=1000)
+    wheels.idle()
+    wheels.arm(utime.ticks_add(utime.ticks_ms(), 500))
+    _run(wheels, 1000)
+    assert wheels.ready
+    _run(wheels, 1000)
+    assert wheels.state == Flywheel.F_IDLE
+    wheels.deinit()
+
+
+def test_arming_waits_for_the_spin_up(board):
+    wheels = Flywheel.FlywheelController(spin_up_ms=500)
+    wheels.idle()
+    start = utime.ticks_ms()
+    wheels.arm(utime.ticks_add(start, 1500))
+    # nothing happens until spin_up_ms before the shot
+    _run(wheels, 950)
+    assert wheels.state == Flywheel.F_ARMED
+    assert wheels.duty == 0
+    _run(wheels, 100)
+    assert wheels.state == Flywheel.F_SPIN_UP
+    _run(wheels, 500)
+    assert wheels.ready
+    wheels.deinit()
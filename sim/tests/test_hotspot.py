@@ -0,0 +1,137 @@
+"""!
+@file test_hotspot.py
+
+@brief Host tests of the hotspot search on simulated camera images.
+
+@author Conor Schott, Fermin Moreno, Berent Baysal
+"""
+
+import pytest
+import utime
+from machine import I2C
+
+from board import Board, set_board
+from camera import ADDRESS, Scene, Target, VirtualMLX90640
+from hotspot import HotspotFinder, dead_pixel_mask
+from mlx90640.calibration import PixelCalibrationData
+from image_to_encoder import MLX_Cam
+from mlx90640 import MLX90640
+from mlx90640.recording import FrameRecorder, ReplayInterface
+
+## Background threshold and lowest confidence used by main_cotasking
+BG_THRESHOLD = 40
+MIN_CONFIDENCE = 0.3
+
+
+def test_stuck_pixel_does_not_spread_when_interpolating(board):
+    # pixel 100 is flagged in the EEPROM and reads hot; whichever subpage
+    # arrives, the hotspot must stay on the target around column 20
+    cam = MLX_Cam(I2C(1))
+    # the EEPROM snapshot was only needed to build the mask
+    assert cam._camera.eeprom_image is None
+    seen = set()
+    for _ in range(6):
+        image = cam.get_image(fast=True)
+        seen.add(cam._camera.last_read.id)
+        col, row = cam.find_hotSpot(image)
+        assert 16 <= col <= 21 and 7 <= row <= 15, (col, row)
+    assert seen == {0, 1}
+
+
+def _background_run(targets, frames=16):
+    set_board(Board(Scene(22.0, targets)))
+    cam = MLX_Cam(I2C(1), background_threshold=BG_THRESHOLD)
+    start = utime.ticks_ms()
+    found = []
+    for _ in range(frames):
+        image = cam.get_image(fast=True)
+        col, row = cam.find_hotSpot(image)
+        if cam.detected and cam.confidence >= MIN_CONFIDENCE:
+            found.append((utime.ticks_diff(utime.ticks_ms(), start), col))
+    return found
+
+
+def test_static_warm_object_is_not_a_target(board):
+    assert _background_run([Target(6.0, row=4.0, temp=40.0, width=2.0, height=3.0)]) == []
+
+
+def test_moving_target_is_found_beside_static_warm_object(board):
+    # the settings main_cotasking uses; the target walks right at 1 column/s
+    found = _background_run([Target(20.0, speed=1.0),
+                                    Target(6.0, row=4.0, temp=40.0, width=2.0, height=3.0)])
+    assert found
+    assert found[0][0] <= 3500
+    for t_ms, col in found:
+        # the window's left edge, near the leading edge of the target
+        assert abs(col + 2 - (20.0 + t_ms / 1000)) <= 4, (t_ms, col)
+
+
+def _legacy_hotspot(image, width=32, height=24, win_w=4, win_h=1):
+    # the original list-and-max search, widened to any window size
+    cluster_temps = []
+    for row in range(height - win_h):
+        for col in range(width - win_w + 1):
+            cluster_temp = sum(sum(image[(row + r) * width + col:(row + r) * width + col + win_w])
+                               for r in range(win_h)) / (win_w * win_h)
+            cluster_temps.append((cluster_temp, col, row))
+    max_temp, x, y = max(cluster_temps)
+    return [x, y]
+
+
+def _recorded_frames(path, outliers):
+    """!
+    Record subpages of two targets crossing the image, and replay them.
+    @return: The replayed raw images, one per subpage, and the camera.
+    """
+    board = set_board(Board(Scene(22.0, [Target(4.0, speed=3.0),
+                                         Target(28.0, row=6.0, temp=30.0, speed=-2.0)])))
+    board.camera = VirtualMLX90640(board.clock, board.camera.scene, outliers=outliers)
+    board.i2c_devices[1][ADDRESS] = board.camera
+    camera = MLX90640(I2C(1), ADDRESS)
+    camera.setup()
+    camera.refresh_rate = 8
+    recorder = FrameRecorder(camera, path)
+    for _ in range(40):
+        camera.wait_data()
+        camera.read_image()
+    recorder.close()
+
+    replay = ReplayInterface(path, realtime=False)
+    camera = MLX90640(replay, ADDRESS)
+    camera.setup()
+    frames = []
+    while True:
+        frames.append(list(camera.read_image().pix))
+        if not camera.has_data:
+            break
+    replay.close()
+    return frames, camera
+
+
+@pytest.mark.parametrize('win_w, win_h', ((4, 1), (2, 2), (3, 3)))
+def test_sliding_search_matches_legacy_on_replayed_frames(board, win_w, win_h):
+    frames, _ = _recorded_frames('frames.bin', outliers=())
+    assert len(frames) == 40
+    finder = HotspotFinder(32, 24, win_w=win_w, win_h=win_h, rows=23)
+    spots = set()
+    for image in frames:
+        found = finder.find(image)
+        assert found == _legacy_hotspot(image, win_w=win_w, win_h=win_h)
+        spots.add(tuple(found))
+    # the targets moved, so the frames were not all alike
+    assert len(spots) > 5
+
+
+def test_masked_search_matches_legacy_on_cleaned_frames(board):
+    frames, camera = _recorded_frames('frames.bin', outliers=(100, 300))
+    mask = dead_pixel_mask(PixelCalibrationData(camera.load_eeprom()))
+    assert mask[100] and mask[300]
+    finder = HotspotFinder(32, 24, rows=23, mask=mask)
+    fooled = 0
+    for image in frames:
+        found = finder.find(image)
+        cleaned = [finder.value(image, idx) for idx in range(len(image))]
+        assert found == _legacy_hotspot(cleaned)
+        fooled += found != _legacy_hotspot(image)
+    # the stuck pixels drew the unmasked search away in most frames
+    assert fooled > len(frames) // 2
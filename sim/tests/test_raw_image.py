@@ -0,0 +1,60 @@
+"""!
+@file test_raw_image.py
+
+@brief Host test of the I2C traffic of RawImage.read() on a counting bus.
+
+@author Conor Schott, Fermin Moreno, Berent Baysal
+"""
+
+import random
+
+import pytest
+
+from mlx90640.image import (ChessPattern, InterleavedPattern, RawImage,
+                            IMAGE_SIZE, PIX_DATA_ADDRESS)
+from mlx90640.regmap import CameraInterface, REG_SIZE
+
+
+class _CountingBus:
+    """!
+    An I2C bus with the camera's pixel RAM behind it, which counts the
+    transactions made and the bytes moved.
+    """
+
+    def __init__(self, words):
+        self.ram = bytearray(b''.join((w & 0xFFFF).to_bytes(2, 'big') for w in words))
+        self.transactions = 0
+        self.bytes = 0
+
+    def readfrom_mem_into(self, addr, memaddr, buf, addrsize=8):
+        offset = (memaddr - PIX_DATA_ADDRESS) * REG_SIZE
+        assert 0 <= offset and offset + len(buf) <= len(self.ram)
+        buf[:] = self.ram[offset:offset + len(buf)]
+        self.transactions += 1
+        self.bytes += len(buf)
+
+    def readfrom_mem(self, addr, memaddr, nbytes, addrsize=8):
+        buf = bytearray(nbytes)
+        self.readfrom_mem_into(addr, memaddr, buf, addrsize)
+        return bytes(buf)
+
+
+@pytest.mark.parametrize('pattern', (ChessPattern, InterleavedPattern),
+                         ids=('chess', 'interleaved'))
+def test_one_burst_per_subpage(pattern):
+    rng = random.Random(pattern.pattern_id)
+    words = [rng.randint(-32768, 32767) for _ in range(IMAGE_SIZE)]
+    bus = _CountingBus(words)
+    iface = CameraInterface(bus, 0x33)
+    raw = RawImage()
+    for subpage in pattern.subpages:
+        before = list(raw.pix)
+        bus.transactions = bus.bytes = 0
+        raw.read(iface, subpage.sp_range())
+        # a single burst of the pixel RAM, instead of one read per pixel
+        assert bus.transactions == 1
+        assert bus.bytes == IMAGE_SIZE * REG_SIZE
+        wanted = set(subpage.sp_range())
+        for idx in range(IMAGE_SIZE):
+            assert raw.pix[idx] == (words[idx] if idx in wanted else before[idx])
+    assert list(raw.pix) == words
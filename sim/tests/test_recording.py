@@ -0,0 +1,50 @@
+"""!
+@file test_recording.py
+
+@brief Host tests of the recording file format.
+
+@author Conor Schott, Fermin Moreno, Berent Baysal
+"""
+
+import struct
+
+from machine import I2C
+
+from mlx90640 import MLX90640
+from mlx90640.recording import (FrameRecorder, ReplayInterface, RECORDING_HEADER,
+                                RECORD_HEADER, AUX_SIZE, SUBPAGE_SIZE)
+from mlx90640.regmap import EEPROM_SIZE, REG_SIZE
+
+## Subpages recorded
+SUBPAGES = 6
+
+
+def test_pixels_are_recorded_big_endian(board):
+    camera = MLX90640(I2C(1), 0x33)
+    camera.setup()
+    recorder = FrameRecorder(camera, 'frames.bin')
+    recorded = []
+    for _ in range(SUBPAGES):
+        camera.wait_data()
+        camera.read_image()
+        recorded.append([camera.raw.pix[idx] for idx in camera.last_read.sp_range()])
+    recorder.close()
+
+    with open('frames.bin', 'rb') as f:
+        data = f.read()
+    start = struct.calcsize(RECORDING_HEADER) + EEPROM_SIZE * REG_SIZE
+    size = struct.calcsize(RECORD_HEADER) + (AUX_SIZE + SUBPAGE_SIZE) * REG_SIZE
+    assert len(data) == start + SUBPAGES * size
+    for record, pix in zip(range(start, len(data), size), recorded):
+        pos = record + size - SUBPAGE_SIZE * REG_SIZE
+        assert list(struct.unpack_from('>%dh' % SUBPAGE_SIZE, data, pos)) == pix
+
+    # and the replay serves the same raw pixels
+    replay = ReplayInterface('frames.bin', realtime=False)
+    camera = MLX90640(replay, 0x33)
+    camera.setup()
+    for pix in recorded:
+        camera.read_image()
+        assert [camera.raw.pix[idx] for idx in camera.last_read.sp_range()] == pix
+    assert replay.count == SUBPAGES
+    replay.close()
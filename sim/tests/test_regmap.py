@@ -0,0 +1,162 @@
+"""!
+@file test_regmap.py
+
+@brief Host tests of the register map's shadow copies.
+
+@author Conor Schott, Fermin Moreno, Berent Baysal
+"""
+
+import pytest
+import utime
+from machine import I2C
+
+from mlx90640 import MLX90640
+from mlx90640.regmap import (CACHEABLE_REGISTERS, EEPROM_MAP, REG_SIZE, REGISTER_MAP,
+                             RegisterMap)
+
+STATUS_REG = 0x8000
+CONTROL_REG = 0x800D
+
+
+class _FlakyInterface:
+    """!
+    Camera registers in memory, whose next write can be made to fail as a
+    NAKed I2C write would.
+    """
+
+    def __init__(self):
+        self.words = {CONTROL_REG: 0x1901}
+        self.fail_next_write = False
+        self.reads = 0
+
+    def read_into(self, mem_addr, buf):
+        self.reads += 1
+        buf[:] = self.words.get(mem_addr, 0).to_bytes(REG_SIZE, 'big')
+
+    def write(self, mem_addr, buf):
+        if self.fail_next_write:
+            self.fail_next_write = False
+            raise OSError(5)
+        self.words[mem_addr] = buf[0] << 8 | buf[1]
+
+
+def test_failed_write_leaves_shadow_alone():
+    iface = _FlakyInterface()
+    registers = RegisterMap(iface, REGISTER_MAP, cached=CACHEABLE_REGISTERS)
+    assert registers['refresh_rate'] == 2
+
+    iface.fail_next_write = True
+    with pytest.raises(OSError):
+        registers['refresh_rate'] = 5
+    # the shadow still matches the camera, which never saw the write
+    reads = iface.reads
+    assert registers['refresh_rate'] == 2
+    assert iface.reads == reads
+
+    registers['refresh_rate'] = 5
+    assert iface.words[CONTROL_REG] == 0x1A81
+    assert registers['refresh_rate'] == 5
+    assert iface.reads == reads
+
+
+def test_shadow_counts_hits_and_misses():
+    iface = _FlakyInterface()
+    registers = RegisterMap(iface, REGISTER_MAP, cached=CACHEABLE_REGISTERS)
+    for _ in range(3):
+        assert registers['refresh_rate'] == 2
+    assert registers.misses == {CONTROL_REG: 1}
+    assert registers.hits == {CONTROL_REG: 2}
+    assert iface.reads == 1
+
+    # a write from elsewhere shows only once the shadow is dropped
+    iface.words[CONTROL_REG] = 0x1A81
+    assert registers['refresh_rate'] == 2
+    registers.invalidate(CONTROL_REG)
+    assert registers['refresh_rate'] == 5
+    assert registers.misses[CONTROL_REG] == 2
+
+    iface.words[CONTROL_REG] = 0x1901
+    registers.invalidate()
+    assert registers['refresh_rate'] == 2
+    assert iface.reads == 3
+
+
+def test_status_is_never_shadowed():
+    iface = _FlakyInterface()
+    iface.words[STATUS_REG] = 0x0009
+    registers = RegisterMap(iface, REGISTER_MAP, cached=CACHEABLE_REGISTERS)
+    assert registers['data_available'] == 1
+    # the camera sets the flag again when the next subpage is ready
+    registers['data_available'] = 0
+    assert iface.words[STATUS_REG] == 0x0001
+    assert registers['data_available'] == 0
+    iface.words[STATUS_REG] = 0x0008
+    assert registers['data_available'] == 1
+    assert STATUS_REG not in registers.hits
+    assert iface.reads == 4
+
+
+def test_register_is_read_and_cleared_once():
+    iface = _FlakyInterface()
+    iface.words[STATUS_REG] = 0x0019
+    registers = RegisterMap(iface, REGISTER_MAP, cached=CACHEABLE_REGISTERS)
+    status = registers.read_register('data_available')
+    assert (status['data_available'], status['last_subpage']) == (1, 1)
+    status['data_available'] = 0
+    registers.write_register(status)
+    assert iface.words[STATUS_REG] == 0x0011
+    assert iface.reads == 1
+
+
+class _Words:
+    """!
+    Memory read as big-endian words, as the camera answers.
+    """
+
+    def __init__(self, words):
+        self.words = words
+
+    def read_into(self, mem_addr, buf):
+        buf[:] = self.words.get(mem_addr, 0).to_bytes(REG_SIZE, 'big')
+
+
+def test_byte_fields_follow_the_datasheet():
+    # words whose two bytes differ, so a swap shows; the datasheet puts the
+    # first parameter named for each word in bits 15..8
+    eeprom = RegisterMap(_Words({
+        0x2433: 0x9D68,     # K_Vdd -99, Vdd_25 104
+        0x2436: 0x5354,     # KtaRoCo 83, KtaReCo 84
+        0x2437: 0xF10C,     # KtaRoCe -15, KtaReCe 12
+        0x243B: 0x0AF6,     # KvCP 10, KtaCP -10
+        0x243C: 0xF020,     # KsTa -16, TGC 32
+        0x243D: 0x9794,     # KsTo2 -105, KsTo1 -108
+        0x243E: 0x8E9A,     # KsTo4 -114, KsTo3 -102
+    }), EEPROM_MAP, readonly=True)
+    assert (eeprom['k_vdd'], eeprom['vdd_25']) == (-99, 104)
+    assert (eeprom['kta_avg_ro_co'], eeprom['kta_avg_re_co']) == (83, 84)
+    assert (eeprom['kta_avg_ro_ce'], eeprom['kta_avg_re_ce']) == (-15, 12)
+    assert (eeprom['kv_cp'], eeprom['kta_cp']) == (10, -10)
+    assert (eeprom['ksta'], eeprom['tgc']) == (-16, 32)
+    assert (eeprom['ksto_2'], eeprom['ksto_1']) == (-105, -108)
+    assert (eeprom['ksto_4'], eeprom['ksto_3']) == (-114, -102)
+
+    registers = RegisterMap(_Words({0x8010: 0xBE33}), REGISTER_MAP, readonly=True)
+    assert registers['i2c_address'] == 0x33
+
+
+def test_read_image_reads_the_status_once(board):
+    camera = MLX90640(I2C(1), 0x33)
+    camera.setup()
+    utime.sleep_ms(600)
+    status_reads = []
+    read_into = camera.iface.read_into
+
+    def counting_read_into(mem_addr, buf):
+        if mem_addr == STATUS_REG:
+            status_reads.append(mem_addr)
+        read_into(mem_addr, buf)
+
+    camera.iface.read_into = counting_read_into
+    camera.read_image()
+    assert len(status_reads) == 1
+    assert not camera.has_data
@@ -0,0 +1,69 @@
+"""!
+@file test_struct_proto.py
+
+@brief Host tests that the fast StructProto decoders agree with Struct.
+
+@details
+@c StructProto.get() and @c StructProto.decode() pull fields out of
+big-endian words with their own shifts and masks, while @c Struct reads the
+same fields through @c uctypes. Every field of the register, EEPROM and
+calibration layouts is decoded both ways from random words.
+
+@author Conor Schott, Fermin Moreno, Berent Baysal
+"""
+
+import random
+from array import array
+
+import pytest
+
+from mlx90640.calibration import CC_PROTO, PIX_CALIB_PROTO
+from mlx90640.regmap import EEPROM_MAP, REGISTER_MAP
+from mlx90640.utils import Struct, StructProto
+
+## Random words tried per layout
+WORDS = 2000
+
+
+def _protos():
+    protos = [('CC_PROTO', CC_PROTO), ('PIX_CALIB_PROTO', PIX_CALIB_PROTO)]
+    for map_name, register_map in (('REGISTER_MAP', REGISTER_MAP),
+                                   ('EEPROM_MAP', EEPROM_MAP)):
+        for address, fields in register_map.items():
+            if not isinstance(fields, tuple) or not isinstance(fields[0], tuple):
+                fields = (fields,)
+            protos.append(('%s[0x%04X]' % (map_name, address), StructProto(fields)))
+    return protos
+
+
+PROTOS = _protos()
+
+
+def _random_words(seed, count):
+    rng = random.Random(seed)
+    # the corner words catch sign and mask mistakes random words may miss
+    words = [0x0000, 0xFFFF, 0x8000, 0x7FFF, 0x5555, 0xAAAA]
+    words += [rng.getrandbits(16) for _ in range(count)]
+    return bytearray(b''.join(word.to_bytes(2, 'big') for word in words))
+
+
+@pytest.mark.parametrize('name, proto', PROTOS, ids=[name for name, _ in PROTOS])
+def test_get_matches_struct(name, proto):
+    buf = _random_words(name, WORDS)
+    for offset in range(0, len(buf), 2):
+        word = buf[offset:offset + 2]
+        expected = Struct(word, proto)
+        for field in proto.layout:
+            assert proto.get(buf, field, offset) == expected[field], \
+                (field, hex(word[0] << 8 | word[1]))
+
+
+@pytest.mark.parametrize('name, proto', PROTOS, ids=[name for name, _ in PROTOS])
+def test_decode_matches_struct(name, proto):
+    buf = _random_words(name, WORDS)
+    for field in proto.layout:
+        # start part way into the buffer, as when decoding part of a block
+        out = proto.decode(buf, field, array('l', (0 for _ in range(WORDS))), offset=4)
+        for idx, value in enumerate(out):
+            offset = 4 + 2 * idx
+            assert value == Struct(buf[offset:offset + 2], proto)[field], (field, idx)
@@ -0,0 +1,24 @@
+"""!
+@file test_telemetry.py
+
+@brief Host tests of the control loop telemetry dump.
+
+@author Conor Schott, Fermin Moreno, Berent Baysal
+"""
+
+import io
+
+from telemetry import Telemetry
+
+
+def test_dump_reports_dropped_samples_on_its_stream(capsys):
+    log = Telemetry(4)
+    for n in range(6):
+        log.record(n * 10000, n, -n, 50)
+    stream = io.StringIO()
+    log.dump(stream)
+    lines = stream.getvalue().splitlines()
+    assert lines[0] == 'time_ms,position,error,output,jitter_us'
+    assert len(lines) == 1 + 4 + 1
+    assert lines[-1] == 'Telemetry: 2 older samples were overwritten'
+    assert capsys.readouterr().out == ''
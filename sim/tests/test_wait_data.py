@@ -0,0 +1,92 @@
+"""!
+@file test_wait_data.py
+
+@brief Host tests of how late the camera waits return, on virtual time.
+
+@details
+The simulated camera measures each subpage at a known time on the
+VirtualClock, so the overshoot of a wait is the time from that subpage
+arriving to the wait returning. Each wait is followed by reading the
+subpage, as a program would.
+
+@author Conor Schott, Fermin Moreno, Berent Baysal
+"""
+
+import pytest
+import utime
+from machine import I2C
+
+from mlx90640 import MLX90640
+
+## Subpages waited for per measurement
+WAITS = 40
+
+
+def _camera(freq):
+    camera = MLX90640(I2C(1), 0x33)
+    camera.setup()
+    camera.refresh_rate = freq
+    return camera
+
+
+def _overshoots_us(board, camera, wait, waits=WAITS):
+    """!
+    Time from each subpage arriving to @c wait() returning.
+    """
+    sim = board.camera
+    late = []
+    for _ in range(waits):
+        wait()
+        late.append(board.clock.now_us - (sim._start_us + sim.subpages * sim.period_us))
+        camera.read_image()
+    return late
+
+
+def _poll_50ms(camera):
+    # how the camera was waited for before wait_data()
+    while not camera.has_data:
+        utime.sleep_ms(50)
+
+
+def _run_gen(camera):
+    # a scheduler which runs other tasks for 1 ms between runs of this one
+    for _ in camera.wait_data_gen():
+        utime.sleep_ms(1)
+
+
+def _mean(values):
+    return sum(values) / len(values)
+
+
+@pytest.mark.parametrize('freq', (2, 8, 32))
+def test_average_overshoot(board, freq):
+    results = {}
+    for name, wait in (('50 ms polling', _poll_50ms),
+                       ('wait_data', MLX90640.wait_data),
+                       ('wait_data_gen', _run_gen)):
+        camera = _camera(freq)
+        # the first wait has no arrival to predict from
+        late = _overshoots_us(board, camera, lambda: wait(camera), WAITS + 1)[1:]
+        results[name] = _mean(late)
+    print(f'{freq} Hz average overshoot:',
+          ', '.join(f'{name} {us / 1000:.2f} ms' for name, us in results.items()))
+    # one status poll interval and the status read itself
+    assert results['wait_data'] <= 1500
+    assert results['wait_data_gen'] <= 1500
+    if freq <= 8:
+        assert results['wait_data'] < results['50 ms polling'] / 10
+
+
+@pytest.mark.parametrize('wait', (MLX90640.wait_data, _run_gen),
+                         ids=('wait_data', 'wait_data_gen'))
+def test_recovers_after_late_read(board, wait):
+    camera = _camera(8)
+    _overshoots_us(board, camera, lambda: wait(camera), 2)
+    # the program is busy when a subpage arrives, and reads it 40 ms late
+    wait(camera)
+    utime.sleep_ms(40)
+    camera.read_image()
+    late = _overshoots_us(board, camera, lambda: wait(camera))
+    print('overshoot after a late read, ms:', [round(us / 1000) for us in late[:8]])
+    assert max(late[4:]) <= 1500
+    assert _mean(late) <= 4000
@@ -3,7 +3,13 @@
 @brief Implements functions for controlling a flywheel.
 
 @details
-This module contains functions to start and stop a flywheel motor by controlling a pin on a Pyboard.
+This module contains functions to start and stop a flywheel motor by controlling a pin on a Pyboard,
+and generators which run the flywheel for a time across several scheduler runs instead of sleeping.
+
+The `FlywheelController` class drives the MOSFET with PWM instead, so the flywheels can be
+soft-started, held at a low idle speed, and armed to reach full speed just as the trigger fires.
+PC0 has no timer channel on the Nucleo-L476RG, so by default the PWM is made in software from a
+timer interrupt; a pin and timer channel with hardware PWM can be given instead.
 
 @author
 Author: Conor Schott, Fermin Moreno, Berent Baysal
@@ -17,23 +23,229 @@ Version: 1.0
 """
 
 import pyb
+import utime
+
+## Pin driving the flywheel MOSFET, created the first time it is needed
+_pin = None
+
+def _flywheel_pin():
+    """!
+    Get the flywheel pin, setting it up on first use.
+    """
+    global _pin
+    if _pin is None:
+        _pin = pyb.Pin(pyb.Pin.board.PC0, pyb.Pin.OUT_PP)
+    return _pin
 
 def start_flywheel():
     """!
     Start the flywheel motor.
     """
-    # Initialize the pin for controlling the flywheel
-    pinC0 = pyb.Pin(pyb.Pin.board.PC0, pyb.Pin.OUT_PP)
-
     # Turn on the flywheel
-    pinC0.value(1)
+    _flywheel_pin().value(1)
 
 def stop_flywheel():
     """!
     Stop the flywheel motor.
     """
-    # Initialize the pin for controlling the flywheel
-    pinC0 = pyb.Pin(pyb.Pin.board.PC0, pyb.Pin.OUT_PP)
-    
     # Turn off the flywheel
-    pinC0.value(0)
+    _flywheel_pin().value(0)
+
+def _wait_ms(duration_ms):
+    """!
+    Yield until a time has passed.
+    """
+    start = utime.ticks_ms()
+    while utime.ticks_diff(utime.ticks_ms(), start) < duration_ms:
+        yield
+
+def spin_up(spin_up_ms, ready=None):
+    """!
+    Start the flywheel and wait for it to reach speed, without blocking.
+    Use it from a cotask task as `yield from Flywheel.spin_up(...)`; the
+    flywheel keeps running afterwards until stop_flywheel() is called.
+    @param spin_up_ms: Time the flywheel takes to reach speed.
+    @param ready: Optional share, set to 1 once the flywheel is up to speed.
+    """
+    if ready is not None:
+        ready.put(0)
+    start_flywheel()
+    yield from _wait_ms(spin_up_ms)
+    if ready is not None:
+        ready.put(1)
+
+def run_for(run_ms, done=None):
+    """!
+    Run the flywheel for a set time, without blocking.
+    @param run_ms: Time to run the flywheel for.
+    @param done: Optional share, set to 1 once the flywheel has stopped.
+    """
+    if done is not None:
+        done.put(0)
+    start_flywheel()
+    yield from _wait_ms(run_ms)
+    stop_flywheel()
+    if done is not None:
+        done.put(1)
+
+
+# Flywheel controller states
+F_OFF = 0
+F_IDLE = 1
+F_ARMED = 2
+F_SPIN_UP = 3
+F_FULL = 4
+
+class FlywheelController:
+    """!
+    PWM speed control of the flywheel MOSFET, with soft start, idle and arming.
+    """
+
+    def __init__(self, pin=pyb.Pin.board.PC0, timer=6, channel=None, freq=2000,
+                 steps=20, idle_duty=0, spin_up_ms=2000, hold_ms=None):
+        """!
+        Set up the pin and timer once.
+        @param pin: Pin driving the MOSFET gate.
+        @param timer: Timer number. Without @c channel it only has to interrupt,
+               so a basic timer such as 6 or 7 is enough.
+        @param channel: Timer channel of @c pin for hardware PWM; if None the
+               PWM is made in software by the timer interrupt.
+        @param freq: PWM frequency for hardware PWM, or the interrupt rate for
+               software PWM, whose PWM frequency is then @c freq / @c steps.
+        @param steps: Duty cycle steps per software PWM period.
+        @param idle_duty: Duty cycle in percent held while waiting to be armed.
+        @param spin_up_ms: Time for the flywheels to reach full speed from idle.
+               The duty cycle is ramped up over this time for a soft start.
+        @param hold_ms: Time the flywheels stay at full speed after the
+               expected shot before dropping back to idle, after which they
+               must be armed again; None (default) keeps them at full speed
+               until @c idle() or @c stop(), however late the shot is.
+        """
+        self.steps = steps
+        self.idle_duty = idle_duty
+        self.spin_up_ms = spin_up_ms
+        self.hold_ms = hold_ms
+        ## Controller state, one of the @c F_ values
+        self.state = F_OFF
+        ## Duty cycle being applied, in percent
+        self.duty = 0
+        self._ramp_from = 0
+        self._start_at = 0
+        self._fire_at = 0
+        self._level = 0
+        self._count = 0
+        if channel is None:
+            self._pin = pyb.Pin(pin, pyb.Pin.OUT_PP)
+            self._pin.value(0)
+            self._channel = None
+            self._timer = pyb.Timer(timer, freq=freq)
+            self._timer.callback(self._tick)
+        else:
+            self._pin = pyb.Pin(pin)
+            self._timer = pyb.Timer(timer, freq=freq)
+            self._channel = self._timer.channel(channel, pyb.Timer.PWM, pin=self._pin,
+                                                pulse_width_percent=0)
+
+    def _tick(self, timer):
+        """!
+        Timer interrupt making the software PWM; does not allocate.
+        """
+        count = self._count + 1
+        if count >= self.steps:
+            count = 0
+        self._count = count
+        self._pin.value(count < self._level)
+
+    def set_duty(self, duty):
+        """!
+        Set the MOSFET duty cycle directly.
+        @param duty: Duty cycle in percent, clipped to 0 to 100.
+        """
+        if duty > 100:
+            duty = 100
+        elif duty < 0:
+            duty = 0
+        self.duty = duty
+        if self._channel is None:
+            self._level = (duty * self.steps + 50) // 100
+        else:
+            self._channel.pulse_width_percent(duty)
+
+    def idle(self):
+        """!
+        Hold the flywheels at the idle duty cycle until armed.
+        """
+        self.state = F_IDLE
+        self.set_duty(self.idle_duty)
+
+    def stop(self):
+        """!
+        Turn the flywheels off.
+        """
+        self.state = F_OFF
+        self.set_duty(0)
+
+    def arm(self, fire_at):
+        """!
+        Get the flywheels to full speed by a given time.
+        @details Can be called again as the expected time of the shot changes;
+                 the spin up starts @c spin_up_ms before it.
+        @param fire_at: Expected time of the shot, from @c utime.ticks_ms().
+        """
+        self._fire_at = fire_at
+        if self.state == F_SPIN_UP or self.state == F_FULL:
+            return
+        self._start_at = utime.ticks_add(fire_at, -self.spin_up_ms)
+        self.state = F_ARMED
+
+    @property
+    def ready(self):
+        """!
+        Whether the flywheels are at full speed.
+        """
+        return self.state == F_FULL
+
+    def update(self, now=None):
+        """!
+        Move the duty cycle along; call this regularly, e.g. from a task.
+        @param now: Current time from @c utime.ticks_ms(), by default now.
+        @return: The controller state.
+        """
+        if now is None:
+            now = utime.ticks_ms()
+        state = self.state
+        if state == F_ARMED:
+            if utime.ticks_diff(now, self._start_at) >= 0:
+                self._ramp_from = self.duty
+                self._start_at = now
+                self.state = F_SPIN_UP
+        elif state == F_SPIN_UP:
+            elapsed = utime.ticks_diff(now, self._start_at)
+            if elapsed >= self.spin_up_ms:
+                self.set_duty(100)
+                self.state = F_FULL
+            else:
+                from_duty = self._ramp_from
+                self.set_duty(from_duty + (100 - from_duty) * elapsed // self.spin_up_ms)
+        elif state == F_FULL and self.hold_ms is not None:
+            if utime.ticks_diff(now, self._fire_at) > self.hold_ms:
+                self.idle()
+        return self.state
+
+    def task(self):
+        """!
+        Generator which runs @c update(), for use as a cotask task function.
+        """
+        while True:
+            self.update()
+            yield
+
+    def deinit(self):
+        """!
+        Turn the flywheels off and release the timer.
+        """
+        self.stop()
+        self._timer.callback(None)
+        self._timer.deinit()
+        self._pin.init(pyb.Pin.OUT_PP)
+        self._pin.value(0)
@@ -20,67 +20,125 @@ Dependencies:
 - pyb
 - encoder_reader
 - motor_control
+- control_loop
 """
 
 import utime
 import pyb
 import encoder_reader
 import motor_control
+import control_loop
+
+## Largest actuation signal, matching the duty cycle range of MotorDriver
+OUTPUT_LIMIT = 100
 
 class ClosedLoopController:
     """!
     Implements a ClosedLoopController class for controlling a system using closed-loop feedback.
+
+    @details The gains are in duty cycle percent per encoder count, per
+    count-second and per count/second. The time step is measured with
+    @c utime.ticks_us on every run. The derivative is taken on the
+    measurement, so a setpoint change gives no kick, and it is low-pass
+    filtered. The output is saturated to +/- @c OUTPUT_LIMIT. The integrator
+    stops integrating while the output is saturated in the direction of the
+    error, so it does not wind up during long moves.
     """
 
-    def __init__(self, Kp, Ki, Kd, setpoint):
+    def __init__(self, Kp, Ki, Kd, setpoint, d_filter_s=0.02, output_limit=OUTPUT_LIMIT,
+                 telemetry=None, Kv=0, Ka=0, Ks=0):
         """!
         Initializes the ClosedLoopController object with the provided parameters.
         @param Kp: Proportional gain constant
         @param Ki: Integral gain constant
         @param Kd: Derivative gain constant
         @param setpoint: Desired setpoint for the system
+        @param d_filter_s: Time constant of the derivative low-pass filter in seconds
+        @param output_limit: Largest magnitude of the actuation signal
+        @param telemetry: Optional telemetry.Telemetry recorder which each run is logged to
+        @param Kv: Velocity feed-forward gain, in duty cycle percent per count/second
+        @param Ka: Acceleration feed-forward gain, in duty cycle percent per count/second^2
+        @param Ks: Friction feed-forward, in duty cycle percent added in the direction of the
+               reference velocity
         """
         self.Kp = Kp
         self.Ki = Ki
         self.Kd = Kd
+        self.Kv = Kv
+        self.Ka = Ka
+        self.Ks = Ks
         self.setpoint = setpoint
+        self.d_filter_s = d_filter_s
+        self.output_limit = output_limit
         self.measured_output = 0
         self.integral = 0
-        self.prev_error = 0
-        self.time_buffer = []
-        self.position_buffer = []
-        self.start_time = None
-        self.current_time = 0
-        self.previous_time = 0
+        self.derivative = 0
+        self.prev_measurement = None
+        self.previous_time = None
         self.delta_time = 0
-        
-    def run(self, measured_output):
+        self.telemetry = telemetry
+
+    def reset(self):
+        """!
+        Clears the integrator and derivative history, e.g. after the motor has been stopped.
+        """
+        self.integral = 0
+        self.derivative = 0
+        self.prev_measurement = None
+        self.previous_time = None
+
+    def run(self, measured_output, now_us=None, velocity=0, acceleration=0):
         """!
         Runs the closed-loop control algorithm to calculate the actuation signal.
         @param measured_output: Measured output from the system
-        @return: Actuation signal calculated by the controller
+        @param now_us: Time of the measurement from @c utime.ticks_us(), by default now
+        @param velocity: Reference velocity for feed-forward, e.g. from a trajectory.MotionProfile
+        @param acceleration: Reference acceleration for feed-forward
+        @return: Actuation signal calculated by the controller, within +/- output_limit
         """
-        if self.start_time is None:
-            self.start_time = utime.ticks_ms()
-            
-        self.delta_time = self.current_time - self.previous_time
-        self.previous_time = self.current_time
-        self.measured_output = measured_output
-        error = self.setpoint - self.measured_output
-        self.integral += error * self.current_time
-        if self.delta_time == 0:
-            derivative = 0
+        if now_us is None:
+            now_us = utime.ticks_us()
+        if self.previous_time is None:
+            dt = 0
         else:
-            derivative = (error - self.prev_error) / self.delta_time
-        
-        actuation_signal = self.Kp * error + self.Ki * self.integral + self.Kd * derivative
+            dt = utime.ticks_diff(now_us, self.previous_time) / 1000000
+        self.previous_time = now_us
+        self.delta_time = dt
 
-        if len(self.time_buffer) < 200:
-            self.current_time = (utime.ticks_ms() - self.start_time) // 1000
-            self.time_buffer.append(self.current_time)
-            self.position_buffer.append(self.measured_output)
+        self.measured_output = measured_output
+        error = self.setpoint - measured_output
+
+        # derivative of the measurement, through a first order low-pass filter
+        if dt > 0 and self.prev_measurement is not None:
+            raw = (self.prev_measurement - measured_output) / dt
+            self.derivative += (raw - self.derivative) * dt / (self.d_filter_s + dt)
+        self.prev_measurement = measured_output
+
+        limit = self.output_limit
+        # with a reference velocity the derivative acts on the velocity error
+        unclamped = (self.Kp * error + self.Kd * (velocity + self.derivative)
+                     + self.Kv * velocity + self.Ka * acceleration)
+        if velocity > 0:
+            unclamped += self.Ks
+        elif velocity < 0:
+            unclamped -= self.Ks
+        integral = self.integral + error * dt
+        actuation_signal = unclamped + self.Ki * integral
+        # clamping anti-windup: only integrate while that does not push
+        # further into saturation
+        if actuation_signal > limit:
+            if error < 0:
+                self.integral = integral
+            actuation_signal = limit
+        elif actuation_signal < -limit:
+            if error > 0:
+                self.integral = integral
+            actuation_signal = -limit
+        else:
+            self.integral = integral
 
-        self.prev_error = error
+        if self.telemetry is not None:
+            self.telemetry.record(now_us, measured_output, error, actuation_signal)
 
         return actuation_signal
 
@@ -90,8 +148,15 @@ class ClosedLoopController:
         @param setpoint: Desired setpoint for the system
         """
         self.setpoint = setpoint
-        self.integral = 0
-        self.prev_error = 0
+        self.reset()
+
+    def track(self, setpoint):
+        """!
+        Moves the setpoint without resetting the integrator, for following a
+        moving target.
+        @param setpoint: New setpoint for the system
+        """
+        self.setpoint = setpoint
 
     def set_Kp(self, Kp):
         """!
@@ -118,14 +183,18 @@ if __name__ == '__main__':
     enc = encoder_reader.Encoder(8, pyb.Pin.board.PC6, pyb.Pin.board.PC7)
     moe = motor_control.MotorDriver(pyb.Pin.board.PC1, pyb.Pin.board.PA0, pyb.Pin.board.PA1, 5)
 
-    close = ClosedLoopController(Kp=0.17, Ki=0.01, Kd=0, setpoint=0)
+    close = ClosedLoopController(Kp=0.17, Ki=0.5, Kd=0.008, setpoint=0)
 
     target_setpoint = -26690
-    close.set_setpoint(target_setpoint)
-
-    while True:
-        current_position = enc.read()
-        output = close.run(current_position)
-        moe.set_duty_cycle(output)
-        print(current_position)
-        utime.sleep_ms(10)
+
+    # the controller runs from a timer interrupt; this loop only prints
+    loop = control_loop.ControlLoop(enc, moe, close, freq=500)
+    loop.set_setpoint(target_setpoint, reset=True)
+    loop.start()
+    try:
+        while True:
+            print(loop.position)
+            utime.sleep_ms(100)
+    except KeyboardInterrupt:
+        loop.stop()
+        loop.report()
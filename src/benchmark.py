@@ -0,0 +1,376 @@
+"""!
+@file benchmark.py
+
+@brief Micro-benchmarks for the camera and control code.
+
+@details
+Each benchmark times one piece of the targeting pipeline with
+@c utime.ticks_us and prints the average cost per call. Run this file on the
+board to compare changes without a live target. On a PC, run it under the
+simulator with @c "python sim/run.py src/benchmark.py --cpu-scale 30"; the
+CPU scale turns host run time into rough board timings, and the closed loop
+benchmarks give the same results as on the board. Heap use is only
+measured on the board, as the simulator has no MicroPython heap.
+
+@author Conor Schott, Fermin Moreno, Berent Baysal
+"""
+
+import sys
+import utime
+from array import array
+from mlx90640.calibration import IMAGE_SIZE
+from mlx90640.image import ChessPattern, InterleavedPattern
+from hotspot import HotspotFinder
+
+## Whether gc.mem_free() reports a real heap, which it does only on the board
+HEAP_MEASURED = sys.implementation.name == 'micropython'
+
+
+def time_us(func, runs=20):
+    """!
+    Time a function call.
+    @param func: Function taking no arguments.
+    @param runs: Number of calls to average over.
+    @return: Average time per call in microseconds.
+    """
+    start = utime.ticks_us()
+    for _ in range(runs):
+        func()
+    return utime.ticks_diff(utime.ticks_us(), start) / runs
+
+
+def bench_sp_range(pattern=ChessPattern, runs=20):
+    """!
+    Compare per-frame subpage indexing with a generator against the
+    precomputed index tables.
+    """
+    def legacy():
+        for sp_id in (0, 1):
+            for idx in (i for i, sp in enumerate(pattern.iter_sp()) if sp == sp_id):
+                pass
+
+    def tables():
+        for sp_id in (0, 1):
+            for idx in pattern.subpages[sp_id].sp_range():
+                pass
+
+    print(f"sp_range {pattern.__name__}: generator {time_us(legacy, runs):.0f} us, "
+          f"tables {time_us(tables, runs):.0f} us per frame")
+
+
+def _legacy_hotspot(image, width=32, height=24):
+    """!
+    The original list-and-max 1x4 cluster search, kept as a reference.
+    """
+    cluster_temps = []
+    for row in range(height - 1):
+        for col in range(width - 3):
+            cluster_temp = sum(image[row * width + col: row * width + col + 4]) / 4
+            cluster_temps.append((cluster_temp, col, row))
+    max_temp, x, y = max(cluster_temps)
+    return [x, y]
+
+
+def bench_hotspot(image=None, runs=5):
+    """!
+    Compare the original hotspot search with the sliding-window one, with
+    and without a bad-pixel mask, and check that they pick the same cluster.
+    The host tests check the same on replayed camera frames.
+    """
+    if image is None:
+        image = array('h', ((idx * 7919) % 251 for idx in range(IMAGE_SIZE)))
+    finder = HotspotFinder(32, 24, win_w=4, win_h=1, rows=23)
+    masked = HotspotFinder(32, 24, win_w=4, win_h=1, rows=23, mask=bytearray(IMAGE_SIZE))
+    legacy = _legacy_hotspot(image)
+    found = finder.find(image)
+    print(f"hotspot: legacy {time_us(lambda: _legacy_hotspot(image), runs):.0f} us, "
+          f"sliding {time_us(lambda: finder.find(image), runs):.0f} us, "
+          f"masked {time_us(lambda: masked.find(image), runs):.0f} us, "
+          f"match {legacy == found == masked.find(image)}")
+
+
+def bench_calibration(camera, cache_path='calib.bin'):
+    """!
+    Time building the camera calibration from the EEPROM, and again from the
+    cached tables. Any cache left by an earlier run is removed first.
+    @param camera: An MLX90640 object.
+    @param cache_path: File used for the calibration cache.
+    """
+    import uos
+    from mlx90640.calibration import CameraCalibration
+    try:
+        # the cold run must build the tables, not load them from last time
+        uos.remove(cache_path)
+    except OSError:
+        pass
+    for label in ('cold', 'warm'):
+        start = utime.ticks_ms()
+        snapshot = camera.load_eeprom()
+        calib = CameraCalibration(snapshot, camera.eeprom, cache_path=cache_path)
+        elapsed = utime.ticks_diff(utime.ticks_ms(), start)
+        print(f"calibration {label}: {elapsed} ms, from cache {calib.from_cache}")
+
+
+def bench_fixed_point(camera, runs=5):
+    """!
+    Compare the fixed-point pixel compensation with the float reference on
+    a live frame, reporting the largest error and the time per frame.
+    @param camera: An MLX90640 object which has been set up with a calibration.
+    """
+    from mlx90640.image import FixedPointImage
+    fixed = FixedPointImage(camera.calib, camera.get_pattern())
+    camera.wait_data()
+    camera.read_image()
+    raw = camera.raw
+    state = camera.read_state()
+    fixed.calc(raw, state)
+    error = max(abs(fixed.pix[idx] - fixed.reference(raw, state, idx))
+                for idx in range(IMAGE_SIZE))
+    print(f"fixed point: max error {error:.2f} counts, "
+          f"{time_us(lambda: fixed.calc(raw, state), runs):.0f} us per frame")
+
+
+class _MotorPlant:
+    """!
+    Simple model of the panning axis: a first order motor with Coulomb
+    friction, in encoder counts.
+    """
+
+    def __init__(self, gain=200.0, tau_s=0.1, stiction=8.0):
+        """!
+        @param gain: Speed in counts per second per percent duty above stiction.
+        @param tau_s: Mechanical time constant in seconds.
+        @param stiction: Duty cycle in percent needed to start moving.
+        """
+        self.gain = gain
+        self.tau_s = tau_s
+        self.stiction = stiction
+        self.position = 0.0
+        self.speed = 0.0
+
+    def step(self, duty, dt):
+        if duty > 100:
+            duty = 100
+        elif duty < -100:
+            duty = -100
+        if abs(duty) <= self.stiction:
+            drive = 0.0
+        elif duty > 0:
+            drive = duty - self.stiction
+        else:
+            drive = duty + self.stiction
+        self.speed += (self.gain * drive - self.speed) * dt / self.tau_s
+        self.position += self.speed * dt
+        return int(self.position)
+
+
+class _LegacyPID:
+    """!
+    The original controller, which integrated error times the elapsed whole
+    seconds, kept as a reference. Time is passed in rather than read.
+    """
+
+    def __init__(self, Kp, Ki, Kd, setpoint):
+        self.Kp, self.Ki, self.Kd, self.setpoint = Kp, Ki, Kd, setpoint
+        self.integral = 0
+        self.prev_error = 0
+        self.current_time = 0
+        self.previous_time = 0
+
+    def run(self, measured_output, now_us):
+        delta_time = self.current_time - self.previous_time
+        self.previous_time = self.current_time
+        error = self.setpoint - measured_output
+        self.integral += error * self.current_time
+        derivative = 0 if delta_time == 0 else (error - self.prev_error) / delta_time
+        self.current_time = now_us // 1000000
+        self.prev_error = error
+        return self.Kp * error + self.Ki * self.integral + self.Kd * derivative
+
+
+def _step_response(controller, setpoint, period_ms=10, duration_ms=8000, band=5):
+    """!
+    Run a controller against the plant model in simulated time.
+    @return: (settling time in ms or None, overshoot in counts)
+    """
+    plant = _MotorPlant()
+    position = 0
+    settled_at = None
+    overshoot = 0
+    for step in range(duration_ms // period_ms):
+        now_us = step * period_ms * 1000
+        duty = controller.run(position, now_us)
+        position = plant.step(duty, period_ms / 1000)
+        past = (position - setpoint) if setpoint > 0 else (setpoint - position)
+        if past > overshoot:
+            overshoot = past
+        if abs(setpoint - position) <= band:
+            if settled_at is None:
+                settled_at = (step + 1) * period_ms
+        else:
+            settled_at = None
+    return settled_at, overshoot
+
+
+def bench_pid(gains=(0.17, 0.5, 0.008), setpoint=-26690):
+    """!
+    Compare the step response of the original and current PID controllers on
+    a simulated motor with the same gains, so only the controllers differ,
+    and time one controller run.
+    """
+    from PID_Closed_Loop import ClosedLoopController
+    for label, controller in (('legacy', _LegacyPID(*gains, setpoint)),
+                              ('current', ClosedLoopController(*gains, setpoint))):
+        settled, overshoot = _step_response(controller, setpoint)
+        print(f"pid {label}: settled {settled} ms, overshoot {overshoot} counts")
+    controller = ClosedLoopController(*gains, setpoint)
+    print(f"pid run: {time_us(lambda: controller.run(0), 100):.0f} us")
+
+
+def bench_telemetry(runs=1000):
+    """!
+    Time recording one control loop sample, and on the board check it does
+    not allocate.
+    """
+    import gc
+    from telemetry import Telemetry
+    log = Telemetry(runs)
+    t_us = utime.ticks_us()
+    gc.collect()
+    free = gc.mem_free()
+    for n in range(runs):
+        log.record(t_us, n, -n, 50)
+    used = free - gc.mem_free()
+    log.clear()
+    heap = (f"{used} bytes allocated for {runs} samples" if HEAP_MEASURED
+            else "allocation not measured on the host")
+    print(f"telemetry record: {time_us(lambda: log.record(t_us, 0, 0, 50), runs):.1f} us, "
+          f"{heap}")
+
+
+class _PlantEncoder:
+    """!
+    Encoder and motor driver pair around the plant model, for running a
+    ControlLoop by hand.
+    """
+
+    def __init__(self, plant, period_us):
+        self.plant = plant
+        self.dt = period_us / 1000000
+
+    def read(self, now_us=None):
+        return int(self.plant.position)
+
+    def set_duty_cycle(self, level):
+        self.plant.step(level, self.dt)
+
+
+def bench_profile(setpoint=-26690, retarget=-22000, retarget_ms=800, period_us=2000,
+                  duration_ms=6000, band=5):
+    """!
+    Compare time-to-settle on the plant model with a step setpoint and with a
+    motion profile plus feed-forward, for a plain move and for one whose
+    target changes part way through.
+    """
+    from PID_Closed_Loop import ClosedLoopController
+    from control_loop import ControlLoop
+    from trajectory import MotionProfile
+    for moved in (False, True):
+        for label in ('step', 'profile'):
+            plant = _MotorPlant()
+            hardware = _PlantEncoder(plant, period_us)
+            if label == 'step':
+                controller = ClosedLoopController(0.17, 0.5, 0.008, 0)
+                profile = None
+            else:
+                controller = ClosedLoopController(0.3, 0.5, 0.004, 0,
+                                                  Kv=0.005, Ka=0.0005, Ks=8)
+                profile = MotionProfile(17000, 100000, 2000000, period_us)
+            loop = ControlLoop(hardware, hardware, controller, timer=None, profile=profile)
+            loop.set_setpoint(setpoint)
+            target = setpoint
+            settled_at = None
+            overshoot = 0
+            for step in range(duration_ms * 1000 // period_us):
+                now_us = step * period_us
+                if moved and now_us == retarget_ms * 1000:
+                    target = retarget
+                    loop.set_setpoint(target)
+                loop.step(now_us)
+                position = int(plant.position)
+                past = (position - target) if target > 0 else (target - position)
+                if past > overshoot:
+                    overshoot = past
+                if abs(target - position) <= band:
+                    if settled_at is None:
+                        settled_at = now_us // 1000
+                else:
+                    settled_at = None
+            name = 'moved target' if moved else 'fixed target'
+            print(f"profile {name}, {label}: settled {settled_at} ms, "
+                  f"overshoot {overshoot} counts")
+
+
+def bench_pix_calib(camera):
+    """!
+    Report the time taken to build the per-pixel calibration columns from an
+    EEPROM snapshot, and on the board the heap taken.
+    @param camera: An MLX90640 object.
+    """
+    import gc
+    from mlx90640.calibration import PixelCalibrationData
+    snapshot = camera.load_eeprom()
+    gc.collect()
+    free = gc.mem_free()
+    start = utime.ticks_us()
+    pix_data = PixelCalibrationData(snapshot)
+    elapsed = utime.ticks_diff(utime.ticks_us(), start)
+    used = free - gc.mem_free()
+    gc.collect()
+    kept = free - gc.mem_free()
+    heap = (f"{used} bytes allocated, {kept} bytes kept" if HEAP_MEASURED
+            else "heap not measured on the host")
+    print(f"pixel calibration: {elapsed} us, {heap}, {len(pix_data)} pixels")
+
+
+def bench_replay(path='frames.bin', subpages=100):
+    """!
+    Time the targeting pipeline on recorded frames, played back as fast as
+    they are read: reading a subpage, filling in the other half, finding the
+    hotspot and its centroid, and converting it to an encoder position.
+    @param path: Recording made with recording.FrameRecorder.
+    @param subpages: Most subpages to process; the recording is looped.
+    """
+    from image_to_encoder import MLX_Cam
+    from mlx90640.recording import ReplayInterface
+    replay = ReplayInterface(path, realtime=False, loop=True)
+    cam = MLX_Cam(replay, pattern=replay.pattern)
+    camera = cam._camera
+    count = 0
+    start = utime.ticks_us()
+    while count < subpages and not replay.finished:
+        image = camera.read_image()
+        image.interpolate(replay.pattern, camera.last_read.id, cam._hotspot.mask)
+        hot_spot = cam.find_hotSpot(image)
+        cam.hotspot_to_encoder_position(cam.find_centroid(image, hot_spot), 32)
+        count += 1
+    elapsed = utime.ticks_diff(utime.ticks_us(), start)
+    replay.close()
+    if count:
+        print(f"replay: {count} subpages, {elapsed / count:.0f} us per subpage, "
+              f"{count * 1000000 / max(elapsed, 1):.1f} subpages per second")
+
+
+if __name__ == '__main__':
+    bench_sp_range(ChessPattern)
+    bench_sp_range(InterleavedPattern)
+    bench_hotspot()
+    bench_pid()
+    bench_telemetry()
+    bench_profile()
+    try:
+        open('frames.bin').close()
+    except OSError:
+        pass
+    else:
+        bench_replay()
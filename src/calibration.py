@@ -16,11 +16,13 @@ Date: 3/14/2024
 
 """
 
+import struct as ustruct
 from array import array
 from mlx90640.utils import (
     Struct, 
     StructProto,
     field_desc,
+    array_filled,
 )
 from mlx90640.regmap import REG_SIZE
 
@@ -53,15 +55,14 @@ def _read_cc_iter(iface, base, size):
     @type size: int
     @return: An iterator over the compensation coefficients.
     """
-    buf = bytearray(REG_SIZE)
-    struct = Struct(buf, CC_PROTO)
-    for addr_off in range(size // 4):
-        cc_addr = base + addr_off
-        iface.read_into(cc_addr, buf)
-        yield struct['0']
-        yield struct['1']
-        yield struct['2']
-        yield struct['3']
+    block = bytearray(size // 4 * REG_SIZE)
+    iface.read_into(base, block)
+    get = CC_PROTO.get
+    for offset in range(0, len(block), REG_SIZE):
+        yield get(block, '0', offset)
+        yield get(block, '1', offset)
+        yield get(block, '2', offset)
+        yield get(block, '3', offset)
 
 def read_occ_rows(iface):
     """!
@@ -116,8 +117,14 @@ PIX_CALIB_ADDRESS = const(0x2440)
 class PixelCalibrationData:
     """!
     Class representing pixel calibration data.
+
+    The four bitfields of each pixel's calibration word are decoded once into
+    one typed array per field, which are read as columns, e.g.
+    @c pix_data['offset'][idx].
     """
 
+    FIELDS = (('offset', 'b'), ('alpha', 'b'), ('kta', 'b'), ('outlier', 'B'))
+
     def __init__(self, iface):
         """!
         Initialize the pixel calibration data.
@@ -126,42 +133,47 @@ class PixelCalibrationData:
         @type iface: object
         """
         pix_count = NUM_ROWS * NUM_COLS
-        self._data = bytearray(pix_count * REG_SIZE)
-
-        failed = []
-        buf = bytearray(REG_SIZE)
-        for idx in range(pix_count):
-            offset = idx * REG_SIZE
-            iface.read_into(PIX_CALIB_ADDRESS + offset, buf)
-            if buf != bytes(REG_SIZE):
-                self._data[offset:offset+REG_SIZE] = buf
-            else:
-                failed.append(idx)
-        self.failed = tuple(failed)
+        data = bytearray(pix_count * REG_SIZE)
+        iface.read_into(PIX_CALIB_ADDRESS, data)
 
-    def __len__(self):
-        return len(self._data)//REG_SIZE
+        # a pixel with an all-zero calibration word has failed
+        self.failed = tuple(
+            idx for idx in range(pix_count)
+            if not (data[idx * REG_SIZE] or data[idx * REG_SIZE + 1])
+        )
 
-    def __getitem__(self, idx):
-        offset = idx * REG_SIZE
-        return Struct(self._data[offset:offset+REG_SIZE], PIX_CALIB_PROTO)
+        self._columns = {}
+        for name, typecode in self.FIELDS:
+            column = array_filled(typecode, pix_count)
+            self._columns[name] = PIX_CALIB_PROTO.decode(data, name, column)
 
-    def __iter__(self):
-        for idx in range(len(self)):
-            yield self[idx]
+    def __len__(self):
+        return len(self._columns['outlier'])
+
+    def __getitem__(self, name):
+        return self._columns[name]
 
 TEMP_K = 273.15
 
+CALIB_CACHE_MAGIC = b'MLXC'
+CALIB_CACHE_VERSION = const(1)
+CALIB_CACHE_HEADER = '>4sHL'
+
 class CameraCalibration:
     """!
     Class representing camera calibration.
     """
 
-    def __init__(self, iface, eeprom, *, emissivity=1, use_tgc=False):
+    def __init__(self, iface, eeprom, *, emissivity=1, use_tgc=False,
+                 cache_path=None):
         """!
         Initialize the camera calibration.
 
-        @param iface: The camera interface.
+        The per-pixel tables are the slow part. If @p cache_path is given,
+        they are loaded from that file when it was written for the same
+        EEPROM contents, and otherwise computed and saved there.
+
+        @param iface: The camera interface, or an EepromImage snapshot.
         @type iface: object
         @param eeprom: The EEPROM data.
         @type eeprom: dict
@@ -169,6 +181,9 @@ class CameraCalibration:
         @type emissivity: float
         @param use_tgc: Flag indicating whether TGC (temperature gradient compensation) should be used.
         @type use_tgc: bool
+        @param cache_path: File for cached per-pixel tables; needs @p iface
+            to be an EepromImage, whose checksum keys the cache.
+        @type cache_path: str
         """
         self.emissivity = emissivity
 
@@ -190,13 +205,11 @@ class CameraCalibration:
 
         # pixel calibration data
         self.pix_data = PixelCalibrationData(iface)
-        self.pix_os_ref = array('h', self._calc_pix_os_ref(iface, eeprom))
-        self.outliers = tuple(idx for idx, data in enumerate(self.pix_data) if data['outlier'])
+        self.outliers = tuple(idx for idx, flag in enumerate(self.pix_data['outlier']) if flag)
 
         # IR data compensation
         self.kta_scale_1 = 1 << (eeprom['kta_scale_1'] + 8)
         self.kta_scale_2 = 1 << eeprom['kta_scale_2']
-        self.pix_kta = array('f', self._calc_pix_kta(eeprom))
 
         self.kv_scale = 1 << eeprom['kv_scale']
         self.kv_avg = (
@@ -221,7 +234,6 @@ class CameraCalibration:
             self.kv_cp = eeprom['kv_cp'] / self.kv_scale
 
         # sensitivity normalization
-        self.pix_alpha = array('f', self._calc_pix_alpha_ref(iface, eeprom))
         self.ksta = eeprom['ksta'] / 8192.0
 
         if use_tgc:
@@ -235,7 +247,6 @@ class CameraCalibration:
         self.il_chess_c1 = eeprom['il_chess_c1'] / 16.0
         self.il_chess_c2 = eeprom['il_chess_c2'] / 2.0
         self.il_chess_c3 = eeprom['il_chess_c3'] / 8.0
-        self.il_offset = array('f', self._calc_il_offset())
 
         # temperature calculation
         self.drift = 0  # temperature drift correction
@@ -260,6 +271,87 @@ class CameraCalibration:
         alpha_4 = alpha_3*(1.0 + ksto3*(ct4 - ct3))
         self.alpha_ext = (alpha_1, alpha_2, alpha_3, alpha_4)
 
+        # per-pixel tables
+        pix_count = NUM_ROWS * NUM_COLS
+        self.pix_os_ref = array_filled('h', pix_count)
+        self.pix_kta = array_filled('f', pix_count)
+        self.pix_alpha = array_filled('f', pix_count)
+        self.il_offset = array_filled('f', pix_count)
+
+        key = iface.checksum() if cache_path is not None else None
+        self.from_cache = key is not None and self.load_cache(cache_path, key)
+        if not self.from_cache:
+            self._fill(self.pix_os_ref, self._calc_pix_os_ref(iface, eeprom))
+            self._fill(self.pix_kta, self._calc_pix_kta(eeprom))
+            self._fill(self.pix_alpha, self._calc_pix_alpha_ref(iface, eeprom))
+            self._fill(self.il_offset, self._calc_il_offset())
+            if key is not None:
+                self.save_cache(cache_path, key)
+
+    @staticmethod
+    def _fill(table, values):
+        """!
+        Fill a preallocated table from an iterator.
+        """
+        for idx, value in enumerate(values):
+            table[idx] = value
+
+    def _cache_tables(self):
+        """!
+        The per-pixel tables which are stored in the cache file, in order,
+        each with its typecode.
+        """
+        return (
+            ('h', self.pix_os_ref),
+            ('f', self.pix_kta),
+            ('f', self.pix_alpha),
+            ('f', self.il_offset),
+        )
+
+    def save_cache(self, path, key):
+        """!
+        Save the per-pixel tables to a binary file.
+
+        The file is a header holding a magic number, a format version and
+        the EEPROM checksum, followed by the raw contents of each table.
+
+        @param path: Name of the file to write.
+        @type path: str
+        @param key: EEPROM checksum of the device the tables belong to.
+        @type key: int
+        """
+        with open(path, 'wb') as f:
+            f.write(ustruct.pack(CALIB_CACHE_HEADER, CALIB_CACHE_MAGIC,
+                                 CALIB_CACHE_VERSION, key))
+            for _, table in self._cache_tables():
+                f.write(table)
+
+    def load_cache(self, path, key):
+        """!
+        Load the per-pixel tables from a binary file written by save_cache.
+
+        @param path: Name of the file to read.
+        @type path: str
+        @param key: EEPROM checksum of the device in use.
+        @type key: int
+        @return: True if the tables were loaded, False if the file is
+            missing, damaged or belongs to another device.
+        """
+        try:
+            with open(path, 'rb') as f:
+                header = f.read(ustruct.calcsize(CALIB_CACHE_HEADER))
+                magic, version, file_key = ustruct.unpack(CALIB_CACHE_HEADER, header)
+                if (magic != CALIB_CACHE_MAGIC or version != CALIB_CACHE_VERSION
+                        or file_key != key):
+                    return False
+                for typecode, table in self._cache_tables():
+                    size = len(table) * ustruct.calcsize(typecode)
+                    if f.readinto(table) != size:
+                        return False
+        except (OSError, ValueError):
+            return False
+        return True
+
     def _calc_pix_os_ref(self, iface, eeprom):
         """!
         Calculate the offset reference for pixel calibration.
@@ -277,6 +369,7 @@ class CameraCalibration:
 
         occ_rows = tuple(read_occ_rows(iface))
         occ_cols = tuple(read_occ_cols(iface))
+        offsets = self.pix_data['offset']
 
         for row in range(NUM_ROWS):
             for col in range(NUM_COLS):
@@ -285,7 +378,7 @@ class CameraCalibration:
                     offset_avg
                     + occ_rows[row] * occ_scale_row
                     + occ_cols[col] * occ_scale_col
-                    + self.pix_data[idx]['offset'] * occ_scale_rem
+                    + offsets[idx] * occ_scale_rem
                 )
 
     def _calc_pix_alpha_ref(self, iface, eeprom):
@@ -306,6 +399,7 @@ class CameraCalibration:
 
         acc_rows = tuple(read_acc_rows(iface))
         acc_cols = tuple(read_acc_cols(iface))
+        alphas = self.pix_data['alpha']
 
         for row in range(NUM_ROWS):
             for col in range(NUM_COLS):
@@ -314,7 +408,7 @@ class CameraCalibration:
                     alpha_ref
                     + acc_rows[row] * acc_scale_row
                     + acc_cols[col] * acc_scale_col
-                    + self.pix_data[idx]['alpha'] * acc_scale_rem
+                    + alphas[idx] * acc_scale_rem
                 ) / alpha_scale
 
     def _calc_pix_kta(self, eeprom):
@@ -331,10 +425,11 @@ class CameraCalibration:
             (eeprom['kta_avg_ro_ce'], eeprom['kta_avg_ro_co']),
         )
 
+        kta_ees = self.pix_data['kta']
         for row in range(NUM_ROWS):
             for col in range(NUM_COLS):
                 idx = row * NUM_COLS + col
-                kta_ee = self.pix_data[idx]['kta']
+                kta_ee = kta_ees[idx]
                 kta_rc = kta_avg[row % 2][col % 2]
                 yield (kta_rc + kta_ee * self.kta_scale_2)/self.kta_scale_1
 
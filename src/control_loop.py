@@ -0,0 +1,231 @@
+"""!
+@file control_loop.py
+
+@brief Fixed-rate control loop driven by a hardware timer.
+
+@details
+Pacing a control loop with @c utime.sleep_ms() makes its period the sleep
+plus however long the encoder read, the PID calculation and anything else
+in the loop take. This module runs the encoder read, PID update and PWM
+update from a timer interrupt instead, so the loop runs at a fixed rate
+whatever the rest of the program is doing.
+
+The PID calculation uses floats, which cannot be made inside a hard
+interrupt on the Pyboard, so the interrupt only notes the time and hands
+the step to @c micropython.schedule(). The step then runs between two
+bytecodes of the main program, usually within a few tens of microseconds.
+
+The setpoint is handed in with @c set_setpoint(), or read from a
+@c task_share.Share each step. Both are single assignments, so no lock is
+needed. The loop counts ticks which found the previous step still waiting
+to run, steps which took longer than the period, and keeps a histogram of
+how far each step started from its nominal time.
+
+@author Conor Schott, Fermin Moreno, Berent Baysal
+"""
+
+import micropython
+import pyb
+import utime
+from array import array
+
+## Number of bins in the jitter histogram; the last bin counts everything
+#  past the others
+JITTER_BINS = const(16)
+
+
+class ControlLoop:
+    """!
+    Runs encoder sample, PID update and PWM update at a fixed rate.
+    """
+
+    def __init__(self, encoder, motor, controller, timer=7, freq=1000,
+                 setpoint_share=None, bin_us=50, profile=None):
+        """!
+        Set up the loop; it does not run until @c start() is called.
+        @param encoder: An encoder_reader.Encoder.
+        @param motor: A motor_control.MotorDriver.
+        @param controller: A PID_Closed_Loop.ClosedLoopController.
+        @param timer: Number of a free timer, or a timer object, which
+               interrupts at the loop rate.
+        @param freq: Loop rate in Hz.
+        @param setpoint_share: Optional share whose value is used as the
+               setpoint every step, in place of @c set_setpoint().
+        @param bin_us: Width of each jitter histogram bin in microseconds.
+        @param profile: Optional trajectory.MotionProfile. If given, setpoints
+               become its target, the controller follows the profile's
+               reference and gets its velocity and acceleration as
+               feed-forward.
+        """
+        self.encoder = encoder
+        self.motor = motor
+        self.controller = controller
+        self.freq = freq
+        self.period_us = 1000000 // freq
+        self.setpoint_share = setpoint_share
+        self.profile = profile
+        self.bin_us = bin_us
+        self._timer_id = timer
+        self._timer = None
+        ## Whether the timer is running the loop
+        self.running = False
+        ## Position read by the last step, in encoder counts
+        self.position = 0
+        ## Actuation signal applied by the last step
+        self.output = 0
+        ## Number of steps run
+        self.steps = 0
+        ## Number of ticks skipped because the previous step had not run yet
+        self.missed = 0
+        ## Number of steps which took longer than the period to run
+        self.overruns = 0
+        ## Longest step in microseconds
+        self.max_step_us = 0
+        ## Steps counted by how late they started, in @c bin_us wide bins
+        self.histogram = array('L', (0 for _ in range(JITTER_BINS)))
+        self._setpoint = controller.setpoint
+        self._reset = False
+        self._pending = False
+        self._tick_us = 0
+        # bound once, so the interrupt handler does not allocate
+        self._step_ref = self._scheduled_step
+        self._tick_ref = self._tick
+
+    def set_setpoint(self, setpoint, reset=False):
+        """!
+        Hand a new setpoint to the loop; it is used from the next step.
+        @param setpoint: New setpoint in encoder counts.
+        @param reset: If True the controller's integrator is cleared, as for
+               a new move; otherwise the setpoint is tracked.
+        @exception ValueError The setpoint is None, e.g. an aim point
+                   outside the image, which would fail every step.
+        """
+        if setpoint is None:
+            raise ValueError('setpoint is None')
+        self._setpoint = setpoint
+        if reset:
+            self._reset = True
+
+    @property
+    def target(self):
+        """!
+        The setpoint the loop is moving to, in encoder counts.
+        """
+        share = self.setpoint_share
+        return self._setpoint if share is None else share.get()
+
+    def clear_stats(self):
+        """!
+        Zero the step counters and the jitter histogram.
+        """
+        self.steps = 0
+        self.missed = 0
+        self.overruns = 0
+        self.max_step_us = 0
+        for idx in range(JITTER_BINS):
+            self.histogram[idx] = 0
+
+    def _tick(self, timer):
+        """!
+        Timer interrupt: note the time and schedule a step.
+        """
+        if self._pending:
+            self.missed += 1
+            return
+        self._pending = True
+        self._tick_us = utime.ticks_us()
+        try:
+            micropython.schedule(self._step_ref, 0)
+        except Exception:
+            # the schedule queue is full; with the heap locked the error may
+            # come up as the preallocated MemoryError rather than RuntimeError
+            self._pending = False
+            self.missed += 1
+
+    def _scheduled_step(self, arg):
+        """!
+        Run one step as scheduled by the timer interrupt.
+        """
+        start_us = utime.ticks_us()
+        late = utime.ticks_diff(start_us, self._tick_us)
+        self._pending = False
+        self.step(start_us)
+        bin_idx = late // self.bin_us
+        if bin_idx >= JITTER_BINS:
+            bin_idx = JITTER_BINS - 1
+        self.histogram[bin_idx] += 1
+        took = utime.ticks_diff(utime.ticks_us(), start_us)
+        if took > self.max_step_us:
+            self.max_step_us = took
+        if took > self.period_us:
+            self.overruns += 1
+
+    def step(self, now_us=None):
+        """!
+        Read the encoder, run the controller and set the motor duty cycle.
+        @details Called by the timer once started; can also be called
+                 directly to run the loop by hand, e.g. in a simulation.
+        @param now_us: Time of the step from @c utime.ticks_us(), by default
+               now.
+        """
+        controller = self.controller
+        share = self.setpoint_share
+        setpoint = self._setpoint if share is None else share.get()
+        profile = self.profile
+        position = self.encoder.read(now_us)
+        if profile is None:
+            if self._reset:
+                self._reset = False
+                controller.set_setpoint(setpoint)
+            elif setpoint != controller.setpoint:
+                controller.track(setpoint)
+            output = controller.run(position, now_us)
+        else:
+            if self._reset:
+                self._reset = False
+                controller.reset()
+            if setpoint != profile.target:
+                profile.set_target(setpoint)
+            controller.track(profile.sample(now_us))
+            output = controller.run(position, now_us, profile.velocity, profile.acceleration)
+        self.motor.set_duty_cycle(output)
+        self.position = position
+        self.output = output
+        self.steps += 1
+
+    def start(self):
+        """!
+        Start running the loop from the timer.
+        """
+        if self._timer is None:
+            if isinstance(self._timer_id, int):
+                self._timer = pyb.Timer(self._timer_id, freq=self.freq)
+            else:
+                self._timer = self._timer_id
+                self._timer.init(freq=self.freq)
+        self._pending = False
+        self.controller.reset()
+        if self.profile is not None:
+            self.profile.reset(self.encoder.read())
+        self._timer.callback(self._tick_ref)
+        self.running = True
+
+    def stop(self):
+        """!
+        Stop the loop and the motor.
+        """
+        if self._timer is not None:
+            self._timer.callback(None)
+        self.running = False
+        self.motor.set_duty_cycle(0)
+
+    def report(self):
+        """!
+        Print the step counters and the jitter histogram.
+        """
+        print('Control loop:', self.steps, 'steps,', self.missed, 'missed ticks,',
+              self.overruns, 'overruns, longest step', self.max_step_us, 'us')
+        for idx in range(JITTER_BINS):
+            if self.histogram[idx]:
+                last = '+' if idx == JITTER_BINS - 1 else ''
+                print('  {:>5}{} us late: {}'.format(idx * self.bin_us, last, self.histogram[idx]))
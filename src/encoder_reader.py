@@ -4,6 +4,9 @@
 
 @details
 This module contains the Encoder class, which implements an encoder reader using Pyboard's Timer and Pin modules.
+The hardware counter is 16 bits, so each read latches the counter once and adds the signed change since the
+last read to a running count; reads must come often enough that the counter moves less than half its range
+between them. Each read is also time-stamped with utime.ticks_us() to give a low-pass filtered velocity.
 
 @author
 Authors: Conor Schott, Fermin Moreno, Berent Baysal
@@ -15,43 +18,90 @@ Date: 16th February 2024
 
 from pyb import Timer, Pin
 import time
+import utime
+
+## Range of the hardware counter
+COUNTER_RANGE = const(0x10000)
 
 class Encoder:
     """!
     Class representing an encoder reader.
     """
 
-    def __init__(self, timer, enc_pin_A, enc_pin_B):
+    def __init__(self, timer, enc_pin_A, enc_pin_B, vel_filter_s=0.01, stall_us=50000):
         """!
         Initialize the encoder reader.
 
-        @param timer: Timer for encoder counting.
+        @param timer: Timer for encoder counting, or an already set up timer object.
         @type timer: int
         @param enc_pin_A: Encoder channel A pin.
         @type enc_pin_A: pyb.Pin
         @param enc_pin_B: Encoder channel B pin.
         @type enc_pin_B: pyb.Pin
+        @param vel_filter_s: Time constant of the velocity low-pass filter in seconds.
+        @type vel_filter_s: float
+        @param stall_us: Time without a count after which the shaft is taken to be stopped.
+        @type stall_us: int
         """
-        self.timer = Timer(timer, prescaler=0, period=0xFFFF)
+        if isinstance(timer, int):
+            timer = Timer(timer, prescaler=0, period=COUNTER_RANGE - 1)
+        self.timer = timer
         self.enc_chA = self.timer.channel(1, Timer.ENC_AB, pin=enc_pin_A)
         self.enc_chB = self.timer.channel(2, Timer.ENC_AB, pin=enc_pin_B)
+        self.vel_filter_s = vel_filter_s
+        self.stall_us = stall_us
         self.cur_value = 0
         self.prev_value = self.timer.counter()
+        ## Filtered velocity in counts per second
+        self.velocity = 0.0
+        self._edge_us = utime.ticks_us()
+        self._last_us = self._edge_us
         
-    def read(self):
+    def read(self, now_us=None):
         """!
         Read the encoder values.
 
-        @return: Tuple containing the current encoder count, delta, and channel A and B values.
+        @details The counter is read once, and the change since the last read is wrapped
+        into -32768 to 32767 counts. The velocity is the counts since the last read which
+        saw a change, over the time since then, so slow motion which only moves a count
+        every few reads is still measured; it is then low-pass filtered.
+
+        @param now_us: Time of the read from utime.ticks_us(), by default now.
+        @return: The current encoder count.
         @rtype: int
         """
-        delta = self.timer.counter() - self.prev_value
-        if delta > 32767:
-            delta -= 65536
-        elif delta < -32768:
-            delta += 65535
-        self.prev_value = self.timer.counter()
-        self.cur_value += delta  
+        if now_us is None:
+            now_us = utime.ticks_us()
+        counter = self.timer.counter()
+        delta = (counter - self.prev_value) & (COUNTER_RANGE - 1)
+        if delta >= COUNTER_RANGE // 2:
+            delta -= COUNTER_RANGE
+        self.prev_value = counter
+        self.cur_value += delta
+
+        dt = utime.ticks_diff(now_us, self._last_us)
+        self._last_us = now_us
+        if delta:
+            since_edge = utime.ticks_diff(now_us, self._edge_us)
+            self._edge_us = now_us
+            if since_edge > self.stall_us:
+                # first count after a stop; only the last read interval is known
+                since_edge = dt
+            raw = delta * 1000000 / since_edge if since_edge > 0 else self.velocity
+        else:
+            since_edge = utime.ticks_diff(now_us, self._edge_us)
+            if since_edge > self.stall_us:
+                raw = 0.0
+            else:
+                # no count since the last edge, so the speed is at most one count over that time
+                raw = self.velocity
+                bound = 1000000 / since_edge if since_edge > 0 else raw
+                if raw > bound:
+                    raw = bound
+                elif raw < -bound:
+                    raw = -bound
+        if dt > 0:
+            self.velocity += (raw - self.velocity) * dt / (self.vel_filter_s * 1000000 + dt)
         return self.cur_value
 
     def zero(self):
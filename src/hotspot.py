@@ -0,0 +1,373 @@
+"""!
+@file hotspot.py
+
+@brief Sliding-window hotspot search for MLX90640 images.
+
+@details
+This module finds the hottest rectangular window of pixels in an image
+without building a list of candidate windows. Each window sum is slid
+across the row by adding the entering pixel (or column sum, for windows
+several rows high) and subtracting the leaving one, so every window costs
+O(1), and the search loop has no per-pixel branches.
+
+Bad pixels can be masked out. A mask marks pixels flagged in the camera's
+EEPROM, and the search can also flag pixels whose reading has not changed
+for several frames. Masked pixels are replaced by the mean of their good
+neighbours in a cleaning pass over the image into a preallocated array,
+which the search then runs on. Without a mask or background there is no
+cleaning pass.
+
+A background model can also be subtracted in the cleaning pass. It keeps an
+exponential moving average of each pixel, so warm objects which never move
+fade out and the search runs on what has changed.
+
+@author Conor Schott, Fermin Moreno, Berent Baysal
+"""
+
+from array import array
+from mlx90640.image import _INTERP_NEIGHBOURS
+
+## Mask flag for pixels marked bad in the camera's EEPROM
+MASK_DEAD = const(0x1)
+
+## Mask flag for pixels which have read the same value for too many frames
+MASK_STUCK = const(0x2)
+
+
+def dead_pixel_mask(pix_data):
+    """!
+    Build a bad-pixel mask from the camera's pixel calibration data.
+    @param pix_data: A PixelCalibrationData object.
+    @return: A bytearray with @c MASK_DEAD set for every outlier or failed
+             pixel.
+    """
+    outlier = pix_data['outlier']
+    mask = bytearray(len(pix_data))
+    for idx in range(len(mask)):
+        if outlier[idx]:
+            mask[idx] = MASK_DEAD
+    for idx in pix_data.failed:
+        mask[idx] = MASK_DEAD
+    return mask
+
+
+## Fraction bits of the background levels held by BackgroundModel
+BG_Q = const(4)
+
+
+class BackgroundModel:
+    """!
+    Per-pixel exponential moving average of the scene, in fixed point.
+    """
+
+    def __init__(self, size=768, shift=3, threshold=40):
+        """!
+        Set up an empty background.
+        @param size: Number of pixels in the image.
+        @param shift: Each frame moves the background 1/2**shift of the way
+               towards the new reading (default 3, i.e. 1/8).
+        @param threshold: Foreground level, in pixel units, which a window
+               must average to count as a target. Pixels above it are left
+               out of the background update so a target is not absorbed.
+        """
+        ## Background level of each pixel, with @c BG_Q fraction bits
+        self.level = array('l', (0 for _ in range(size)))
+        self.shift = shift
+        self.threshold = threshold
+        ## False until the first frame has been used to fill the background
+        self.primed = False
+
+    def reset(self):
+        """!
+        Forget the background; the next frame will fill it again.
+        """
+        self.primed = False
+
+
+class HotspotFinder:
+    """!
+    Finds the hottest window of pixels in an image, in place.
+    """
+
+    def __init__(self, width, height, win_w=4, win_h=1, rows=None,
+                 mask=None, stuck_frames=0, background=None):
+        """!
+        Set up the search for one window size.
+        @param width: Width of the image in pixels.
+        @param height: Height of the image in pixels.
+        @param win_w: Width of the window in pixels (default 4).
+        @param win_h: Height of the window in pixels (default 1).
+        @param rows: Number of image rows to search, counted from the top
+               (default: all of them).
+        @param mask: Optional bytearray, one byte per pixel; nonzero marks a
+               bad pixel. Masking assumes full 32 pixel wide camera images.
+        @param stuck_frames: If nonzero, flag a pixel as stuck once it has
+               read the same value this many searches in a row.
+        @param background: Optional BackgroundModel; if given, the search
+               runs on each pixel's difference from the background, which is
+               updated in the same pass.
+        """
+        self.width = width
+        self.height = height
+        self.win_w = win_w
+        self.win_h = win_h
+        self.rows = height if rows is None else rows
+        ## Column sums over the current band of @c win_h rows
+        self._col_sums = array('l', (0 for _ in range(width))) if win_h > 1 else None
+        ## Sum of the pixels in the best window found by the last search
+        self.best_sum = 0
+        self.background = background
+        ## Whether the last search found a window above the background
+        #  threshold; always True without a background model
+        self.detected = True
+        ## How far the last window stood above the threshold, from 0 to 1
+        self.confidence = 1.0
+
+        self.stuck_frames = stuck_frames
+        if stuck_frames and mask is None:
+            mask = bytearray(width * height)
+        ## Bad pixel flags, @c MASK_DEAD and/or @c MASK_STUCK per pixel
+        self.mask = mask
+        self._prev = None
+        self._same = None
+        if stuck_frames:
+            self._prev = array('h', (0 for _ in range(width * height)))
+            self._same = bytearray(width * height)
+        ## Searched rows with bad pixels replaced and the background taken
+        #  off, or None if the image is searched as it is
+        self._cleaned = None
+        if mask is not None or background is not None:
+            self._cleaned = array('l', (0 for _ in range(width * self.rows)))
+
+    def _interpolate(self, image, idx):
+        """!
+        Get the mean of the good neighbours of a pixel.
+        @param image: Image being searched.
+        @param idx: Index of the pixel to replace.
+        @return: Replacement value, or the pixel's own value if it has no
+                 good neighbours.
+        """
+        mask = self.mask
+        width = self.width
+        size = width * self.height
+        col = idx % width
+        total = 0
+        count = 0
+        for step in _INTERP_NEIGHBOURS:
+            nbr = idx + step
+            if nbr < 0 or nbr >= size or mask[nbr]:
+                continue
+            d_col = nbr % width - col
+            if d_col > 1 or d_col < -1:
+                continue
+            total += image[nbr]
+            count += 1
+        if not count:
+            return image[idx]
+        return (total + count // 2) // count
+
+    def value(self, image, idx):
+        """!
+        Get a pixel value, with a bad pixel replaced by its neighbours' mean.
+        @param image: Image being searched.
+        @param idx: Index of the pixel.
+        @return: Pixel value.
+        """
+        mask = self.mask
+        if mask is not None and mask[idx]:
+            value = self._interpolate(image, idx)
+        else:
+            value = image[idx]
+        background = self.background
+        if background is not None and background.primed:
+            value -= background.level[idx] >> BG_Q
+        return value
+
+    def _prepare(self, image):
+        """!
+        Clean the searched rows of an image into a preallocated array.
+        @details Stuck pixels are tracked, bad pixels replaced by the mean
+                 of their good neighbours, and the background subtracted
+                 and updated, in one pass. Doing this before the search
+                 keeps the search loop free of per-pixel branches.
+        @param image: Image to clean.
+        @return: The cleaned pixels, in the same layout as @c image.
+        """
+        cleaned = self._cleaned
+        mask = self.mask
+        stuck_frames = self.stuck_frames
+        prev = self._prev
+        same = self._same
+        background = self.background
+        if background is not None:
+            level = background.level
+            primed = background.primed
+            shift = background.shift
+            threshold = background.threshold
+        for idx in range(self.width * self.rows):
+            value = image[idx]
+            if stuck_frames:
+                if value == prev[idx]:
+                    if same[idx] < 255:
+                        same[idx] += 1
+                    if same[idx] >= stuck_frames:
+                        mask[idx] |= MASK_STUCK
+                else:
+                    same[idx] = 0
+                    mask[idx] &= ~MASK_STUCK
+                    prev[idx] = value
+            if mask is not None and mask[idx]:
+                value = self._interpolate(image, idx)
+            if background is not None:
+                if not primed:
+                    level[idx] = value << BG_Q
+                bg = level[idx]
+                diff = value - (bg >> BG_Q)
+                if diff < threshold:
+                    level[idx] = bg + (((value << BG_Q) - bg) >> shift)
+                value = diff
+            cleaned[idx] = value
+        return cleaned
+
+    def _search_rows(self, image):
+        """!
+        Slide a one row window along each row.
+        @return: (sum, col, row) of the hottest window.
+        """
+        width = self.width
+        win_w = self.win_w
+        last_col = width - win_w
+        best = None
+        best_col = 0
+        best_row = 0
+        for row in range(self.rows):
+            base = row * width
+            total = 0
+            for idx in range(base, base + win_w):
+                total += image[idx]
+            # later windows are lower or further right, so a tie only
+            # needs the column checked
+            if best is None or total > best or (total == best and best_col == 0):
+                best = total
+                best_col = 0
+                best_row = row
+            leave = base
+            for col in range(1, last_col + 1):
+                total += image[leave + win_w] - image[leave]
+                leave += 1
+                if total > best or (total == best and col >= best_col):
+                    best = total
+                    best_col = col
+                    best_row = row
+        return best, best_col, best_row
+
+    def _search_bands(self, image):
+        """!
+        Slide a window of several rows along each band of rows, keeping
+        the column sums over the band.
+        @return: (sum, col, row) of the hottest window.
+        """
+        width = self.width
+        win_w = self.win_w
+        win_h = self.win_h
+        last_col = width - win_w
+        col_sums = self._col_sums
+        for col in range(width):
+            col_sums[col] = 0
+
+        best = None
+        best_col = 0
+        best_row = 0
+        for row in range(self.rows):
+            base = row * width
+            if row >= win_h:
+                leave = base - win_h * width
+                for col in range(width):
+                    col_sums[col] += image[base + col] - image[leave + col]
+            else:
+                for col in range(width):
+                    col_sums[col] += image[base + col]
+            if row < win_h - 1:
+                continue
+
+            top = row - win_h + 1
+            total = 0
+            for col in range(win_w):
+                total += col_sums[col]
+            for col in range(last_col + 1):
+                if col:
+                    total += col_sums[col + win_w - 1] - col_sums[col - 1]
+                if best is None or total > best or (total == best and col >= best_col):
+                    best = total
+                    best_col = col
+                    best_row = top
+        return best, best_col, best_row
+
+    def find(self, image):
+        """!
+        Find the hottest window in an image.
+        @details Ties are broken in favour of the rightmost, then lowest,
+                 window. Without a mask or a background the image is
+                 searched as it is; otherwise it is cleaned first.
+        @param image: Indexable image, row-major, @c width pixels per row.
+        @return: A list @c [col, row] giving the top left pixel of the
+                 hottest window.
+        """
+        background = self.background
+        primed = background is not None and background.primed
+        if self._cleaned is not None:
+            image = self._prepare(image)
+        if self.win_h == 1:
+            best, best_col, best_row = self._search_rows(image)
+        else:
+            best, best_col, best_row = self._search_bands(image)
+
+        self.best_sum = best
+        if background is not None:
+            threshold = background.threshold
+            mean = best / (self.win_w * self.win_h)
+            self.detected = primed and mean >= threshold
+            self.confidence = (1 - threshold / mean) if self.detected and mean > 0 else 0.0
+            background.primed = True
+        return [best_col, best_row]
+
+    def centroid(self, image, col, row):
+        """!
+        Estimate the target column to a fraction of a pixel.
+        @details The window at @c (col, row) is widened by one pixel on each
+                 side, the coldest pixel in that span is taken as the
+                 background, and the intensity-weighted mean column is
+                 computed from what is left. The result is shifted so that
+                 it is in the same units as @c col, the left edge of the
+                 window.
+        @param image: Image that was passed to @c find().
+        @param col: Left column of the window, as returned by @c find().
+        @param row: Top row of the window, as returned by @c find().
+        @return: Fractional left column of the window.
+        """
+        width = self.width
+        first = col - 1 if col > 0 else 0
+        last = col + self.win_w
+        if last > width - 1:
+            last = width - 1
+        rows = range(row, row + self.win_h)
+
+        floor = None
+        for r in rows:
+            base = r * width
+            for c in range(first, last + 1):
+                value = self.value(image, base + c)
+                if floor is None or value < floor:
+                    floor = value
+
+        total = 0
+        moment = 0
+        for r in rows:
+            base = r * width
+            for c in range(first, last + 1):
+                weight = self.value(image, base + c) - floor
+                total += weight
+                moment += weight * c
+        if not total:
+            return float(col)
+        return moment / total - (self.win_w - 1) / 2
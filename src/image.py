@@ -41,9 +41,19 @@ class _BasePattern:
         """!
         Get the subpage range for a given subpage ID.
         @param sp_id: Subpage ID.
-        @return: Generator yielding indices belonging to the given subpage.
+        @return: Precomputed array of indices belonging to the given subpage.
         """
-        return (idx for idx, sp in enumerate(cls.iter_sp()) if sp == sp_id)
+        return cls._sp_tables[sp_id]
+
+    @classmethod
+    def _build_sp_tables(cls):
+        """!
+        Build the index tables for both subpages once, at import time.
+        """
+        tables = (array('H'), array('H'))
+        for idx, sp in enumerate(cls.iter_sp()):
+            tables[sp].append(idx)
+        cls._sp_tables = tables
 
     @classmethod
     def iter_sp(cls):
@@ -109,17 +119,22 @@ class Subpage:
     def sp_range(self):
         """!
         Get the subpage range.
-        @return: Generator yielding indices belonging to the subpage.
+        @return: Precomputed array of indices belonging to the subpage.
         """
         return self.pattern.sp_range(self.id)
 
-class RawImage:
+# Index tables and Subpage objects are shared by every frame, so build them once
+for _pat in _READ_PATTERNS.values():
+    _pat._build_sp_tables()
+    _pat.subpages = (Subpage(_pat, 0), Subpage(_pat, 1))
+
+class _BaseImage:
     """!
-    Raw image class.
+    Base class for images held as one 16-bit value per pixel.
     """
     def __init__(self):
         """!
-        Initialize RawImage object.
+        Initialize the pixel array.
         """
         self.pix = array_filled('h', IMAGE_SIZE)
 
@@ -131,17 +146,237 @@ class RawImage:
         """
         return self.pix[idx]
 
+    def interpolate(self, pattern, sp_id, mask=None):
+        """!
+        Fill in the pixels of the subpage that has not been read.
+        @details Each missing pixel is set to the rounded mean of those of
+                 its eight neighbours which belong to subpage @c sp_id. This
+                 gives a usable whole image from a single subpage. Bad
+                 pixels are left out of the mean, so that one stuck pixel
+                 does not spread to the pixels around it.
+        @param pattern: Pattern object the image was read with.
+        @param sp_id: ID of the subpage which holds valid data.
+        @param mask: Optional bytearray, one byte per pixel; nonzero marks a
+               bad pixel, as for HotspotFinder.
+        """
+        pix = self.pix
+        get_sp = pattern.get_sp
+        for idx in pattern.sp_range(1 - sp_id):
+            col = idx % NUM_COLS
+            total = 0
+            count = 0
+            for step in _INTERP_NEIGHBOURS:
+                nbr = idx + step
+                if nbr < 0 or nbr >= IMAGE_SIZE:
+                    continue
+                d_col = nbr % NUM_COLS - col
+                if d_col > 1 or d_col < -1 or get_sp(nbr) != sp_id:
+                    continue
+                if mask is not None and mask[nbr]:
+                    continue
+                total += pix[nbr]
+                count += 1
+            if count:
+                pix[idx] = (total + count // 2) // count
+
+
+class RawImage(_BaseImage):
+    """!
+    Raw image class.
+    """
+    def __init__(self):
+        """!
+        Initialize RawImage object.
+        """
+        super().__init__()
+        # Staging buffer for one burst read of the whole pixel RAM block
+        self._buf = bytearray(IMAGE_SIZE * REG_SIZE)
+
     def read(self, iface, update_idx=None):
         """!
         Read image data.
+        @details The whole pixel RAM block is fetched with a single burst
+                 read into a preallocated buffer, then only the requested
+                 pixels are unpacked into @c self.pix.  This is one I2C
+                 transaction per subpage instead of one per pixel.
         @param iface: Interface object.
         @param update_idx: Indices to update.
         """
-        buf = bytearray(REG_SIZE)
+        buf = self._buf
+        iface.read_into(PIX_DATA_ADDRESS, buf)
+        pix = self.pix
         update_idx = update_idx or range(IMAGE_SIZE)
         for offset in update_idx:
-            iface.read_into(PIX_DATA_ADDRESS + offset, buf)
-            self.pix[offset] = struct.unpack(PIX_STRUCT_FMT, buf)[0]
+            # big-endian signed 16-bit word, decoded without a tuple per pixel
+            pos = offset * REG_SIZE
+            value = buf[pos] << 8 | buf[pos + 1]
+            pix[offset] = value - 0x10000 if value & 0x8000 else value
+
+class CalibratedImage(_BaseImage):
+    """!
+    Object temperature image, in hundredths of a degree Celsius.
+    """
+    def __init__(self, calib, pattern):
+        """!
+        Initialize CalibratedImage object.
+        @details The per-pixel constants are used straight from the
+                 calibration tables; everything which only changes per frame
+                 (gain, supply voltage, ambient temperature, emissivity) is
+                 folded into a few scalars by @c calc() so that the loop over
+                 pixels does no dict or Struct lookups. Temperatures are
+                 stored as @c int16 so the image is the same size as a
+                 RawImage and can be searched the same way.
+        @param calib: CameraCalibration object.
+        @param pattern: Pattern object the camera reads with.
+        """
+        super().__init__()
+        self.calib = calib
+        self.il_offset = calib.il_offset if pattern is InterleavedPattern else None
+
+    @property
+    def nbytes(self):
+        """!
+        Get the RAM held by this image and the calibration tables it uses.
+        @return: Size in bytes.
+        """
+        # pix, pix_os_ref, pix_kta, pix_alpha and maybe il_offset
+        return IMAGE_SIZE * (2 + 2 + 4 + 4 + (4 if self.il_offset else 0))
+
+    def calc(self, raw, state, update_idx=None):
+        """!
+        Calculate object temperatures from raw pixel values.
+        @param raw: RawImage holding the pixels to convert.
+        @param state: CameraState read at the same time as the pixels.
+        @param update_idx: Indices to update.
+        """
+        calib = self.calib
+        pix = self.pix
+        raw_pix = raw.pix
+        os_ref = calib.pix_os_ref
+        kta = calib.pix_kta
+        alpha = calib.pix_alpha
+        il_offset = self.il_offset
+
+        # per-frame scalars, with the emissivity folded into the gain terms
+        inv_em = 1 / calib.emissivity
+        gain = state.gain * inv_em
+        ta = state.ta
+        ta_r = state.ta_r
+        d_vdd = state.vdd - 3.3
+        kv = calib.kv_avg
+        kv_fac = (
+            # index by (row % 2) * 2 + col % 2
+            (1 + kv[0][0] * d_vdd) * inv_em, (1 + kv[0][1] * d_vdd) * inv_em,
+            (1 + kv[1][0] * d_vdd) * inv_em, (1 + kv[1][1] * d_vdd) * inv_em,
+        )
+        alpha_fac = 1 + calib.ksta * ta
+        ksto2 = calib.ksto[1]
+        alpha_corr = 1 - ksto2 * TEMP_K
+        sqrt = math.sqrt
+
+        update_idx = update_idx or range(IMAGE_SIZE)
+        for idx in update_idx:
+            v_ir = (raw_pix[idx] * gain
+                    - os_ref[idx] * (1 + kta[idx] * ta)
+                    * kv_fac[(idx >> 4) & 2 | idx & 1])
+            if il_offset:
+                v_ir += il_offset[idx] * inv_em
+            alpha_c = alpha[idx] * alpha_fac
+            s_x = ksto2 * sqrt(sqrt(alpha_c * alpha_c * alpha_c * (v_ir + alpha_c * ta_r)))
+            t_o = sqrt(sqrt(v_ir / (alpha_c * alpha_corr + s_x) + ta_r)) - TEMP_K
+            pix[idx] = int(t_o * 100)
+
+## Fraction bits of the per-frame scale factors in FixedPointImage
+FIX_Q = const(12)
+
+## Fraction bits of the per-pixel Kta table in FixedPointImage
+KTA_Q = const(16)
+
+## Fraction bits of the ambient temperature in FixedPointImage
+TA_Q = const(4)
+
+class FixedPointImage(_BaseImage):
+    """!
+    Compensated IR signal computed with integer arithmetic only.
+    @details Floats are heap objects on MicroPython, so the per-pixel loop
+             here uses small integers in fixed point instead. Each pixel
+             gets the gain, offset, Kta and Kv corrections (and the
+             interleave offset in interleaved mode), giving the compensated
+             IR signal in ADC counts, rounded to the nearest count.
+
+             Scale factors are held with @c FIX_Q fraction bits, which keeps
+             every product below 2**30 for 16-bit pixel and offset values,
+             so nothing is promoted to a long integer. The error against the
+             float calculation in @c reference() is at most
+             0.5 + (|pixel| + |offset|) * 2**-11 counts (plus 0.125 in
+             interleaved mode), which is about one count for values seen
+             in practice.
+    """
+    def __init__(self, calib, pattern):
+        """!
+        Initialize FixedPointImage object and convert the per-pixel tables.
+        @param calib: CameraCalibration object.
+        @param pattern: Pattern object the camera reads with.
+        """
+        super().__init__()
+        self.calib = calib
+        self.kta = array('l', (round(k * (1 << KTA_Q)) for k in calib.pix_kta))
+        self.il_offset = None
+        if pattern is InterleavedPattern:
+            self.il_offset = array('h', (round(il * 4) for il in calib.il_offset))
+        self._kv_fac = array_filled('l', 4)
+
+    def calc(self, raw, state, update_idx=None):
+        """!
+        Compensate raw pixel values.
+        @param raw: RawImage holding the pixels to convert.
+        @param state: CameraState read at the same time as the pixels.
+        @param update_idx: Indices to update.
+        """
+        one = 1 << FIX_Q
+        pix = self.pix
+        raw_pix = raw.pix
+        os_ref = self.calib.pix_os_ref
+        kta = self.kta
+        il_offset = self.il_offset
+
+        # per-frame scale factors, converted to fixed point once
+        gain = round(state.gain * one)
+        ta = round(state.ta * (1 << TA_Q))
+        d_vdd = state.vdd - 3.3
+        kv = self.calib.kv_avg
+        kv_fac = self._kv_fac
+        for idx in range(4):
+            kv_fac[idx] = round((1 + kv[idx >> 1][idx & 1] * d_vdd) * one)
+        kta_shift = KTA_Q + TA_Q - FIX_Q
+
+        update_idx = update_idx or range(IMAGE_SIZE)
+        for idx in update_idx:
+            # (1 + Kta * Ta) * (1 + Kv * dVdd), both with FIX_Q fraction bits
+            factor = one + (kta[idx] * ta >> kta_shift)
+            factor = factor * kv_fac[(idx >> 4) & 2 | idx & 1] >> FIX_Q
+            # signal with two fraction bits, then rounded to whole counts
+            v_ir = (raw_pix[idx] * gain - os_ref[idx] * factor) >> (FIX_Q - 2)
+            if il_offset:
+                v_ir += il_offset[idx]
+            pix[idx] = (v_ir + 2) >> 2
+
+    def reference(self, raw, state, idx):
+        """!
+        Compensate one pixel in floating point, to check @c calc() against.
+        @param raw: RawImage holding the pixel.
+        @param state: CameraState read at the same time as the pixels.
+        @param idx: Index of the pixel.
+        @return: Compensated IR signal in ADC counts.
+        """
+        calib = self.calib
+        kv = calib.kv_avg[(idx >> 5) & 1][idx & 1]
+        v_ir = (raw.pix[idx] * state.gain
+                - calib.pix_os_ref[idx] * (1 + calib.pix_kta[idx] * state.ta)
+                * (1 + kv * (state.vdd - 3.3)))
+        if self.il_offset:
+            v_ir += calib.il_offset[idx]
+        return v_ir
 
 ImageLimits = namedtuple('ScaleLimits', ('min_h', 'max_h', 'min_idx', 'max_idx'))
 
@@ -16,10 +16,38 @@ Dependencies:
 """
 
 import utime as time
+from gc import collect
 from machine import Pin, I2C
 from mlx90640 import MLX90640
 from mlx90640.calibration import NUM_ROWS, NUM_COLS, TEMP_K
 from mlx90640.image import ChessPattern, InterleavedPattern
+from mlx90640.calibration import PixelCalibrationData
+from hotspot import HotspotFinder, BackgroundModel, dead_pixel_mask
+
+## Hotspot columns and the encoder counts that aim the turret at them,
+#  measured on the turret
+_CAL_COLS = (5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20)
+_CAL_COUNTS = (-25475, -25648, -25822, -25995, -26169, -26343, -26516, -26690,
+               -26864, -27037, -27211, -27385, -27558, -27732, -27906, -28079)
+
+
+def _fit_line(xs, ys):
+    """!
+    @brief   Least-squares straight line through a set of points.
+    @returns A tuple @c (offset, slope)
+    """
+    n = len(xs)
+    mean_x = sum(xs) / n
+    mean_y = sum(ys) / n
+    sxx = sum((x - mean_x) ** 2 for x in xs)
+    sxy = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+    slope = sxy / sxx
+    return mean_y - slope * mean_x, slope
+
+
+## Encoder counts at column 0 and per column, fitted once at import
+ENC_OFFSET, ENC_PER_COL = _fit_line(_CAL_COLS, _CAL_COUNTS)
+
 
 class MLX_Cam:
     """!
@@ -28,7 +56,8 @@ class MLX_Cam:
     """
 
     def __init__(self, i2c, address=0x33, pattern=ChessPattern,
-                 width=NUM_COLS, height=NUM_ROWS):
+                 width=NUM_COLS, height=NUM_ROWS, calibrated=False,
+                 mask_pixels=True, stuck_frames=0, background_threshold=None):
         """!
         @brief   Set up an MLX90640 camera.
         @param   i2c An I2C bus which has been set up to talk to the camera;
@@ -38,6 +67,15 @@ class MLX_Cam:
                  the pixels at a time (default ChessPattern)
         @param   width The width of the image in pixels; leave it at default
         @param   height The height of the image in pixels; leave it at default
+        @param   calibrated If True, images hold object temperatures in
+                 hundredths of a degree C instead of raw counts
+        @param   mask_pixels If True, pixels flagged bad in the camera's
+                 EEPROM are ignored when searching for the hotspot
+        @param   stuck_frames If nonzero, pixels which read the same value
+                 this many frames in a row are ignored as well
+        @param   background_threshold If given, a running background is
+                 subtracted from each image and a hotspot only counts as a
+                 target if it stands this far above it (in pixel units)
         """
         ## The I2C bus to which the camera is attached
         self._i2c = i2c
@@ -53,10 +91,34 @@ class MLX_Cam:
         # The MLX90640 object that does the work
         self._camera = MLX90640(i2c, address)
         self._camera.set_pattern(pattern)
-        self._camera.setup()
+        self._camera.setup(calib=True if calibrated else None,
+                           cache_path='calib.bin' if calibrated else None)
 
         ## A local reference to the image object within the camera driver
-        self._image = self._camera.raw
+        self._image = self._camera.image if calibrated else self._camera.raw
+
+        mask = None
+        if mask_pixels:
+            if calibrated:
+                mask = dead_pixel_mask(self._camera.calib.pix_data)
+            else:
+                # the snapshot and its decoded columns are only needed to
+                # build the mask, so they are not kept
+                mask = dead_pixel_mask(PixelCalibrationData(self._camera.load_eeprom()))
+                self._camera.release_eeprom()
+                collect()
+
+        background = None
+        if background_threshold is not None:
+            background = BackgroundModel(width * height,
+                                         threshold=background_threshold)
+
+        ## Sliding-window search for the hottest 1x4 cluster; the bottom row
+        #  is left out, as it always has been
+        self._hotspot = HotspotFinder(width, height, win_w=4, win_h=1,
+                                      rows=height - 1, mask=mask,
+                                      stuck_frames=stuck_frames,
+                                      background=background)
 
     def ascii_art(self, array):
         """!
@@ -82,7 +144,7 @@ class MLX_Cam:
             print('')
         return
 
-    def get_image(self):
+    def get_image(self, fast=False):
         """!
         @brief   Get one image from a MLX90640 camera.
         @details Grab one image from the given camera and return it. Both
@@ -91,55 +153,100 @@ class MLX_Cam:
                  combination is sketchy and not fully tested). It is assumed
                  that the camera is in the ChessPattern (default) mode as it
                  probably should be.
+
+                 In fast mode only the first subpage to become available is
+                 read, and the other half of the checkerboard is filled in
+                 from its neighbours. This returns after one camera refresh
+                 period instead of two; call @c refine_image() afterwards to
+                 replace the estimated pixels with measured ones.
+        @param   fast If True, return as soon as one subpage has been read
         @returns A reference to the image object we've just filled with data
         """
+        if fast:
+            self._camera.wait_data()
+            image = self._camera.read_image()
+            image.interpolate(self._pattern, self._camera.last_read.id,
+                              self._hotspot.mask)
+            return image
+
         for subpage in (0, 1):
-            while not self._camera.has_data:
-                time.sleep_ms(50)
-                print('.', end='')
+            self._camera.wait_data()
             image = self._camera.read_image(subpage)
 
         return image
 
+    def refine_image(self):
+        """!
+        @brief   Update the image with a new subpage, if one is ready.
+        @details This never waits, so it can be called while the turret is
+                 moving. If the subpage that arrives is the one which was
+                 read last time, the other half is interpolated again so
+                 that the image stays consistent.
+        @returns The updated image, or None if no new subpage was ready
+        """
+        if not self._camera.has_data:
+            return None
+        previous = self._camera.last_read
+        image = self._camera.read_image()
+        if previous is None or self._camera.last_read.id == previous.id:
+            image.interpolate(self._pattern, self._camera.last_read.id,
+                              self._hotspot.mask)
+        return image
+
     def find_hotSpot(self, array):
         """!
         @brief   Find the hottest average cluster of 1x4 pixels in the image.
-        @details Each pixel in the image is checked and its value is used to
-                 compute a local average (in groups of four). These averages
-                 are then compiled into an array, and the indices are used to
-                 pinpoint the location of this cluster in a 24x32 array.
+        @details A running sum of four pixels is slid along each row, so
+                 every cluster costs the same small amount of work and no
+                 list of candidates is built. Ties go to the rightmost, then
+                 lowest, cluster. Bad pixels are replaced by the mean of
+                 their neighbours as the image is scanned.
         @param   array The array to be shown, probably @c image
         @returns A set of coordinates pertaining to the hottest average cluster,
                  with the assumption that the array is 24x32.
         """
-        cluster_temps = []
-        for row in range(self._height - 1):
-            for col in range(self._width - 3):
-                cluster_temp = sum(array[row * self._width + col: row * self._width + col + 4]) / 4
-                cluster_temps.append((cluster_temp, col, row))
+        return self._hotspot.find(array)
 
-        max_temp, x, y = max(cluster_temps)
-        return [x, y]
+    @property
+    def detected(self):
+        """!
+        @brief   Whether the last hotspot found stood out from the background.
+        @details Always True unless a background threshold was given.
+        """
+        return self._hotspot.detected
+
+    @property
+    def confidence(self):
+        """!
+        @brief   Confidence in the last hotspot, from 0 to 1.
+        @details Always 1 unless a background threshold was given.
+        """
+        return self._hotspot.confidence
+
+    def find_centroid(self, array, hot_spot):
+        """!
+        @brief   Refine a hotspot to a fractional column.
+        @details The pixels around the cluster found by @c find_hotSpot()
+                 are weighted by how much hotter than their surroundings they
+                 are, which places the target between pixel columns.
+        @param   array The image that was searched
+        @param   hot_spot The @c [x, y] coordinates from @c find_hotSpot()
+        @returns The fractional column of the cluster, in the same units as
+                 @c hot_spot[0]
+        """
+        return self._hotspot.centroid(array, hot_spot[0], hot_spot[1])
 
     def hotspot_to_encoder_position(self, hotspot_location, total_hotspot_locations):
         """!
         @brief   Convert hotspot location to encoder position.
-        @param   hotspot_location Hotspot location
-        @returns Encoder position
+        @details A straight line fitted to the measured aiming table maps the
+                 column, which may be fractional, to encoder counts.
+        @param   hotspot_location Hotspot column, integer or fractional
+        @returns Encoder position, or None if the column is outside the image
         """
-        # Define the arrays for hotspot locations and corresponding encoder positions
-        hotspots = [5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20]
-        encoders = [-25475, -25648, -25822, -25995, -26169, -26343, -26516, -26690, -26864, -27037, -27211, -27385, -27558, -27732, -27906, -28079]
-        
-        # Check if the provided hotspot_location is within the range of hotspots
-        if hotspot_location < hotspots[0] or hotspot_location > hotspots[-1]:
-            return None  # Return None if hotspot_location is out of range
-        
-        # Find the index of the nearest hotspot_location in the hotspots array
-        idx = hotspots.index(min(hotspots, key=lambda x: abs(x - hotspot_location)))
-        
-        # Return the corresponding encoder position
-        return encoders[idx]
+        if hotspot_location < 0 or hotspot_location > self._width - 1:
+            return None
+        return round(ENC_OFFSET + ENC_PER_COL * hotspot_location)
 
     def hotspot_to_encoder(self, hotspot_location):
         """!
@@ -173,7 +280,8 @@ if __name__ == "__main__":
             camera.ascii_art(image)
             hot_spot = camera.find_hotSpot(image)
             print("Hottest spot coordinates:", hot_spot)
-            encoder_position = camera.hotspot_to_encoder(hot_spot[0])
+            target_col = camera.find_centroid(image, hot_spot)
+            encoder_position = camera.hotspot_to_encoder(target_col)
             print("Encoder Position:", encoder_position)
             time.sleep_ms(1000)
 
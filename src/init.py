@@ -16,25 +16,28 @@ Date: 3/14/2024
 
 
 @note
-RAW VERSION
-This version of the driver is designed to capture raw data exclusively from the MLX90640 sensor.
-Calibration processes are omitted in order to conserve memory resources.
+By default the driver captures raw data only, to conserve memory. Calling
+@c setup(calib=True) also loads the calibration and produces object
+temperatures in a CalibratedImage, which is the same size as the raw image.
 """
 
 
 from gc import collect, mem_free
 from ucollections import namedtuple
+from utime import ticks_ms, ticks_add, ticks_diff, sleep_ms
 from mlx90640.regmap import (
     REGISTER_MAP,
     EEPROM_MAP,
+    CACHEABLE_REGISTERS,
     RegisterMap,
     CameraInterface,
+    EepromImage,
     REG_SIZE,
     EEPROM_ADDRESS,
     EEPROM_SIZE,
 )
-# from mlx90640.calibration import CameraCalibration, TEMP_K
-from mlx90640.image import RawImage, Subpage, get_pattern_by_id
+from mlx90640.calibration import CameraCalibration, TEMP_K
+from mlx90640.image import RawImage, CalibratedImage, get_pattern_by_id
 
 
 class CameraDetectError(Exception):
@@ -96,6 +99,13 @@ class DataNotAvailableError(Exception):
     """
 
 
+## Wake this many milliseconds before a subpage is due, then poll
+WAKE_EARLY_MS = const(4)
+
+## Interval between status polls once a subpage is due
+POLL_MS = const(1)
+
+
 class MLX90640:
     """!
     Class representing the MLX90640 thermal infrared camera.
@@ -106,20 +116,65 @@ class MLX90640:
         Initialize the MLX90640 camera object.
         """
         self.iface = CameraInterface(i2c, addr)
-        self.registers = RegisterMap(self.iface, REGISTER_MAP)
-        self.eeprom = RegisterMap(self.iface, EEPROM_MAP, readonly=True)
+        self.registers = RegisterMap(self.iface, REGISTER_MAP,
+                                     cached=CACHEABLE_REGISTERS)
+        self.eeprom = RegisterMap(self.iface, EEPROM_MAP, readonly=True,
+                                  cached=EEPROM_MAP.keys())
+        self.eeprom_image = None
         self.calib = None
         self.raw = None
+        self.image = None
+        self.setup_bytes = 0
         self.last_read = None
+        ## FrameRecorder saving each subpage read, if any
+        self.recorder = None
+        self._period_ms = None
+        self._last_data_ms = None
+        self._wake_early_ms = WAKE_EARLY_MS
+
+
+    def load_eeprom(self):
+        """!
+        Read the whole EEPROM in one burst and parse it from memory from now on.
+        @returns The EepromImage snapshot.
+        """
+        self.eeprom_image = EepromImage(self.iface)
+        self.eeprom = RegisterMap(self.eeprom_image, EEPROM_MAP, readonly=True)
+        return self.eeprom_image
 
+    def release_eeprom(self):
+        """!
+        Drop the EEPROM snapshot, to free its memory once nothing needs to
+        parse it in bulk; the EEPROM is read over I2C again from now on.
+        """
+        self.eeprom_image = None
+        self.eeprom = RegisterMap(self.iface, EEPROM_MAP, readonly=True,
+                                  cached=EEPROM_MAP.keys())
 
-    def setup(self, *, calib=None, raw=None, image=None):
+
+    def setup(self, *, calib=None, raw=None, image=None, cache_path=None):
         """!
         Setup the camera with optional calibration, raw data, and processed image.
+        @param calib: A CameraCalibration, or True to load one from the
+               camera's EEPROM. Leave as None for raw data only.
+        @param raw: RawImage to read into, created if not given.
+        @param image: CalibratedImage to compute into, created if not given
+               and the camera is calibrated.
+        @param cache_path: File used to cache the per-pixel calibration
+               tables between boots.
         """
         collect()
+        free = mem_free()
+        if calib is True:
+            calib = CameraCalibration(self.load_eeprom(), self.eeprom,
+                                      cache_path=cache_path)
+        self.calib = calib
         self.raw = raw or RawImage()
+        if calib is not None:
+            self.image = image or CalibratedImage(calib, self.get_pattern())
         collect()
+        ## Heap used by the images and calibration, to check the memory budget
+        self.setup_bytes = free - mem_free()
 
 
     @property
@@ -135,6 +190,47 @@ class MLX90640:
         Set the refresh rate.
         """
         self.registers['refresh_rate'] = RefreshRate.from_freq(freq)
+        self._period_ms = None
+
+    @property
+    def period_ms(self):
+        """!
+        Get the time between subpages in milliseconds, from the refresh rate.
+        """
+        if self._period_ms is None:
+            self._period_ms = int(1000 / self.refresh_rate)
+        return self._period_ms
+
+    def _due_in_ms(self):
+        """!
+        Get the time until the next subpage is due, predicted from when the
+        last one arrived. Negative if it is already due.
+        """
+        if self._last_data_ms is None:
+            return 0
+        due = ticks_add(self._last_data_ms, self.period_ms)
+        return ticks_diff(due, ticks_ms())
+
+    def _timeout(self, timeout_ms):
+        """!
+        Get the timeout to use for a wait, defaulting to two refresh periods.
+        """
+        return 2 * self.period_ms if timeout_ms is None else timeout_ms
+
+    def _woke(self, late):
+        """!
+        Adjust how early a wait wakes, once it has woken for a subpage.
+        @details The next subpage is predicted from when the last one was
+                 read, so a late read makes the prediction late as well. If
+                 the subpage was already waiting on waking, the next wait
+                 wakes twice as early, up to half a period, so the waits
+                 catch up with the camera within a few subpages.
+        @param late: Whether the subpage had already arrived.
+        """
+        if late:
+            self._wake_early_ms = min(2 * self._wake_early_ms, self.period_ms // 2)
+        else:
+            self._wake_early_ms = WAKE_EARLY_MS
 
 
     def get_pattern(self):
@@ -155,28 +251,46 @@ class MLX90640:
         """!
         Read the supply voltage.
         """
-        return 0.0
+        if self.calib is None:
+            return 0.0
+        vdd_pix = self.registers['vdd_pix'] * self._adc_res_corr()
+        return (vdd_pix - self.calib.vdd_25) / self.calib.k_vdd + 3.3
 
 
     def _adc_res_corr(self):
         """!
         Perform ADC resolution correction.
         """
-        return 0
+        if self.calib is None:
+            return 0
+        return (1 << self.calib.res_ee) / (1 << self.registers['adc_resolution'])
 
 
-    def read_ta(self):
+    def read_ta(self, vdd=None):
         """!
-        Read the ambient temperature.
+        Read the ambient temperature, as the difference from 25 C.
+        @param vdd: Supply voltage, if it has already been read.
         """
-        return 0.0
+        calib = self.calib
+        if calib is None:
+            return 0.0
+        if vdd is None:
+            vdd = self.read_vdd()
+        ptat = self.registers['ta_ptat']
+        vbe = self.registers['ta_vbe']
+        ptat_art = ptat / (ptat * calib.alpha_ptat + vbe) * 262144
+        return ((ptat_art / (1 + calib.kv_ptat * (vdd - 3.3)) - calib.ptat_25)
+                / calib.kt_ptat)
 
 
     def read_gain(self):
         """!
-        Read the gain.
+        Read the gain, as the correction factor if the camera is calibrated.
         """
-        return float(self.registers['gain'])
+        gain = float(self.registers['gain'])
+        if self.calib is None:
+            return gain
+        return self.calib.gain / gain
 
 
     def read_state(self, *, tr=None):
@@ -187,12 +301,17 @@ class MLX90640:
         cp_sp_0 = gain * self.registers['cp_sp_0']
         cp_sp_1 = gain * self.registers['cp_sp_1']
 
-        ta = self.read_ta()
+        vdd = self.read_vdd()
+        ta = self.read_ta(vdd)
 
         ta_abs = ta + 25
         ta_r = (ta_abs + TEMP_K)**4
+        if tr is not None and self.calib is not None:
+            # reflected temperature, weighted by how reflective the target is
+            tr_r = (tr + TEMP_K)**4
+            ta_r = tr_r - (tr_r - ta_r) / self.calib.emissivity
         return CameraState(
-            vdd = self.read_vdd(),
+            vdd = vdd,
             ta = ta,
             ta_r = ta_r,
             gain = gain,
@@ -208,6 +327,57 @@ class MLX90640:
         return bool(self.registers['data_available'])
 
 
+    def wait_data(self, timeout_ms=None):
+        """!
+        Wait until the camera has a new subpage.
+        @details Sleeps until shortly before the next subpage is due, as
+                 predicted from the refresh rate, then polls the status
+                 register at a short interval. After a late read it wakes
+                 earlier until it catches the subpage arriving again.
+        @param timeout_ms: Longest time to wait, by default two refresh
+               periods.
+        @exception DataNotAvailableError No subpage arrived in time.
+        """
+        start = ticks_ms()
+        timeout_ms = self._timeout(timeout_ms)
+        delay = self._due_in_ms() - self._wake_early_ms
+        if delay > 0:
+            sleep_ms(min(delay, timeout_ms))
+            if self.has_data:
+                self._woke(True)
+                return
+            self._woke(False)
+        while not self.has_data:
+            if ticks_diff(ticks_ms(), start) >= timeout_ms:
+                raise DataNotAvailableError
+            sleep_ms(POLL_MS)
+
+    def wait_data_gen(self, timeout_ms=None):
+        """!
+        Cooperative version of @c wait_data() for use in a @c cotask.Task.
+        @details Yields instead of sleeping; use it as
+                 @c "yield from camera.wait_data_gen()". The status register
+                 is only read once the next subpage is nearly due.
+        @param timeout_ms: Longest time to wait, by default two refresh
+               periods.
+        @exception DataNotAvailableError No subpage arrived in time.
+        """
+        start = ticks_ms()
+        timeout_ms = self._timeout(timeout_ms)
+        if self._due_in_ms() > self._wake_early_ms:
+            while self._due_in_ms() > self._wake_early_ms:
+                if ticks_diff(ticks_ms(), start) >= timeout_ms:
+                    raise DataNotAvailableError
+                yield
+            if self.has_data:
+                self._woke(True)
+                return
+            self._woke(False)
+        while not self.has_data:
+            if ticks_diff(ticks_ms(), start) >= timeout_ms:
+                raise DataNotAvailableError
+            yield
+
     @property
     def last_subpage(self):
         """!
@@ -220,14 +390,24 @@ class MLX90640:
         """!
         Read the image.
         """
-        if not self.has_data:
+        # one status read serves both fields and the clear afterwards
+        status = self.registers.read_register('data_available')
+        if not status['data_available']:
             raise DataNotAvailableError
+        self._last_data_ms = ticks_ms()
 
         if sp_id is None:
-            sp_id = self.last_subpage
+            sp_id = status['last_subpage']
 
-        subpage = Subpage(self.get_pattern(), sp_id)
+        subpage = self.get_pattern().subpages[sp_id]
         self.last_read = subpage
         self.raw.read(self.iface, subpage.sp_range())
-        self.registers['data_available'] = 0
-        return self.raw
+        if self.recorder is not None:
+            self.recorder.record(subpage)
+        status['data_available'] = 0
+        self.registers.write_register(status)
+        if self.image is None:
+            return self.raw
+
+        self.image.calc(self.raw, self.read_state(), subpage.sp_range())
+        return self.image
@@ -2,8 +2,8 @@
 @file main.py
 
 @brief This script demonstrates the firing sequence without the use of Cotask. It runs all needed programs
-in the designated order. The flywheels used for launching the Nerf bullet are manually turned on for the
-firing sequence to work.
+in the designated order. The flywheels used for launching the Nerf bullet idle until a target is found, and are then ramped up to
+reach full speed when the shot is expected.
 
 
 @author Conor Schott, Fermin Moreno, Berent Baysal
@@ -20,6 +20,9 @@ from mlx90640.calibration import NUM_ROWS, NUM_COLS, TEMP_K
 from mlx90640.image import ChessPattern, InterleavedPattern
 import servo_trigger
 import Flywheel
+import tracker
+import control_loop
+import trajectory
 
 
 
@@ -41,29 +44,43 @@ else:
 i2c_address = 0x33
 scanhex = [f"0x{addr:X}" for addr in i2c_bus.scan()]
 cam = image_to_encoder.MLX_Cam(i2c_bus)
+target = tracker.TargetTracker()
+LEAD_MS = 1500  # expected time from the first frame to the shot leaving
+wheels = Flywheel.FlywheelController(spin_up_ms=2000)
+LOOP_HZ = 500  # rate of the timer-driven PID loop
 #Actual important stuff is below this line-----------------------------------------
 
 
-Flywheel.start_flywheel()
-utime.sleep_ms(2000)
+wheels.idle()
 enc.zero()
+loop = None
 while True:
     try:       
         
-        Kp = 0.17
-        Ki = 0.01
-        Kd = 0
+        Kp = 0.3
+        Ki = 0.5
+        Kd = 0.004
         iterations = 0
         #finding the hotspot with the use of image_to_encoder---------
         while iterations < 1:
-            image = cam.get_image()
+            image = cam.get_image(fast=True)
             #cam.ascii_art(image)
             hot_spot = cam.find_hotSpot(image)
             #utime.sleep_ms(1) ########
             iterations+=1
         
         #Flywheel.run_flywheel()
-        setpoint = cam.hotspot_to_encoder_position(hot_spot[0], 32)
+        target_col = cam.find_centroid(image, hot_spot)
+        target.update(target_col)
+        # the shot cannot leave before the wheels are up to speed
+        fire_at = utime.ticks_add(utime.ticks_ms(), max(LEAD_MS, wheels.spin_up_ms))
+        setpoint = cam.hotspot_to_encoder_position(target.predict(fire_at), 32)
+        if setpoint is None:
+            # the target is predicted to leave the image; aim where it is now
+            setpoint = cam.hotspot_to_encoder_position(target_col, 32)
+        if setpoint is None:
+            continue
+        wheels.arm(fire_at)
         #setpoint = -25652
         print(setpoint)
         
@@ -71,54 +88,70 @@ while True:
 
 
         print("Hottest spot coordinates:", hot_spot)
-        encoder_position = cam.hotspot_to_encoder(hot_spot[0])
+        encoder_position = cam.hotspot_to_encoder(target_col)
         print("Encoder Position:", encoder_position)  
         
         
-        close = PID_Closed_Loop.ClosedLoopController(Kp, Ki, Kd, setpoint)
+        close = PID_Closed_Loop.ClosedLoopController(Kp, Ki, Kd, setpoint,
+                                                     Kv=0.005, Ka=0.0005, Ks=8)
+        profile = trajectory.MotionProfile(17000, 100000, 2000000, 1000000 // LOOP_HZ)
+        loop = control_loop.ControlLoop(enc, moe, close, freq=LOOP_HZ, profile=profile)
         iterations = 0
         
         
         #Step response-----------------------------------------
-        
-        while enc.read()+5 < setpoint or enc.read()-5 > setpoint:
-            current_position = enc.read()
-            output = close.run(current_position)
-            moe.set_duty_cycle(output)
-            #print(current_position)
+        # the PID runs from the loop's timer; this loop only keeps tracking
+        loop.start()
+        while loop.steps == 0 or abs(setpoint - loop.position) > 5 or not wheels.ready:
+            wheels.update()
+
+            # keep tracking while the turret moves
+            image = cam.refine_image()
+            if image is not None:
+                hot_spot = cam.find_hotSpot(image)
+                target.update(cam.find_centroid(image, hot_spot))
+                new_setpoint = cam.hotspot_to_encoder_position(target.predict(fire_at), 32)
+                if new_setpoint is not None:
+                    setpoint = new_setpoint
+                    loop.set_setpoint(setpoint)
             utime.sleep_ms(10)
             
-        moe.set_duty_cycle(0)
+        loop.stop()
         servo1.set_pos(250)
         utime.sleep_ms(3000)
-        Flywheel.stop_flywheel()
+        wheels.stop()
         servo1.set_pos(0)
         utime.sleep_ms(1000)
         
         #moe.set_duty_cycle(0)
         #utime.sleep_ms(2000)
        
-        Kp = 0.17
-        Ki = 0.1
-        Kd = 0
+        Kp = 0.3
+        Ki = 0.5
+        Kd = 0.004
         setpoint = 0
-        close = PID_Closed_Loop.ClosedLoopController(Kp, Ki, Kd, setpoint)
-        
-        while enc.read()+3 < setpoint or enc.read()-3 > setpoint:
-            current_position = enc.read()
-            output = close.run(current_position)
-            moe.set_duty_cycle(output)
-            #print(current_position)
+        close.set_Kp(Kp)
+        close.set_Ki(Ki)
+        close.set_Kd(Kd)
+        loop.set_setpoint(setpoint, reset=True)
+        loop.clear_stats()
+        loop.start()
+        while loop.steps == 0 or abs(setpoint - loop.position) > 3:
             utime.sleep_ms(10)   
-        moe.set_duty_cycle(0)
+        loop.stop()
+        loop.report()
         break
         
 #EXCEPT BLOCKS--------------------------------------------------------    
         
     except ValueError as e:
+        if loop is not None:
+            loop.stop()  # don't leave the timer driving a stale loop
         print('ValueError:', e)
         
     except Exception as e:
+        if loop is not None:
+            loop.stop()
         print('Exception:', str(e))  # Convert integer 'e' to string explicitly
         # Additional exception handling or logging can be added here
        
@@ -2,12 +2,23 @@
 @file main_cotasking.py
 
 @brief This script demonstrates cooperative multitasking using Cotask on a microcontroller.
-Task 1 performs closed-loop control of the panning axis brushed DC motor based on camera feedback.
-The camera outputs a hotspot coordinate which is then translated to encoder counts and used as the setpoint 
-for our PID controller. Upon reaching the desired setpoint, the task then calls for the servo motor trigger to activate,
-placing a Nerf bullet into the path of the flywheels. 
+The aiming sequence is split into tasks which run side by side, so the camera keeps reading while the
+turret moves and the motor keeps being controlled while the camera reads.
 
-Task 2 controls the low-side MOSFET switch that is responsible for sending current to our flywheel motors.
+Task 1 (camera) reads each new camera subpage as it arrives, finds the hotspot, tracks the target and
+posts the setpoint for it to a queue, along with how confident the detection is.
+
+Task 2 (control) hands the newest setpoint in the queue to the PID loop for the panning axis brushed
+DC motor, which runs at a fixed rate from a timer interrupt, and reports when the turret has settled.
+
+Task 3 (fire) waits until the turret has settled on a confident target, then strokes the servo trigger,
+placing a Nerf bullet into the path of the flywheels, and sends the turret home.
+
+Task 4 controls the low-side MOSFET switch that is responsible for sending current to our flywheel motors.
+The flywheels idle until the camera task arms them with the expected time of the shot, are ramped up to
+reach full speed at that time, and the fire task is told when they are up to speed.
+
+None of the tasks sleep; every wait is done by checking the time and yielding.
 
 
 @author Conor Schott, Fermin Moreno, Berent Baysal
@@ -24,111 +35,131 @@ import PID_Closed_Loop
 import image_to_encoder
 import servo_trigger
 import Flywheel
+import tracker
+import telemetry
+import control_loop
+import trajectory
 from machine import Pin, I2C
 from mlx90640 import MLX90640
 from mlx90640.calibration import NUM_ROWS, NUM_COLS, TEMP_K
 from mlx90640.image import ChessPattern, InterleavedPattern
 #---------------------------------------------------------------------------------
 
-def firing_sequence_fun():
+LEAD_MS = 1500          # expected time from the first frame to the shot leaving
+LOOP_HZ = 500           # rate of the timer-driven PID loop
+DEADBAND = 5            # encoder counts from the setpoint which count as on target
+SETTLE_RUNS = 5         # control runs in a row inside the deadband to be settled
+BG_THRESHOLD = 40       # counts above the running background for a pixel to be a target
+MIN_CONFIDENCE = 0.3    # lowest detection confidence worth a shot
+TRIGGER_MS = 500        # time for each stroke of the servo trigger
+SPIN_UP_MS = 2000       # time the flywheels take to reach speed
+
+# Task states
+S_AIM = 0
+S_FIRE = 1
+S_RETRACT = 2
+S_HOME = 3
+S_DONE = 4
+
+def camera_fun():
     """!
-    Task function for Firing Sequence.
-    Implements closed-loop control of a motor based on camera feedback.
+    Task function for the camera.
+    Reads each new subpage without waiting, and posts the setpoint for the tracked target once
+    it stands out from the background.
     """
-    # ENCODER AND MOTOR SETUP----------------------------------------------------------
-    enc = encoder_reader.Encoder(8, pyb.Pin.board.PC6, pyb.Pin.board.PC7)
-    moe = motor_control.MotorDriver(pyb.Pin.board.PC1, pyb.Pin.board.PA0, pyb.Pin.board.PA1, 5)
-    servo1 = servo_trigger.ServoDriver('PB6',4,1)
-
-    # CAMERA SETUP---------------------------------------------------------------------
-
-    try:
-        from pyb import info
-    except ImportError:
-        i2c_bus = I2C(1, scl=Pin(22), sda=Pin(21))
-    else:
-        i2c_bus = I2C(1)
-
-    i2c_address = 0x33
-    scanhex = [f"0x{addr:X}" for addr in i2c_bus.scan()]
-    cam = Progress1.MLX_Cam(i2c_bus)
-    # Actual important stuff is below this line-----------------------------------------
-
-    
-    utime.sleep_ms(2000)
-    enc.zero()
+    target = tracker.TargetTracker()
+    fire_at = None
     while True:
-        try:
-            Kp = 0.17
-            Ki = 0.01
-            Kd = 0
-            iterations = 0
-            # Finding the hotspot with the use of progress1---------
-            while iterations < 1:
-                image = cam.get_image()
-                # cam.ascii_art(image)
-                hot_spot = cam.find_hotSpot(image)
-                # utime.sleep_ms(1) ########
-                iterations += 1
-
-            setpoint = cam.hotspot_to_encoder_position(hot_spot[0], 32)
-            print(setpoint)
-
-            print("Hottest spot coordinates:", hot_spot)
-            encoder_position = cam.hotspot_to_encoder(hot_spot[0])
-            print("Encoder Position:", encoder_position)
-
-            close = PID_Closed_Loop.ClosedLoopController(Kp, Ki, Kd, setpoint)
-            iterations = 0
-
-            # Step response-----------------------------------------
-            while enc.read() + 5 < setpoint or enc.read() - 5 > setpoint:
-                current_position = enc.read()
-                output = close.run(current_position)
-                moe.set_duty_cycle(output)
-                # print(current_position)
-                utime.sleep_ms(10)
-
-            moe.set_duty_cycle(0)
-            servo1.set_pos(250)
-            utime.sleep_ms(500)
-            servo1.set_pos(0)
-            utime.sleep_ms(500)
-
-            Kp = 0.17
-            Ki = 0.1
-            Kd = 0
-            setpoint = 0
-            close = PID_Closed_Loop.ClosedLoopController(Kp, Ki, Kd, setpoint)
-
-            while enc.read() + 3 < setpoint or enc.read() - 3 > setpoint:
-                current_position = enc.read()
-                output = close.run(current_position)
-                moe.set_duty_cycle(output)
-                # print(current_position) #used for testing
-                utime.sleep_ms(10)
-            moe.set_duty_cycle(0)
-            break
-
-        # EXCEPTION BLOCKS--------------------------------------------------------
-        except ValueError as e:
-            print('ValueError:', e)
-        except Exception as e:
-            print('Exception:', str(e))  # Convert integer 'e' to string explicitly
-            # Additional exception handling or logging can be added here
+        if state.get() == S_AIM:
+            try:
+                image = cam.refine_image()
+                if image is not None:
+                    hot_spot = cam.find_hotSpot(image)
+                    if not cam.detected:
+                        # nothing stands out from the background; hold fire
+                        confidence.put(0.0)
+                    else:
+                        target.update(cam.find_centroid(image, hot_spot))
+                        if fire_at is None:
+                            # the shot cannot leave before the wheels are up to speed
+                            fire_at = utime.ticks_add(utime.ticks_ms(), max(LEAD_MS, SPIN_UP_MS))
+                            wheels.arm(fire_at)
+                        setpoint = cam.hotspot_to_encoder_position(target.predict(fire_at), NUM_COLS)
+                        if setpoint is not None:
+                            setpoints.put(setpoint)
+                            confidence.put(cam.confidence)
+            except OSError as e:
+                print('Camera error:', e)
+        yield
+
+def control_fun():
+    """!
+    Task function for the panning axis.
+    Hands the newest setpoint to the timer-driven control loop and reports whether the turret
+    has settled on it. The PID itself runs at a fixed rate from the loop's timer.
+    """
+    homing = False
+    runs_on_target = 0
+    while True:
+        if state.get() == S_HOME and not homing:
+            # return move, starting from a clear integrator
+            homing = True
+            runs_on_target = 0
+            while setpoints.any():
+                setpoints.get()
+            loop.set_setpoint(0, reset=True)
+        while setpoints.any():
+            # only the newest setpoint matters
+            loop.set_setpoint(setpoints.get())
+            if not loop.running:
+                loop.start()
+
+        if loop.running:
+            if abs(loop.target - loop.position) <= DEADBAND:
+                runs_on_target += 1
+            else:
+                runs_on_target = 0
+            settled.put(1 if runs_on_target >= SETTLE_RUNS else 0)
+        yield
+
+def fire_fun():
+    """!
+    Task function for the trigger.
+    Fires once the turret has settled on a confident target and the flywheels are up to speed,
+    then sends the turret home. The trigger strokes take several runs of this task, during which
+    the control task keeps running.
+    """
+    start = utime.ticks_ms()
+    while True:
+        current = state.get()
+        if current == S_AIM:
+            if settled.get() and wheels_ready.get() and confidence.get() >= MIN_CONFIDENCE:
+                print('Time to shot:', utime.ticks_diff(utime.ticks_ms(), start), 'ms')
+                state.put(S_FIRE)
+                yield from servo1.fire(250, TRIGGER_MS)
+                state.put(S_RETRACT)
+                yield from servo1.retract(0, TRIGGER_MS)
+                settled.put(0)
+                state.put(S_HOME)
+        elif current == S_HOME:
+            if settled.get():
+                state.put(S_DONE)
+        yield
 
 # Function for Flywheel Motors with similar functionality as Firing Sequence
 def flywheel_motors_fun():
     """!
     Task function for Flywheel Motors.
-    Activates the low-side MOSFET switch for a set time limit.
+    Ramps the flywheels up in time for the shot once armed, and turns them off after it.
     """
-    
+    wheels.idle()
     while True:
-        Flywheel.start_flywheel()
-        utime.sleep_ms(10000)
-        Flywheel.stop_flywheel()
-        break
+        if state.get() >= S_HOME:
+            wheels.stop()
+        else:
+            wheels.update()
+        wheels_ready.put(1 if wheels.ready else 0)
+        yield
 
 #----------------------------------------------------------------------------------
 
@@ -136,28 +167,73 @@ if __name__ == "__main__":
     print("Testing ME405 stuff in cotask.py and task_share.py\r\n"
           "Press Ctrl-C to stop and show diagnostics.")
 
+    # ENCODER AND MOTOR SETUP----------------------------------------------------------
+    enc = encoder_reader.Encoder(8, pyb.Pin.board.PC6, pyb.Pin.board.PC7)
+    moe = motor_control.MotorDriver(pyb.Pin.board.PC1, pyb.Pin.board.PA0, pyb.Pin.board.PA1, 5)
+    servo1 = servo_trigger.ServoDriver('PB6',4,1)
+    # the wheels stay at speed until the shot, however long settling takes
+    wheels = Flywheel.FlywheelController(spin_up_ms=SPIN_UP_MS)
+
+    # CAMERA SETUP---------------------------------------------------------------------
+    try:
+        from pyb import info
+    except ImportError:
+        i2c_bus = I2C(1, scl=Pin(22), sda=Pin(21))
+    else:
+        i2c_bus = I2C(1)
+    # static warm objects fade into the background and are never aimed at
+    cam = image_to_encoder.MLX_Cam(i2c_bus, background_threshold=BG_THRESHOLD)
+    enc.zero()
+
+    # Control loop samples, kept for dumping after the run
+    log = telemetry.Telemetry(1000, period_us=1000000 // LOOP_HZ)
+    loop = control_loop.ControlLoop(
+        enc, moe,
+        PID_Closed_Loop.ClosedLoopController(0.3, 0.5, 0.004, 0, telemetry=log,
+                                             Kv=0.005, Ka=0.0005, Ks=8),
+        freq=LOOP_HZ,
+        profile=trajectory.MotionProfile(17000, 100000, 2000000, 1000000 // LOOP_HZ))
+
     # Creating shared variables and queue
-    share0 = task_share.Share('h', thread_protect=False, name="Share 0")
-    q0 = task_share.Queue('L', 16, thread_protect=False, overwrite=False, name="Queue 0")
+    state = task_share.Share('B', thread_protect=False, name="State")
+    settled = task_share.Share('B', thread_protect=False, name="Settled")
+    confidence = task_share.Share('f', thread_protect=False, name="Confidence")
+    wheels_ready = task_share.Share('B', thread_protect=False, name="Wheels ready")
+    setpoints = task_share.Queue('l', 4, thread_protect=False, overwrite=True, name="Setpoints")
+    state.put(S_AIM)
+    settled.put(0)
+    confidence.put(0)
+    wheels_ready.put(0)
 
     # Creating tasks and adding them to task list
-    task1 = cotask.Task(firing_sequence_fun, name="Firing_Sequence", priority=1, period=45,
+    task1 = cotask.Task(camera_fun, name="Camera", priority=1, period=20,
+                        profile=True, trace=False)
+    task2 = cotask.Task(control_fun, name="Control", priority=3, period=10,
                         profile=True, trace=False)
-    task2 = cotask.Task(flywheel_motors_fun, name="Flywheel_Motors", priority=1, period=45,
+    task3 = cotask.Task(fire_fun, name="Fire", priority=2, period=20,
+                        profile=True, trace=False)
+    task4 = cotask.Task(flywheel_motors_fun, name="Flywheel_Motors", priority=1, period=50,
                         profile=True, trace=False)
     cotask.task_list.append(task1)
     cotask.task_list.append(task2)
+    cotask.task_list.append(task3)
+    cotask.task_list.append(task4)
 
     gc.collect()  # Running garbage collection for memory management
 
-    while True:
+    while state.get() != S_DONE:
         try:
             cotask.task_list.pri_sched()  # Priority scheduling for tasks
         except KeyboardInterrupt:
             break
+    loop.stop()
+    wheels.deinit()
 
     # Printing diagnostics after interruption
     print('\n' + str(cotask.task_list))
     print(task_share.show_all())
     print(task1.get_trace())
+    loop.report()
+    print('Loop jitter (min, max, mean us):', log.jitter_stats())
+    log.dump()
     print('')
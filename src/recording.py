@@ -0,0 +1,352 @@
+"""!
+@file recording.py
+@brief Records MLX90640 subpages to a file and plays them back.
+
+@details
+Tuning the hotspot search and the aiming otherwise needs a live heat target
+in front of the camera. A FrameRecorder attached to an MLX90640 saves each
+subpage the driver reads; a ReplayInterface then stands in for the camera on
+the I2C bus and serves the same subpages again, either with the timing they
+were recorded with or as fast as they are read.
+
+The file starts with a header:
+
+- magic number @c b'MLXR', format version (16 bits), read pattern id and
+  refresh rate setting (8 bits each), and the whole control register
+  (16 bits), big-endian;
+- the EEPROM, as the 832 big-endian words read from the camera.
+
+Each subpage read is then one record:
+
+- time in milliseconds since the first record (32 bits) and subpage id
+  (8 bits), big-endian;
+- the auxiliary RAM block at 0x0700 (ambient temperature, gain, supply
+  voltage), as the 64 big-endian words read from the camera;
+- the subpage's 384 raw pixels as big-endian @c int16, in the order of the
+  pattern's subpage index table, so a recording reads the same on any
+  machine.
+
+@author Conor Schott, Fermin Moreno, Berent Baysal
+"""
+
+import struct as ustruct
+from utime import ticks_ms, ticks_add, ticks_diff
+from mlx90640.regmap import CameraInterface, REG_SIZE, EEPROM_ADDRESS, EEPROM_SIZE
+from mlx90640 import RefreshRate
+from mlx90640.image import PIX_DATA_ADDRESS, get_pattern_by_id
+
+RECORDING_MAGIC = b'MLXR'
+RECORDING_VERSION = const(2)
+RECORDING_HEADER = '>4sHBBH'
+RECORD_HEADER = '>LB'
+
+## Auxiliary RAM words following the pixels
+AUX_ADDRESS = const(0x0700)
+AUX_SIZE = const(0x40)
+
+## Pixels in one subpage
+SUBPAGE_SIZE = const(24 * 32 // 2)
+
+STATUS_ADDRESS = const(0x8000)
+CONTROL_ADDRESS = const(0x800D)
+
+# status register bits
+_LAST_SUBPAGE = const(0x0007)
+_DATA_AVAILABLE = const(0x0008)
+_STATUS_WRITABLE = const(0x0018)
+
+# control register bits fixed by the recording: read pattern and refresh rate
+_CONTROL_RECORDED = const(0x1380)
+_PATTERN_BIT = const(0x1000)
+
+
+class FrameRecorder:
+    """!
+    Saves every subpage an MLX90640 reads to a file.
+    """
+
+    def __init__(self, camera, path):
+        """!
+        Start a recording and attach it to a camera.
+        @details The header is written straight away, with the EEPROM
+                 snapshot loaded by the camera or read now. From then on
+                 @c camera.read_image() calls @c record() for each subpage.
+                 Writing a record costs an extra read of the auxiliary block
+                 and a file write, so the camera's frame rate may drop while
+                 recording.
+        @param camera: The MLX90640 to record.
+        @param path: Name of the file to write.
+        """
+        self.camera = camera
+        eeprom = camera.eeprom_image or camera.load_eeprom()
+        control = bytearray(REG_SIZE)
+        camera.iface.read_into(CONTROL_ADDRESS, control)
+        self._file = open(path, 'wb')
+        self._file.write(ustruct.pack(RECORDING_HEADER, RECORDING_MAGIC, RECORDING_VERSION,
+                                      camera.registers['read_pattern'],
+                                      camera.registers['refresh_rate'],
+                                      control[0] << 8 | control[1]))
+        self._file.write(eeprom.data)
+        self._aux = bytearray(AUX_SIZE * REG_SIZE)
+        self._pix = bytearray(SUBPAGE_SIZE * REG_SIZE)
+        self._start_ms = None
+        ## Number of subpages recorded so far
+        self.count = 0
+        camera.recorder = self
+
+    def record(self, subpage):
+        """!
+        Save the subpage which the camera has just read into its RawImage.
+        @param subpage: The Subpage read.
+        """
+        now = ticks_ms()
+        if self._start_ms is None:
+            self._start_ms = now
+        self.camera.iface.read_into(AUX_ADDRESS, self._aux)
+        pix = self._pix
+        raw_pix = self.camera.raw.pix
+        for pos, idx in enumerate(subpage.sp_range()):
+            value = raw_pix[idx]
+            pix[2 * pos] = (value >> 8) & 0xFF
+            pix[2 * pos + 1] = value & 0xFF
+        f = self._file
+        f.write(ustruct.pack(RECORD_HEADER, ticks_diff(now, self._start_ms), subpage.id))
+        f.write(self._aux)
+        f.write(pix)
+        self.count += 1
+
+    def close(self):
+        """!
+        Detach from the camera and close the file.
+        """
+        if self.camera.recorder is self:
+            self.camera.recorder = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class RecordingFormatError(Exception):
+    """!
+    Exception raised for a file which is not a recording this version reads.
+    """
+
+
+class ReplayInterface(CameraInterface):
+    """!
+    Plays back a recording in place of the camera.
+
+    @details It has the read and write methods of CameraInterface, and the
+    memory methods of an I2C bus as well, so it can be handed to
+    @c MLX90640 or @c MLX_Cam wherever they take the bus. The EEPROM reads
+    as recorded, and the RAM and the status register change as each
+    recorded subpage arrives.
+
+    With @c realtime, the first subpage arrives at the first read of the
+    status register or RAM, and the others follow with their recorded
+    spacing; subpages which are not read in time are overwritten, as on the
+    camera. Otherwise the next subpage arrives as soon as the last one has
+    been read, which measures how fast the processing runs. The driver's
+    @c wait_data() still sleeps out the refresh period, so for throughput
+    poll @c has_data and call @c read_image(), e.g. with
+    @c MLX_Cam.refine_image().
+    """
+
+    def __init__(self, path, realtime=True, loop=False, addr=0x33):
+        """!
+        Open a recording.
+        @param path: Name of the file written by a FrameRecorder.
+        @param realtime: Serve subpages with their recorded timing if True,
+               or as fast as they are read.
+        @param loop: Start again from the first subpage at the end of the
+               recording instead of stopping.
+        @param addr: I2C address to answer on.
+        @exception RecordingFormatError The file is not a recording.
+        """
+        super().__init__(self, addr)
+        self.realtime = realtime
+        self.loop = loop
+        self._file = open(path, 'rb')
+        header = self._file.read(ustruct.calcsize(RECORDING_HEADER))
+        if len(header) != ustruct.calcsize(RECORDING_HEADER):
+            raise RecordingFormatError('file too short')
+        magic, version, pattern_id, refresh_rate, control = ustruct.unpack(
+            RECORDING_HEADER, header)
+        if magic != RECORDING_MAGIC or version != RECORDING_VERSION:
+            raise RecordingFormatError('not a version %d recording' % RECORDING_VERSION)
+        ## Read pattern the recording was made with
+        self.pattern = get_pattern_by_id(pattern_id)
+        ## Refresh rate setting the recording was made with
+        self.refresh_rate = refresh_rate
+        self._period_ms = int(1000 / RefreshRate.get_freq(refresh_rate))
+        self._control = control
+        self._status = 0
+        self._i2c_config = 0
+        self._eeprom = bytearray(EEPROM_SIZE * REG_SIZE)
+        if self._file.readinto(self._eeprom) != len(self._eeprom):
+            raise RecordingFormatError('file too short')
+        self._data_start = self._file.tell()
+        ## Pixel RAM and the auxiliary block, as the camera holds them
+        self._ram = bytearray((AUX_ADDRESS + AUX_SIZE - PIX_DATA_ADDRESS) * REG_SIZE)
+        self._record_header = bytearray(ustruct.calcsize(RECORD_HEADER))
+        self._aux = memoryview(self._ram)[(AUX_ADDRESS - PIX_DATA_ADDRESS) * REG_SIZE:]
+        self._pix = bytearray(SUBPAGE_SIZE * REG_SIZE)
+        self._next = None
+        self._start_ms = None
+        self._last_t_ms = 0
+        ## Number of subpages served so far
+        self.count = 0
+        ## Whether the end of the recording has been reached
+        self.finished = False
+
+    def close(self):
+        """!
+        Close the recording.
+        """
+        self._file.close()
+
+    # -- recording -------------------------------------------------------
+
+    def _read_record(self):
+        """!
+        Read the next record's header, or None at the end of the file.
+        @return: (time in ms, subpage id), or None.
+        """
+        f = self._file
+        if f.readinto(self._record_header) != len(self._record_header):
+            if not self.loop or self.count == 0:
+                return None
+            f.seek(self._data_start)
+            if self._start_ms is not None:
+                # carry on one refresh period after the last subpage
+                self._start_ms = ticks_add(self._start_ms,
+                                           self._last_t_ms + self._period_ms)
+            if f.readinto(self._record_header) != len(self._record_header):
+                return None
+        return ustruct.unpack(RECORD_HEADER, self._record_header)
+
+    def _apply(self, sp_id):
+        """!
+        Read the rest of a record into RAM and flag it in the status register.
+        """
+        f = self._file
+        if (f.readinto(self._aux) != len(self._aux)
+                or f.readinto(self._pix) != len(self._pix)):
+            self.finished = True
+            return
+        ram = self._ram
+        pix = self._pix
+        # both are big-endian words, so no byte swap is needed
+        for pos, idx in enumerate(self.pattern.sp_range(sp_id)):
+            ram[2 * idx] = pix[2 * pos]
+            ram[2 * idx + 1] = pix[2 * pos + 1]
+        self._status = (self._status & ~_LAST_SUBPAGE) | _DATA_AVAILABLE | sp_id
+        self.count += 1
+
+    def _update(self):
+        """!
+        Bring in the subpages which have arrived since the last read.
+        """
+        if self.finished:
+            return
+        if not self.realtime:
+            if self._status & _DATA_AVAILABLE:
+                return
+            record = self._read_record()
+            if record is None:
+                self.finished = True
+            else:
+                self._apply(record[1])
+            return
+
+        now = ticks_ms()
+        if self._start_ms is None:
+            self._start_ms = now
+        while True:
+            if self._next is None:
+                self._next = self._read_record()
+                if self._next is None:
+                    self.finished = True
+                    return
+            t_ms, sp_id = self._next
+            if ticks_diff(now, self._start_ms) < t_ms:
+                return
+            self._next = None
+            self._last_t_ms = t_ms
+            self._apply(sp_id)
+
+    # -- CameraInterface -------------------------------------------------
+
+    def read_into(self, mem_addr, buf):
+        """!
+        Read words at a word address, as the camera would answer.
+        """
+        size = len(buf)
+        offset = (mem_addr - EEPROM_ADDRESS) * REG_SIZE
+        if 0 <= offset and offset + size <= len(self._eeprom):
+            buf[:] = memoryview(self._eeprom)[offset:offset + size]
+            return
+        offset = (mem_addr - PIX_DATA_ADDRESS) * REG_SIZE
+        if 0 <= offset and offset + size <= len(self._ram):
+            self._update()
+            buf[:] = memoryview(self._ram)[offset:offset + size]
+            return
+        if size != REG_SIZE:
+            raise ValueError('address 0x%04X is not in the recording' % mem_addr)
+        if mem_addr == STATUS_ADDRESS:
+            self._update()
+            value = self._status
+        elif mem_addr == CONTROL_ADDRESS:
+            value = self._control
+        elif mem_addr == 0x800F:
+            value = self._i2c_config
+        elif mem_addr == 0x8010:
+            value = 0xBE00 | self.addr
+        else:
+            value = 0
+        buf[0] = value >> 8
+        buf[1] = value & 0xFF
+
+    def read(self, mem_addr):
+        buf = bytearray(REG_SIZE)
+        self.read_into(mem_addr, buf)
+        return bytes(buf)
+
+    def write(self, mem_addr, buf):
+        """!
+        Write a register. The read pattern cannot be changed from the one
+        recorded, and the refresh rate stays as recorded.
+        """
+        value = buf[0] << 8 | buf[1]
+        if mem_addr == STATUS_ADDRESS:
+            self._status = (self._status & ~_STATUS_WRITABLE) | (value & _STATUS_WRITABLE)
+        elif mem_addr == CONTROL_ADDRESS:
+            if (value ^ self._control) & _PATTERN_BIT:
+                raise ValueError('the recording was made with %s' % self.pattern.__name__)
+            self._control = (value & ~_CONTROL_RECORDED) | (self._control & _CONTROL_RECORDED)
+        elif mem_addr == 0x800F:
+            self._i2c_config = value
+
+    # -- I2C bus ---------------------------------------------------------
+
+    def scan(self):
+        return [self.addr]
+
+    def readfrom_mem(self, addr, mem_addr, nbytes, addrsize=16):
+        buf = bytearray(nbytes)
+        self.readfrom_mem_into(addr, mem_addr, buf, addrsize)
+        return bytes(buf)
+
+    def readfrom_mem_into(self, addr, mem_addr, buf, addrsize=16):
+        if addr != self.addr:
+            raise OSError(19)
+        self.read_into(mem_addr, buf)
+
+    def writeto_mem(self, addr, mem_addr, buf, addrsize=16):
+        if addr != self.addr:
+            raise OSError(19)
+        self.write(mem_addr, buf)
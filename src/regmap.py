@@ -17,6 +17,7 @@ Dr. Ridgely
 Modifed by: Conor Schott, Fermin Moreno, Berent Baysal
 """
 
+from binascii import crc32
 from mlx90640.utils import (
     field_desc,
     FieldDesc,
@@ -65,11 +66,16 @@ REGISTER_MAP = {
     0x072A : field_desc('vdd_pix',      FD_WORD, signed=True),
 }
 
+# Registers which only change when we write them, so a shadow copy stays valid.
+# The status register and RAM are updated by the camera and are never cached.
+CACHEABLE_REGISTERS = (0x800D, 0x800F, 0x8010)
+
 # Calibration Data
 EEPROM_ADDRESS = const(0x2400)
 EEPROM_SIZE    = const(0x340)
 
-# From table on page 21
+# From table on page 21. Byte-wide fields are big-endian: pos 0 is the high
+# byte (bits 15..8) of the word and pos 1 the low byte (bits 7..0).
 EEPROM_MAP = {
     0x2410 : (
         field_desc('k_ptat',         4, 12),
@@ -92,8 +98,8 @@ EEPROM_MAP = {
         field_desc('kt_ptat', 10,  0, signed=True),
     ),
     0x2433 : (
-        field_desc('k_vdd', FD_BYTE, 1, signed=True),
-        field_desc('vdd_25', FD_BYTE, 0),
+        field_desc('k_vdd', FD_BYTE, 0, signed=True),
+        field_desc('vdd_25', FD_BYTE, 1),
     ),
     0x2434 : (
         field_desc('kv_avg_ro_co', 4, 12, signed=True),
@@ -107,12 +113,12 @@ EEPROM_MAP = {
         field_desc('il_chess_c1', 6,  0, signed=True),
     ),
     0x2436 : (
-        field_desc('kta_avg_ro_co', FD_BYTE, 1, signed=True),
-        field_desc('kta_avg_re_co', FD_BYTE, 0, signed=True),
+        field_desc('kta_avg_ro_co', FD_BYTE, 0, signed=True),
+        field_desc('kta_avg_re_co', FD_BYTE, 1, signed=True),
     ),
     0x2437 : (
-        field_desc('kta_avg_ro_ce', FD_BYTE, 1, signed=True),
-        field_desc('kta_avg_re_ce', FD_BYTE, 0, signed=True),
+        field_desc('kta_avg_ro_ce', FD_BYTE, 0, signed=True),
+        field_desc('kta_avg_re_ce', FD_BYTE, 1, signed=True),
     ),
     0x2438 : (
         field_desc('res_ctrl_cal', 2, 12),
@@ -129,20 +135,20 @@ EEPROM_MAP = {
         field_desc('offset_cp_sp_0',  10,  0, signed=True),
     ),
     0x243B : (
-        field_desc('kv_cp',  FD_BYTE, 1, signed=True),
-        field_desc('kta_cp', FD_BYTE, 0, signed=True),
+        field_desc('kv_cp',  FD_BYTE, 0, signed=True),
+        field_desc('kta_cp', FD_BYTE, 1, signed=True),
     ),
     0x243C : (
-        field_desc('ksta',   FD_BYTE, 1, signed=True),
-        field_desc('tgc',    FD_BYTE, 0),
+        field_desc('ksta',   FD_BYTE, 0, signed=True),
+        field_desc('tgc',    FD_BYTE, 1),
     ),
     0x243D : (
-        field_desc('ksto_2', FD_BYTE, 1, signed=True),
-        field_desc('ksto_1', FD_BYTE, 0, signed=True),
+        field_desc('ksto_2', FD_BYTE, 0, signed=True),
+        field_desc('ksto_1', FD_BYTE, 1, signed=True),
     ),
     0x243E : (
-        field_desc('ksto_4', FD_BYTE, 1, signed=True),
-        field_desc('ksto_3', FD_BYTE, 0, signed=True),
+        field_desc('ksto_4', FD_BYTE, 0, signed=True),
+        field_desc('ksto_3', FD_BYTE, 1, signed=True),
     ),
     0x243F : (
         field_desc('step',       2, 12),
@@ -170,12 +176,58 @@ class CameraInterface:
 
 class ReadOnlyError(Exception): pass
 
+class EepromImage:
+    # Snapshot of the whole calibration EEPROM, read in one burst. It has the
+    # same read methods as CameraInterface, so RegisterMap and the calibration
+    # code can parse it from memory instead of over I2C.
+    def __init__(self, iface):
+        self.data = bytearray(EEPROM_SIZE * REG_SIZE)
+        iface.read_into(EEPROM_ADDRESS, self.data)
+
+    def _offset(self, mem_addr, size):
+        offset = (mem_addr - EEPROM_ADDRESS) * REG_SIZE
+        if offset < 0 or offset + size > len(self.data):
+            raise ValueError(f"address 0x{mem_addr:04X} is outside the EEPROM")
+        return offset
+
+    def read(self, mem_addr):
+        offset = self._offset(mem_addr, REG_SIZE)
+        return bytes(self.data[offset:offset+REG_SIZE])
+    def read_into(self, mem_addr, buf):
+        offset = self._offset(mem_addr, len(buf))
+        buf[:] = memoryview(self.data)[offset:offset+len(buf)]
+    def write(self, mem_addr, buf):
+        raise ReadOnlyError("can't write to the EEPROM snapshot")
+
+    def checksum(self):
+        # identifies the device, to key cached calibration tables
+        return crc32(self.data) & 0xFFFFFFFF
+
+class Register:
+    # A copy of one register word. Its fields are read and set in memory,
+    # and it is written back with RegisterMap.write_register, so a register
+    # which must not be cached costs one read and one write.
+    def __init__(self, address, buf, proto):
+        self.address = address
+        self.buf = buf
+        self._struct = Struct(buf, proto)
+
+    def __getitem__(self, name):
+        return self._struct[name]
+    def __setitem__(self, name, value):
+        self._struct[name] = value
+
 class RegisterMap:
-    def __init__(self, iface, register_map, readonly=False):
+    def __init__(self, iface, register_map, readonly=False, cached=()):
         # register_map should be a dict of { I2C address : FieldDesc(s) }
+        # cached lists the addresses which may be served from a shadow copy
         self.iface = iface
         self.readonly = readonly
         self._fields = self._build_lookup(register_map)
+        self._cacheable = frozenset(cached)
+        self._shadow = {}
+        self.hits = {}
+        self.misses = {}
 
     @staticmethod
     def _build_lookup(register_map):
@@ -199,21 +251,64 @@ class RegisterMap:
     def __contains__(self, name):
         return name in self._fields
 
+    def _read_reg(self, address):
+        # return the register contents, from the shadow copy if allowed
+        buf = self._shadow.get(address)
+        if buf is not None:
+            self.hits[address] = self.hits.get(address, 0) + 1
+            return buf
+
+        self.misses[address] = self.misses.get(address, 0) + 1
+        buf = bytearray(REG_SIZE)
+        self.iface.read_into(address, buf)
+        if address in self._cacheable:
+            self._shadow[address] = buf
+        return buf
+
+    def invalidate(self, address=None):
+        # drop one shadow register, or all of them
+        if address is None:
+            self._shadow.clear()
+        else:
+            self._shadow.pop(address, None)
+
+    def read_fields(self, *names):
+        # read several fields, with one transaction per distinct register
+        bufs = {}
+        values = []
+        for name in names:
+            address, proto = self._fields[name]
+            buf = bufs.get(address)
+            if buf is None:
+                buf = bufs[address] = self._read_reg(address)
+            values.append(proto.get(buf, name))
+        return tuple(values)
+
+    def read_register(self, name):
+        # the whole register holding a field, as a Register to write back;
+        # it is a copy, so a failed write leaves the shadow as is
+        address, proto = self._fields[name]
+        return Register(address, bytearray(self._read_reg(address)), proto)
+
+    def write_register(self, register):
+        if self.readonly:
+            raise ReadOnlyError(f"can't write to 0x{register.address:04X}: not permitted")
+
+        self.iface.write(register.address, register.buf)
+        if register.address in self._cacheable:
+            self._shadow[register.address] = register.buf
+
     def __getitem__(self, name):
         address, proto = self._fields[name]
 
-        buf = self.iface.read(address)
-        struct = Struct(buf, proto)
-        return struct[name]
+        buf = self._read_reg(address)
+        return proto.get(buf, name)
 
     def __setitem__(self, name, value):
         if self.readonly:
             raise ReadOnlyError(f"can't write to '{name}': not permitted")
 
-        address, proto = self._fields[name]
-
-        buf = bytearray(REG_SIZE)
-        self.iface.read_into(address, buf)
-        struct = Struct(buf, proto)
-        struct[name] = value
-        self.iface.write(address, buf)
+        # a cached register needs no read before the modify-write
+        register = self.read_register(name)
+        register[name] = value
+        self.write_register(register)
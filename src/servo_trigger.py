@@ -5,7 +5,7 @@
 
 This script defines a class `ServoDriver` for controlling servo motors using MicroPython on a Pyboard. The class allows setting the position of the servo motor using PWM signals.
 
-The `ServoDriver` class initializes the servo driver with the specified pin, timer, and timer channel. It provides a method `set_pos` to set the position of the servo motor by specifying the angle.
+The `ServoDriver` class initializes the servo driver with the specified pin, timer, and timer channel. It provides a method `set_pos` to set the position of the servo motor by specifying the angle, and generator methods `fire` and `retract` which make a trigger stroke across several scheduler runs instead of sleeping.
 
 The script also includes a test code block to demonstrate the usage of the `ServoDriver` class.
 
@@ -57,6 +57,37 @@ class ServoDriver:
         # Set the pulse width of the timer channel
         self.timer_channel.pulse_width(PWM_angle)
 
+    def move(self, angle, travel_ms, done=None):
+        """!
+        Moves the servo and waits for it to get there without blocking.
+        Use it from a cotask task as `yield from servo.move(...)`.
+
+        Args:
+            angle (int): The desired angle of the servo motor.
+            travel_ms (int): Time allowed for the servo to reach the angle.
+            done (task_share.Share, optional): Set to 1 once the move is complete.
+        """
+        if done is not None:
+            done.put(0)
+        self.set_pos(angle)
+        start = time.ticks_ms()
+        while time.ticks_diff(time.ticks_ms(), start) < travel_ms:
+            yield
+        if done is not None:
+            done.put(1)
+
+    def fire(self, angle=250, travel_ms=500, done=None):
+        """!
+        Pushes the trigger forward without blocking; see `move`.
+        """
+        yield from self.move(angle, travel_ms, done)
+
+    def retract(self, angle=0, travel_ms=500, done=None):
+        """!
+        Pulls the trigger back without blocking; see `move`.
+        """
+        yield from self.move(angle, travel_ms, done)
+
 if __name__ == "__main__":  
     # Test code to demonstrate usage of the ServoDriver class
     servo1 = ServoDriver('PB6', 4, 1)
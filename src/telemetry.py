@@ -0,0 +1,168 @@
+"""!
+@file telemetry.py
+
+@brief Fixed-size recorder for control loop samples.
+
+@details
+The recorder keeps the newest samples of a control loop in preallocated
+ring buffers, so recording a sample does not allocate and cannot start a
+garbage collection in the middle of the loop. Once the buffers are full the
+oldest samples are overwritten. After a run the samples are dumped in bulk,
+oldest first, as comma separated lines to the REPL or to a file.
+
+Each sample holds the time, the measured position, the error, the actuation
+signal and the loop jitter, which is how far the time since the previous
+sample was from the nominal loop period.
+
+@author Conor Schott, Fermin Moreno, Berent Baysal
+"""
+
+import utime
+from array import array
+
+## Largest jitter which can be stored, in microseconds
+JITTER_LIMIT = const(32767)
+
+
+class Telemetry:
+    """!
+    Ring buffers of control loop samples.
+    """
+
+    def __init__(self, size=1000, period_us=10000):
+        """!
+        Allocate the buffers.
+        @param size: Number of samples kept.
+        @param period_us: Nominal loop period in microseconds, which the
+               jitter is measured against.
+        """
+        self.size = size
+        self.period_us = period_us
+        ## Sample times from @c utime.ticks_us()
+        self.t_us = array('l', (0 for _ in range(size)))
+        ## Measured positions in encoder counts
+        self.position = array('l', (0 for _ in range(size)))
+        ## Errors in encoder counts
+        self.error = array('l', (0 for _ in range(size)))
+        ## Actuation signals, in whole percent duty cycle
+        self.output = array('h', (0 for _ in range(size)))
+        ## Time since the previous sample less the period, in microseconds
+        self.jitter = array('h', (0 for _ in range(size)))
+        ## Index the next sample is written to
+        self.head = 0
+        ## Number of samples held, at most @c size
+        self.count = 0
+        ## Number of samples overwritten before they were dumped
+        self.dropped = 0
+        self._last_us = None
+
+    def clear(self):
+        """!
+        Forget all samples.
+        """
+        self.head = 0
+        self.count = 0
+        self.dropped = 0
+        self._last_us = None
+
+    def __len__(self):
+        return self.count
+
+    def record(self, t_us, position, error, output):
+        """!
+        Add a sample, overwriting the oldest one if the buffers are full.
+        @details Only integer operations are used, so this does not
+                 allocate and may be called from an interrupt handler.
+        @param t_us: Time of the sample from @c utime.ticks_us().
+        @param position: Measured position in encoder counts.
+        @param error: Error in encoder counts.
+        @param output: Actuation signal in percent duty cycle.
+        """
+        head = self.head
+        if self._last_us is None:
+            jitter = 0
+        else:
+            jitter = utime.ticks_diff(t_us, self._last_us) - self.period_us
+            if jitter > JITTER_LIMIT:
+                jitter = JITTER_LIMIT
+            elif jitter < -JITTER_LIMIT:
+                jitter = -JITTER_LIMIT
+        self._last_us = t_us
+        self.t_us[head] = t_us
+        self.position[head] = position
+        self.error[head] = int(error)
+        self.output[head] = int(output)
+        self.jitter[head] = jitter
+        head += 1
+        if head >= self.size:
+            head = 0
+        self.head = head
+        if self.count < self.size:
+            self.count += 1
+        else:
+            self.dropped += 1
+
+    def samples(self):
+        """!
+        Iterate over the samples, oldest first.
+        @return: Tuples of (time in ms since the first sample, position,
+                 error, output, jitter in microseconds).
+        """
+        first = (self.head - self.count) % self.size
+        start = self.t_us[first]
+        for n in range(self.count):
+            idx = (first + n) % self.size
+            yield (utime.ticks_diff(self.t_us[idx], start) / 1000, self.position[idx],
+                   self.error[idx], self.output[idx], self.jitter[idx])
+
+    def dump(self, stream=None):
+        """!
+        Write the samples as comma separated lines, oldest first.
+        @param stream: Object with a @c write() method, such as an open file;
+               by default the samples are printed.
+        """
+        header = 'time_ms,position,error,output,jitter_us'
+        if stream is None:
+            print(header)
+        else:
+            stream.write(header + '\n')
+        for sample in self.samples():
+            line = '{:.3f},{},{},{},{}'.format(*sample)
+            if stream is None:
+                print(line)
+            else:
+                stream.write(line + '\n')
+        if self.dropped:
+            notice = 'Telemetry: {} older samples were overwritten'.format(self.dropped)
+            if stream is None:
+                print(notice)
+            else:
+                stream.write(notice + '\n')
+
+    def save(self, path):
+        """!
+        Write the samples to a file, as in @c dump().
+        @param path: Path of the file to write.
+        """
+        with open(path, 'w') as f:
+            self.dump(f)
+
+    def jitter_stats(self):
+        """!
+        Summarise the loop jitter.
+        @return: Tuple of (smallest, largest, mean) jitter in microseconds, or
+                 None if there are fewer than two samples.
+        """
+        if self.count < 2:
+            return None
+        first = (self.head - self.count) % self.size
+        low = high = self.jitter[(first + 1) % self.size]
+        total = 0
+        for n in range(1, self.count):
+            value = self.jitter[(first + n) % self.size]
+            if value < low:
+                low = value
+            if value > high:
+                high = value
+            total += value
+        return low, high, total / (self.count - 1)
@@ -0,0 +1,97 @@
+"""!
+@file tracker.py
+
+@brief Alpha-beta tracker for the target's column in the camera image.
+
+@details
+The camera gives a new hotspot column every subpage. This module smooths
+those measurements and estimates how fast the target is moving across the
+image, so the turret can be aimed at where the target will be when the shot
+is fired rather than where it was seen. Each update and prediction is a
+handful of arithmetic operations.
+
+@author Conor Schott, Fermin Moreno, Berent Baysal
+"""
+
+import utime
+
+
+class TargetTracker:
+    """!
+    Constant-velocity alpha-beta filter over the target column.
+    """
+
+    def __init__(self, alpha=0.5, beta=0.1, max_speed=0.02):
+        """!
+        Set up a tracker with no target.
+        @param alpha: Weight given to a new measurement of the column.
+        @param beta: Weight given to a new measurement when correcting the
+               velocity.
+        @param max_speed: Largest believable speed in columns per
+               millisecond; faster estimates are clipped.
+        """
+        self.alpha = alpha
+        self.beta = beta
+        self.max_speed = max_speed
+        ## Estimated column of the target at time @c t_ms
+        self.col = None
+        ## Estimated speed of the target in columns per millisecond
+        self.speed = 0.0
+        ## Time of the last update, from @c utime.ticks_ms()
+        self.t_ms = None
+
+    def reset(self):
+        """!
+        Forget the target.
+        """
+        self.col = None
+        self.speed = 0.0
+        self.t_ms = None
+
+    def update(self, col, t_ms=None):
+        """!
+        Add a measurement of the target column.
+        @param col: Measured column, possibly fractional.
+        @param t_ms: Time of the measurement from @c utime.ticks_ms(),
+               by default now.
+        @return: The new estimate of the column.
+        """
+        if t_ms is None:
+            t_ms = utime.ticks_ms()
+        if self.col is None:
+            self.col = col
+            self.t_ms = t_ms
+            return col
+
+        dt = utime.ticks_diff(t_ms, self.t_ms)
+        predicted = self.col + self.speed * dt
+        residual = col - predicted
+        self.col = predicted + self.alpha * residual
+        if dt > 0:
+            speed = self.speed + self.beta * residual / dt
+            if speed > self.max_speed:
+                speed = self.max_speed
+            elif speed < -self.max_speed:
+                speed = -self.max_speed
+            self.speed = speed
+        self.t_ms = t_ms
+        return self.col
+
+    def predict(self, t_ms):
+        """!
+        Predict the target column at a given time.
+        @param t_ms: Time from @c utime.ticks_ms().
+        @return: Predicted column, or None if there is no target yet.
+        """
+        if self.col is None:
+            return None
+        return self.col + self.speed * utime.ticks_diff(t_ms, self.t_ms)
+
+    def predict_in(self, lead_ms):
+        """!
+        Predict the target column a given time from now.
+        @param lead_ms: Time ahead in milliseconds, e.g. the expected time
+               for the turret to settle and fire.
+        @return: Predicted column, or None if there is no target yet.
+        """
+        return self.predict(utime.ticks_add(utime.ticks_ms(), lead_ms))
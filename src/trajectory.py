@@ -0,0 +1,179 @@
+"""!
+@file trajectory.py
+
+@brief Velocity, acceleration and jerk limited motion profiles.
+
+@details
+Handing the PID a step setpoint saturates the motor, winds up the integrator
+and overshoots. This module turns a target encoder position into a smooth
+reference instead: the reference position, velocity and acceleration are
+stepped forward in time so that the speed never exceeds the velocity limit,
+the acceleration never exceeds its limit, and the acceleration changes no
+faster than the jerk limit. Near the target the reference brakes along the
+fastest curve the limits allow, so it arrives with no overshoot.
+
+The profile is generated as it is sampled, from its current state, so the
+target can be changed at any time, e.g. when the camera sees the target
+move, and the reference turns towards the new one without a jump. Without a
+jerk limit the profile is trapezoidal; with one it is an S-curve.
+
+The reference velocity and acceleration are handed to the controller as
+feed-forward, so the PID only has to correct the tracking error.
+
+@author Conor Schott, Fermin Moreno, Berent Baysal
+"""
+
+import utime
+from array import array
+
+
+class MotionProfile:
+    """!
+    Online trapezoidal or S-curve trajectory to a target position.
+
+    @details The profile is stepped at a fixed period. A trapezoidal
+    reference is generated first: each step its velocity moves by at most
+    one step of acceleration towards the fastest speed from which it can
+    still stop at the target in whole steps. With a jerk limit, the
+    trapezoid's velocity is then averaged over the last @c max_acc /
+    @c max_jerk seconds. This spreads every change of acceleration over that
+    time, so going from rest to full acceleration is no steeper than the jerk
+    limit, and keeps the distance travelled the same.
+    """
+
+    def __init__(self, max_vel=15000, max_acc=60000, max_jerk=0, period_us=2000,
+                 position=0):
+        """!
+        Set up a profile at rest.
+        @param max_vel: Velocity limit in counts per second.
+        @param max_acc: Acceleration limit in counts per second squared.
+        @param max_jerk: Jerk limit in counts per second cubed; 0 for no limit,
+               giving a trapezoidal profile.
+        @param period_us: Step period in microseconds, normally the control
+               loop period.
+        @param position: Starting position in encoder counts.
+        """
+        self.max_vel = max_vel
+        self.max_acc = max_acc
+        self.max_jerk = max_jerk
+        self.period_us = period_us
+        self._dt = period_us / 1000000
+        taps = 1
+        if max_jerk:
+            taps = int(max_acc / max_jerk / self._dt + 0.5)
+            if taps < 1:
+                taps = 1
+        ## Recent trapezoid velocities, averaged to limit the jerk
+        self._window = array('f', (0 for _ in range(taps)))
+        self.reset(position)
+
+    def reset(self, position=0):
+        """!
+        Put the profile at rest at a position, with no move in progress.
+        @param position: Position in encoder counts.
+        """
+        ## Reference position in encoder counts
+        self.position = float(position)
+        ## Reference velocity in counts per second
+        self.velocity = 0.0
+        ## Reference acceleration in counts per second squared
+        self.acceleration = 0.0
+        ## Position the profile is moving to
+        self.target = position
+        self._trap_pos = float(position)
+        self._trap_vel = 0.0
+        for idx in range(len(self._window)):
+            self._window[idx] = 0.0
+        self._slot = 0
+        self._sum = 0.0
+        self._last_us = None
+        self._carry_us = 0
+
+    def set_target(self, target):
+        """!
+        Move to a new target, starting from the current reference state.
+        @param target: Target position in encoder counts.
+        """
+        self.target = target
+
+    @property
+    def done(self):
+        """!
+        Whether the reference has reached the target and stopped.
+        """
+        return self.position == self.target and self.velocity == 0
+
+    def step(self):
+        """!
+        Advance the reference by one period.
+        """
+        if self.done:
+            return
+        dt = self._dt
+        target = self.target
+
+        # trapezoid: fastest speed which can still stop in whole steps
+        remaining = target - self._trap_pos
+        direction = 1 if remaining > 0 else -1
+        remaining *= direction
+        acc_step = self.max_acc * dt
+        if acc_step:
+            wanted = acc_step * ((0.25 + 2 * remaining / (acc_step * dt)) ** 0.5 - 0.5)
+        else:
+            wanted = 0.0
+        if wanted > self.max_vel:
+            wanted = self.max_vel
+        wanted *= direction
+        velocity = self._trap_vel
+        if wanted > velocity + acc_step:
+            velocity += acc_step
+        elif wanted < velocity - acc_step:
+            velocity -= acc_step
+        else:
+            velocity = wanted
+        position = self._trap_pos + velocity * dt
+        if abs(target - position) < 0.5 and abs(velocity) <= acc_step:
+            position = float(target)
+            velocity = 0.0
+        self._trap_pos = position
+        self._trap_vel = velocity
+
+        # moving average of the trapezoid velocity
+        window = self._window
+        slot = self._slot
+        leaving = window[slot]
+        window[slot] = velocity
+        slot += 1
+        self._slot = slot if slot < len(window) else 0
+        self._sum += velocity - leaving
+        taps = len(window)
+        averaged = self._sum / taps
+        self.acceleration = (velocity - leaving) / (taps * dt)
+        self.position += averaged * dt
+        self.velocity = averaged
+        if position == target and velocity == 0:
+            for value in window:
+                if value:
+                    break
+            else:
+                # the window has emptied, so the move is over
+                self.position = float(target)
+                self.velocity = 0.0
+                self.acceleration = 0.0
+                self._sum = 0.0
+
+    def sample(self, now_us=None):
+        """!
+        Advance the reference to a time and return it.
+        @param now_us: Time from @c utime.ticks_us(), by default now.
+        @return: Reference position in whole encoder counts.
+        """
+        if now_us is None:
+            now_us = utime.ticks_us()
+        if self._last_us is not None:
+            self._carry_us += utime.ticks_diff(now_us, self._last_us)
+            while self._carry_us >= self.period_us:
+                self._carry_us -= self.period_us
+                self.step()
+        self._last_us = now_us
+        return int(self.position)
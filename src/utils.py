@@ -11,7 +11,7 @@ The `twos_complement` function calculates the two's complement of a value given
 
 The `field_desc` function creates a field description namedtuple based on the name, number of bits, position, and signedness of a field.
 
-The `StructProto` class defines the layout of structured data based on field descriptions.
+The `StructProto` class defines the layout of structured data based on field descriptions, and compiles each field into a (shift, mask, sign bit) extractor which decodes it straight from a buffer of big-endian words.
 
 The `Struct` class provides methods for accessing and modifying structured data using a buffer and a predefined layout.
 
@@ -70,7 +70,7 @@ def twos_complement(bits, value):
 FD_BYTE = object()
 FD_WORD = object()
 
-FieldDesc = namedtuple('FieldDesc', ('name', 'layout', 'signed_bits'))
+FieldDesc = namedtuple('FieldDesc', ('name', 'layout', 'signed_bits', 'extract'))
 def field_desc(name, bits, pos=0, signed=False):
     """!
     Create a field description namedtuple.
@@ -82,18 +82,22 @@ def field_desc(name, bits, pos=0, signed=False):
         signed (bool, optional): Whether the field is signed. Defaults to False.
 
     Returns:
-        FieldDesc: Namedtuple describing the field.
+        FieldDesc: Namedtuple describing the field. Its `extract` member is a
+        (shift, mask, sign bit) tuple for decoding the field from a
+        big-endian 16-bit word; the sign bit is 0 for unsigned fields.
     """
     if bits is FD_WORD:
         layout = 0 | (INT16 if signed else UINT16)
-        return FieldDesc(name, layout, None)
+        return FieldDesc(name, layout, None, (0, 0xFFFF, 0x8000 if signed else 0))
     
     if bits is FD_BYTE:
+        # byte 0 is the high byte of a big-endian word
         layout = pos | (INT8 if signed else UINT8)
-        return FieldDesc(name, layout, None)
+        return FieldDesc(name, layout, None, (8 * (1 - pos), 0xFF, 0x80 if signed else 0))
 
     layout = 0 | BFUINT16 | pos << BF_POS | bits << BF_LEN
-    return FieldDesc(name, layout, bits if signed else None)
+    extract = (pos, (1 << bits) - 1, 1 << (bits - 1) if signed else 0)
+    return FieldDesc(name, layout, bits if signed else None, extract)
 
 
 class StructProto:
@@ -106,11 +110,53 @@ class StructProto:
         """
         self.layout = {}
         self.signed = {}
+        self.extract = {}
         for fld in fields:
             self.layout[fld.name] = fld.layout
+            self.extract[fld.name] = fld.extract
             if fld.signed_bits is not None:
                 self.signed[fld.name] = fld.signed_bits
 
+    def get(self, buf, name, offset=0):
+        """!
+        Decode one field straight from a buffer, without building a Struct.
+
+        Args:
+            buf (bytearray): Buffer holding big-endian 16-bit words.
+            name (str): Name of the field.
+            offset (int, optional): Byte offset of the word in the buffer. Defaults to 0.
+
+        Returns:
+            int: Value of the field, the same as Struct would give.
+        """
+        shift, mask, sign = self.extract[name]
+        value = ((buf[offset] << 8 | buf[offset + 1]) >> shift) & mask
+        if value & sign:
+            value -= sign << 1
+        return value
+
+    def decode(self, buf, name, out, offset=0):
+        """!
+        Decode one field from each of a run of words, into an array.
+
+        Args:
+            buf (bytearray): Buffer holding big-endian 16-bit words.
+            name (str): Name of the field.
+            out (array): Array to fill; one word is decoded per element.
+            offset (int, optional): Byte offset of the first word. Defaults to 0.
+
+        Returns:
+            array: The filled array, `out`.
+        """
+        shift, mask, sign = self.extract[name]
+        for idx in range(len(out)):
+            pos = offset + 2 * idx
+            value = ((buf[pos] << 8 | buf[pos + 1]) >> shift) & mask
+            if value & sign:
+                value -= sign << 1
+            out[idx] = value
+        return out
+
 class Struct:
     def __init__(self, buf, proto):
         """!